@@ -0,0 +1,172 @@
+"""In-process stand-in for SSM Parameter Store used by the benchmarks
+
+Serves the GetParameters, GetParametersByPath, and DescribeParameters
+actions of the SSM JSON protocol from memory, with configurable latency and
+throttling. Request signatures are not verified.
+
+"""
+import bisect
+import dataclasses
+import functools
+import json
+import random
+import threading
+import time
+import typing
+from http import server
+
+PAGE_SIZE = 10
+
+
+@dataclasses.dataclass
+class Stats:
+    requests: typing.Dict[str, int] = dataclasses.field(default_factory=dict)
+    throttled: int = 0
+
+
+class FakeSSM:
+    """Serves the parameters from a background thread until stopped.
+    `latency` is the number of seconds each response is delayed by and
+    `throttle_rate` the fraction of requests rejected as throttled.
+
+    """
+    def __init__(self,
+                 parameters: typing.Dict[str, str],
+                 latency: float = 0.0,
+                 throttle_rate: float = 0.0,
+                 seed: int = 0):
+        self.latency = latency
+        self.parameters = dict(sorted(parameters.items()))
+        self._names = list(self.parameters)
+        self.stats = Stats()
+        self.throttle_rate = throttle_rate
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._server = server.ThreadingHTTPServer(
+            ('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def __enter__(self) -> 'FakeSSM':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> typing.NoReturn:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def reset_stats(self) -> typing.NoReturn:
+        with self._lock:
+            self.stats = Stats()
+
+    def dispatch(self, action: str, request: dict) \
+            -> typing.Tuple[int, dict]:
+        """Return the status code and body of the response to the action"""
+        with self._lock:
+            self.stats.requests[action] = \
+                self.stats.requests.get(action, 0) + 1
+            if self._random.random() < self.throttle_rate:
+                self.stats.throttled += 1
+                return 400, {'__type': 'ThrottlingException',
+                             'message': 'Rate exceeded'}
+        if action == 'GetParameters':
+            names = request.get('Names', [])
+            return 200, {
+                'Parameters': [self._parameter(name) for name in names
+                               if name in self.parameters],
+                'InvalidParameters': [name for name in names
+                                      if name not in self.parameters]}
+        elif action == 'GetParametersByPath':
+            names = self._under(
+                request['Path'], request.get('Recursive', False))
+            page, token = self._page(names, request.get('NextToken'))
+            return 200, self._with_token(
+                {'Parameters': [self._parameter(name) for name in page]},
+                token)
+        elif action == 'DescribeParameters':
+            names = self._filter(request.get('ParameterFilters', []))
+            page, token = self._page(names, request.get('NextToken'))
+            return 200, self._with_token(
+                {'Parameters': [{'Name': name, 'Type': 'String',
+                                 'Version': 1} for name in page]}, token)
+        return 400, {'__type': 'InvalidAction', 'message': action}
+
+    def _filter(self, filters: typing.List[dict]) -> typing.List[str]:
+        names = list(self.parameters)
+        for value in filters:
+            if value['Key'] == 'Name':
+                names = [name for name in names if name in value['Values']]
+            elif value['Key'] == 'Path':
+                under = set(self._under(value['Values'][0], True))
+                names = [name for name in names if name in under]
+        return names
+
+    def _handler(self) -> typing.Type[server.BaseHTTPRequestHandler]:
+        fake = self
+
+        class Handler(server.BaseHTTPRequestHandler):
+            disable_nagle_algorithm = True
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                action = self.headers['X-Amz-Target'].rpartition('.')[2]
+                if fake.latency:
+                    time.sleep(fake.latency)
+                status, response = fake.dispatch(
+                    action, json.loads(body or b'{}'))
+                payload = json.dumps(response).encode('utf-8')
+                self.send_response(status)
+                self.send_header(
+                    'Content-Type', 'application/x-amz-json-1.1')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    @staticmethod
+    def _page(names: typing.List[str], token: typing.Optional[str]) \
+            -> typing.Tuple[typing.List[str], typing.Optional[str]]:
+        offset = int(token or 0)
+        token = str(offset + PAGE_SIZE) \
+            if offset + PAGE_SIZE < len(names) else None
+        return names[offset:offset + PAGE_SIZE], token
+
+    def _parameter(self, name: str) -> dict:
+        return {'Name': name,
+                'Type': 'String',
+                'Value': self.parameters[name],
+                'Version': 1,
+                'LastModifiedDate': 0,
+                'DataType': 'text'}
+
+    @functools.lru_cache(maxsize=1024)
+    def _under(self, path: str, recursive: bool) -> typing.List[str]:
+        """Return the names of the parameters under the path"""
+        path = path.rstrip('/') + '/'
+        names = []
+        for offset in range(
+                bisect.bisect_left(self._names, path), len(self._names)):
+            name = self._names[offset]
+            if not name.startswith(path):
+                break
+            elif recursive or '/' not in name[len(path):]:
+                names.append(name)
+        return names
+
+    @staticmethod
+    def _with_token(response: dict, token: typing.Optional[str]) -> dict:
+        if token:
+            response['NextToken'] = token
+        return response
@@ -0,0 +1,78 @@
+"""Measure the time it takes to start ssm-ps-template
+
+Each measurement runs in a new interpreter so the imports are not cached.
+Results are written to stdout as JSON.
+
+    python benchmarks/import_time.py --runs 20
+
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+import typing
+
+COMMANDS = {
+    'import': 'import ssm_ps_template.__main__',
+    'version': 'import sys\n'
+               'from ssm_ps_template import __main__\n'
+               'sys.argv = ["ssm-ps-template", "--version"]\n'
+               '__main__.main()',
+    'baseline': 'pass'
+}
+
+# Packages that should only be imported when they are used
+PACKAGES = ['boto3', 'botocore', 'cryptography', 'jinja2', 'toml', 'yaml']
+
+
+def measure(code: str, runs: int) -> typing.Dict[str, float]:
+    """Return the wall clock timings in milliseconds for running the code
+    in a new interpreter
+
+    """
+    timings = []
+    for _offset in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True,
+                       stdout=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {'min': round(min(timings), 2),
+            'median': round(statistics.median(timings), 2),
+            'max': round(max(timings), 2)}
+
+
+def imported_packages(code: str) -> typing.Dict[str, float]:
+    """Return the cumulative import time in milliseconds of the expensive
+    packages imported by the code, as reported by ``-X importtime``
+
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code], check=True,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _self, cumulative, name = line[12:].split('|')
+        if name.strip() in PACKAGES:
+            packages[name.strip()] = round(int(cumulative) / 1000, 2)
+    return packages
+
+
+def main() -> typing.NoReturn:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+    json.dump({'python': sys.version.split()[0],
+               'runs': args.runs,
+               'timings': {name: measure(code, args.runs)
+                           for name, code in COMMANDS.items()},
+               'packages': imported_packages(COMMANDS['import'])},
+              sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""Benchmark discovery, fetching, rendering, and writing of synthetic
+configurations against an in-process SSM Parameter Store stand-in
+
+Results are written as JSON so they can be compared across releases.
+
+    python benchmarks/suite.py --scenario small --scenario large --repeat 3
+
+"""
+import argparse
+import contextlib
+import dataclasses
+import json
+import os
+import pathlib
+import statistics
+import sys
+import tempfile
+import time
+import typing
+from importlib import metadata
+
+import fake_ssm
+
+from ssm_ps_template import config, environment, plan, render, ssm, writer
+
+ROOT = '/bench'
+
+
+@dataclasses.dataclass
+class Scenario:
+    templates: int
+    parameters: int
+    depth: int
+    branching: int = 4
+
+
+SCENARIOS = {
+    'small': Scenario(templates=1, parameters=10, depth=2),
+    'medium': Scenario(templates=50, parameters=1000, depth=4),
+    'large': Scenario(templates=500, parameters=10000, depth=6),
+    'deep': Scenario(templates=10, parameters=1000, depth=16, branching=2)
+}
+
+
+def parameter_name(scenario: Scenario, offset: int) -> str:
+    """Spread the parameters across a tree that is `depth` levels deep"""
+    nodes = [f'n{(offset // scenario.branching ** level) % scenario.branching}'
+             for level in range(scenario.depth)]
+    return '/'.join([ROOT] + nodes + [f'p{offset}'])
+
+
+def generate(scenario: Scenario, directory: pathlib.Path) \
+        -> typing.Tuple[typing.Dict[str, str], typing.List[config.Template]]:
+    """Write the templates for the scenario, returning the parameters and
+    the template configuration. Each template gets its share of the
+    parameters and the parameters under a path two levels deep.
+
+    """
+    parameters = {parameter_name(scenario, offset): f'value-{offset}'
+                  for offset in range(scenario.parameters)}
+    names = list(parameters)
+    templates = []
+    for offset in range(scenario.templates):
+        path = '/'.join(parameter_name(scenario, offset).split('/')[:4])
+        lines = [f'# Template {offset}',
+                 f'{{% set tree = get_parameters_by_path({path + "/"!r}) %}}']
+        lines += [f'p{index}: {{{{ get_parameter({name!r}) }}}}'
+                  for index, name in enumerate(names)
+                  if index % scenario.templates == offset]
+        lines += ['{% for key, value in tree | dictsort %}',
+                  '{{ key }}={{ value }}',
+                  '{% endfor %}']
+        source = directory / f'template-{offset}.j2'
+        source.write_text('\n'.join(lines) + '\n')
+        templates.append(config.Template(
+            source=source,
+            destination=directory / 'output' / f'template-{offset}.conf',
+            prefix=None, user=None, group=None, mode=None))
+    (directory / 'output').mkdir()
+    return parameters, templates
+
+
+@contextlib.contextmanager
+def timer(timings: typing.Dict[str, float], phase: str):
+    start = time.perf_counter()
+    yield
+    timings[phase] = time.perf_counter() - start
+
+
+def run(scenario: Scenario, args: argparse.Namespace) -> dict:
+    """Run each phase once for the scenario, returning the timings and the
+    requests made to the stand-in
+
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        parameters, templates = generate(scenario, pathlib.Path(temp_dir))
+        with fake_ssm.FakeSSM(parameters, args.latency / 1000,
+                              args.throttle_rate) as fake:
+            timings = {}
+            environment.configure()
+            with timer(timings, 'discovery'):
+                render_plan = plan.build(templates, None, False)
+
+            store = ssm.ParameterStore(
+                region='us-east-1', endpoint_url=fake.url,
+                max_concurrency=args.max_concurrency,
+                max_retries=args.max_retries, transport=args.transport)
+            with timer(timings, 'fetch'):
+                values = store.fetch(
+                    render_plan.parameters, render_plan.parameters_by_path)
+
+            with timer(timings, 'render'):
+                outputs = [
+                    render.Renderer(template_plan.template.source).render(
+                        template_plan.values(values))
+                    for template_plan in render_plan.templates]
+
+            for phase in ['write', 'write_unchanged']:
+                with timer(timings, phase):
+                    for template_plan, output in zip(
+                            render_plan.templates, outputs):
+                        writer.write(template_plan.template.destination,
+                                     output)
+
+            return {
+                'timings': timings,
+                'requests': dict(sorted(fake.stats.requests.items())),
+                'throttled': fake.stats.throttled,
+                'retries': store.retries,
+                'output_bytes': sum(len(output) for output in outputs)}
+
+
+def summarize(runs: typing.List[dict]) -> dict:
+    """Combine repeated runs, reporting the minimum and median timings"""
+    result = dict(runs[-1])
+    result['timings'] = {
+        phase: {'min': round(min(run['timings'][phase] for run in runs), 6),
+                'median': round(statistics.median(
+                    run['timings'][phase] for run in runs), 6)}
+        for phase in runs[0]['timings']}
+    return result
+
+
+def parse_cli_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description=__doc__.split('\n\n')[0].replace('\n', ' '),
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        '--scenario', action='append', choices=sorted(SCENARIOS),
+        help='The scenarios to run, defaults to small and medium')
+    parser.add_argument(
+        '--templates', type=int,
+        help='Run a custom scenario with this many templates')
+    parser.add_argument(
+        '--parameters', type=int, default=100,
+        help='The number of parameters in the custom scenario')
+    parser.add_argument(
+        '--depth', type=int, default=4,
+        help='The depth of the parameter tree in the custom scenario')
+    parser.add_argument(
+        '--latency', type=float, default=0,
+        help='Milliseconds to delay each response by')
+    parser.add_argument(
+        '--throttle-rate', type=float, default=0,
+        help='The fraction of requests to throttle')
+    parser.add_argument('--max-concurrency', type=int, default=1)
+    parser.add_argument('--max-retries', type=int, default=10)
+    parser.add_argument(
+        '--transport', choices=config.TRANSPORTS, default='boto3')
+    parser.add_argument(
+        '--repeat', type=int, default=1,
+        help='The number of times to run each scenario')
+    parser.add_argument(
+        '--output', type=pathlib.Path,
+        help='Write the results to the file instead of stdout')
+    return parser.parse_args()
+
+
+def main() -> typing.NoReturn:
+    args = parse_cli_arguments()
+    # The stand-in does not check credentials, but botocore needs them
+    for name, value in [('AWS_ACCESS_KEY_ID', 'benchmark'),
+                        ('AWS_SECRET_ACCESS_KEY', 'benchmark')]:
+        os.environ.setdefault(name, value)
+
+    scenarios = {name: SCENARIOS[name]
+                 for name in args.scenario or ['small', 'medium']}
+    if args.templates:
+        scenarios = {'custom': Scenario(
+            args.templates, args.parameters, args.depth)}
+
+    results = []
+    for name, scenario in scenarios.items():
+        sys.stderr.write(f'Running {name} {scenario}\n')
+        result = summarize([run(scenario, args) for _ in range(args.repeat)])
+        results.append({'scenario': name, **dataclasses.asdict(scenario),
+                        **result})
+
+    document = {
+        'version': metadata.version('ssm-ps-template'),
+        'python': sys.version.split()[0],
+        'settings': {'latency_ms': args.latency,
+                     'throttle_rate': args.throttle_rate,
+                     'max_concurrency': args.max_concurrency,
+                     'transport': args.transport,
+                     'repeat': args.repeat},
+        'results': results}
+    if args.output:
+        args.output.write_text(json.dumps(document, indent=2) + '\n')
+    else:
+        json.dump(document, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,68 @@
+from __future__ import annotations
+
 import argparse
+import dataclasses
+import functools
 import grp
+import hashlib
+import json
 import logging
 import os
+import pathlib
 import pwd
+import random
 import sys
 import time
 import typing
+from concurrent import futures
 from importlib import metadata
 
-from ssm_ps_template import config, discovery, render, ssm
+from ssm_ps_template import config, lazy, metrics, reload, writer
+
+# Jinja2 and boto3 are only imported when they are needed
+cache = lazy.load('ssm_ps_template.cache')
+discovery = lazy.load('ssm_ps_template.discovery')
+environment = lazy.load('ssm_ps_template.environment')
+plan = lazy.load('ssm_ps_template.plan')
+profiling = lazy.load('ssm_ps_template.profiling')
+render = lazy.load('ssm_ps_template.render')
+snapshot = lazy.load('ssm_ps_template.snapshot')
+ssm = lazy.load('ssm_ps_template.ssm')
 
 LOGGER = logging.getLogger(__name__)
 LOGGING_FORMAT = '%(message)s'
+# Exit status when templates were rendered from the last known good values
+STALE_EXIT_CODE = 75
 
 
 def chown(path: str,
           user: typing.Union[int, str, None],
           group: typing.Union[int, str, None]) -> typing.NoReturn:
-    kwargs = {'path': path}
-    if user is not None and not str(user).isnumeric():
-        user = pwd.getpwnam(str(user)).pw_uid
-    kwargs['uid'] = int(user) if user else os.getuid()
+    os.chown(path=path, uid=uid(user), gid=gid(group))
+
+
+def gid(group: typing.Union[int, str, None]) -> int:
     if group is not None and not str(group).isnumeric():
         group = grp.getgrnam(str(group)).gr_gid
-    kwargs['gid'] = int(group) if group else os.getgid()
-    os.chown(**kwargs)
+    return int(group) if group else os.getgid()
+
+
+def uid(user: typing.Union[int, str, None]) -> int:
+    if user is not None and not str(user).isnumeric():
+        user = pwd.getpwnam(str(user)).pw_uid
+    return int(user) if user else os.getuid()
+
+
+def permissions_changed(template: config.Template) -> bool:
+    """Return True if the destination ownership or mode differ from the
+    ones configured for the template
+
+    """
+    stat = template.destination.stat()
+    if template.mode and stat.st_mode & 0o7777 != template.mode:
+        return True
+    return bool((template.user or template.group) and (
+        stat.st_uid, stat.st_gid) != (uid(template.user), gid(template.group)))
 
 
 def parse_cli_arguments(args: typing.Optional[typing.List[str]] = None) \
@@ -39,60 +77,565 @@ def parse_cli_arguments(args: typing.Optional[typing.List[str]] = None) \
     parser.add_argument(
         '--aws-region', action='store', help='AWS Region',
         default=os.environ.get('AWS_REGION'))
+    parser.add_argument(
+        '--connect-timeout', action='store', type=float,
+        help='Seconds to wait for a connection to SSM Parameter Store')
+    parser.add_argument(
+        '--durability', action='store',
+        choices=[value.value for value in writer.Durability],
+        help='How rendered files are synced to disk before and after they '
+             'replace the destination')
     parser.add_argument(
         '--endpoint-url', action='store',
         help=('Specify an endpoint URL to use when contacting '
               'SSM Parameter Store.'),
         default=os.environ.get('SSM_ENDPOINT_URL'))
+    parser.add_argument(
+        '--fetch-deadline', action='store', type=float,
+        help='Seconds to wait for all of the values to be fetched before '
+             'failing or rendering from the last known good values')
+    parser.add_argument(
+        '--interval', action='store', type=float,
+        help='Seconds between polls of SSM Parameter Store in watch mode')
+    parser.add_argument(
+        '--lazy', action='store_true',
+        help='Fetch values that could not be discovered while rendering')
+    parser.add_argument(
+        '--last-known-good', action='store', type=pathlib.Path,
+        help='Keep the values of successful runs in a snapshot file to '
+             'render from when SSM Parameter Store can not be reached')
+    parser.add_argument(
+        '--max-concurrency', action='store', type=int,
+        help='Maximum number of concurrent requests to SSM Parameter Store')
+    parser.add_argument(
+        '--metrics-file', action='store', type=pathlib.Path,
+        help='Write per-phase timings and SSM Parameter Store call metrics '
+             'to the file')
+    parser.add_argument(
+        '--metrics-format', action='store', choices=metrics.FORMATS,
+        default=metrics.JSON_LINES,
+        help='Append JSON lines to the metrics file or replace it with the '
+             'Prometheus text format')
+    parser.add_argument(
+        '--no-cache', action='store_true',
+        help='Do not use the parameter cache, if configured')
+    parser.add_argument(
+        '--parallelism', action='store', type=int,
+        help='Number of templates to render and write concurrently')
+    parser.add_argument(
+        '--plan', action='store_true',
+        help='Write the parameters and paths each template uses and the '
+             'number of calls needed to fetch them, without fetching or '
+             'rendering')
+    parser.add_argument(
+        '--plan-format', action='store', choices=['json', 'text'],
+        default='text', help='The format --plan writes to stdout')
     parser.add_argument(
         '--prefix', action='store', help='Default SSM Key Prefix',
         default=os.environ.get('PARAMS_PREFIX', '/'))
+    parser.add_argument(
+        '--profile', action='store', type=pathlib.Path,
+        help='Profile the run with cProfile, writing the statistics to the '
+             'file')
+    parser.add_argument(
+        '--profile-top', action='store', type=int, default=0,
+        help='Write the functions that took the most time in each phase of '
+             'the profiled run to stderr')
+    parser.add_argument(
+        '--rate-limit', action='store', type=float,
+        help='Maximum number of requests per second to SSM Parameter Store')
+    parser.add_argument(
+        '--read-timeout', action='store', type=float,
+        help='Seconds to wait for each response from SSM Parameter Store')
     parser.add_argument(
         '--replace-underscores', action='store_true',
         help='Replace underscores in variable names to dashes when looking '
              'for values in SSM')
+    parser.add_argument(
+        '--stream', action='store_true',
+        help='Write templates as they are rendered instead of rendering '
+             'them in memory first')
+    parser.add_argument(
+        '--transport', action='store', choices=config.TRANSPORTS,
+        help='Use boto3 or a lightweight signed HTTP client to call SSM '
+             'Parameter Store')
+    parser.add_argument(
+        '--snapshot-key-file', action='store',
+        help='Encrypt and decrypt snapshots with the key in the file, unless '
+             'SSM_PS_TEMPLATE_SNAPSHOT_KEY is set')
+    parser.add_argument(
+        '--values-from', action='store', type=pathlib.Path,
+        help='Render with the values in a snapshot written by --values-to '
+             'instead of fetching them from SSM Parameter Store')
+    parser.add_argument(
+        '--values-to', action='store', type=pathlib.Path,
+        help='Fetch the values for the templates and write them to a '
+             'snapshot instead of rendering')
     parser.add_argument('--verbose', action='store_true')
+    parser.add_argument(
+        '--watch', action='store_true',
+        help='Keep running, re-rendering templates when their inputs change')
     parser.add_argument(
         '--version', action='version',
         version=f'%(prog)s {metadata.version("ssm-ps-template")}')
     parser.add_argument('config', type=config.configuration_file, nargs=1)
-    return parser.parse_args(args)
+    parsed = parser.parse_args(args)
+    if parsed.values_from and (parsed.watch or parsed.values_to):
+        parser.error(
+            '--values-from can not be used with --watch or --values-to')
+    return parsed
+
 
+def write_durability(args: argparse.Namespace) -> writer.Durability:
+    return writer.Durability(args.durability or args.config[0].durability)
 
-def render_templates(args: argparse.Namespace) -> typing.NoReturn:
-    parameter_store = ssm.ParameterStore(
+
+def parameter_cache(args: argparse.Namespace) \
+        -> typing.Optional[cache.ParameterCache]:
+    settings = args.config[0].cache
+    if settings is None or args.no_cache:
+        return None
+    return cache.ParameterCache(
+        path=settings.path,
+        ttl=settings.ttl,
+        max_entries=settings.max_entries,
+        key=cache.load_key(settings.key_file),
+        keep_expired=settings.incremental)
+
+
+def parameter_store(args: argparse.Namespace) -> ssm.ParameterStore:
+    return ssm.ParameterStore(
         profile=args.aws_profile or args.config[0].profile,
         region=args.aws_region or args.config[0].region,
-        endpoint_url=args.endpoint_url or args.config[0].endpoint_url)
+        endpoint_url=args.endpoint_url or args.config[0].endpoint_url,
+        max_concurrency=args.max_concurrency or args.config[0].max_concurrency,
+        rate_limit=args.rate_limit or args.config[0].rate_limit,
+        max_retries=args.config[0].max_retries,
+        parameter_cache=parameter_cache(args),
+        incremental=getattr(args.config[0].cache, 'incremental', False),
+        transport=args.transport or args.config[0].transport,
+        client_config=args.config[0].client,
+        connect_timeout=args.connect_timeout or args.config[0].connect_timeout,
+        read_timeout=args.read_timeout or args.config[0].read_timeout)
 
-    for template in args.config[0].templates:
-        start_time = time.time()
-        prefix = (args.prefix or template.prefix).rstrip('/')
 
-        variable_discovery = discovery.VariableDiscovery(template.source)
-        variables = variable_discovery.discover()
+def plan_templates(args: argparse.Namespace) -> dict:
+    """Discover the variables of the templates without fetching values or
+    rendering, writing the names and paths they use and an estimate of the
+    calls to SSM Parameter Store needed to fetch them. The ``prefixes_from``
+    paths of fanned-out templates are listed to find their prefixes.
 
+    """
+    environment.configure(args.config[0].bytecode_cache)
+    templates, listed = args.config[0].templates, None
+    if plan.listings(templates):
+        store = parameter_store(args)
         try:
-            values = parameter_store.fetch_variables(
-                variables, prefix, args.replace_underscores)
+            listed = store.fetch([], plan.listings(templates))
         except ssm.SSMClientException as err:
-            LOGGER.error('Error fetching parameters: %s', err)
-            sys.exit(1)
+            LOGGER.warning('Failed to list %s, only planning the fixed '
+                           'prefixes: %s',
+                           ', '.join(plan.listings(templates)), err)
+        finally:
+            store.close()
+    estimate = plan.estimate(plan.build(
+        templates, args.prefix, args.replace_underscores, listed))
+    if args.plan_format == 'json':
+        sys.stdout.write(json.dumps(estimate, indent=2) + '\n')
+    else:
+        sys.stdout.write(plan_text(estimate))
+    return estimate
+
+
+def plan_text(estimate: dict) -> str:
+    """Return the estimate from ``plan.estimate`` as text"""
+    lines = ['Templates:']
+    for template in estimate['templates']:
+        lines.append(f'  {template["destination"]} ({template["source"]})')
+        lines += [f'    {name}' for name in sorted(
+            set(template['parameters'].values()))]
+        lines += [f'    {path} (path)' for path in sorted(
+            set(template['parameters_by_path'].values()))]
+    for title, key in [('Overlapping paths', 'overlapping_paths'),
+                       ('Parameters under paths', 'parameters_under_paths')]:
+        if estimate[key]:
+            lines.append(f'{title}:')
+            lines += [f'  {name} is fetched with {path}'
+                      for name, path in estimate[key].items()]
+    if estimate['listings']:
+        lines.append('Listed for prefixes:')
+        lines += [f'  {path}' for path in estimate['listings']]
+    if estimate['shared']:
+        lines.append('Shared inputs:')
+        lines += [f'  {name}: {", ".join(destinations)}'
+                  for name, destinations in estimate['shared'].items()]
+    calls, fetch = estimate['calls'], estimate['fetch']
+    lines += [
+        'Calls:',
+        f'  GetParameters: {calls["GetParameters"]} '
+        f'({len(fetch["parameters"])} parameters)',
+        f'  GetParametersByPath: {calls["GetParametersByPath"]}'
+        f'{" or more" if calls["GetParametersByPath"] else ""} '
+        f'({len(fetch["parameters_by_path"])} paths)']
+    return '\n'.join(lines) + '\n'
 
-        if not template.destination.parent.exists():
-            template.destination.parent.mkdir(parents=True, exist_ok=True)
 
-        renderer = render.Renderer(source=template.source)
-        template.destination.write_text(renderer.render(values))
+def export_values(args: argparse.Namespace) -> ssm.Values:
+    """Fetch the values for the templates and write them to a snapshot
+    that can be rendered from with ``--values-from``
 
-        if template.user or template.group:
-            chown(str(template.destination), template.user, template.group)
+    """
+    environment.configure(args.config[0].bytecode_cache)
+    try:
+        render_plan, values = fetch_plan(args, parameter_store(args))
+    except ssm.SSMClientException as err:
+        LOGGER.error('Error fetching parameters: %s', err)
+        sys.exit(1)
+    try:
+        dump_snapshot(args, args.values_to, render_plan, values)
+    except (OSError, snapshot.SnapshotError) as err:
+        LOGGER.error('Error writing snapshot: %s', err)
+        sys.exit(1)
+    LOGGER.info('Wrote %i parameters and %i paths to %s',
+                len(values.parameters), len(values.parameters_by_path),
+                args.values_to)
+    return values
 
-        if template.mode:
-            template.destination.chmod(template.mode)
 
-        LOGGER.info('Rendered %s in %0.2f seconds', template.destination,
-                    time.time() - start_time)
+def dump_snapshot(args: argparse.Namespace,
+                  path: pathlib.Path,
+                  render_plan: plan.Plan,
+                  values: ssm.Values) -> writer.Status:
+    """Write the values fetched for the plan to a snapshot"""
+    missing = set(render_plan.parameters) - set(values.parameters)
+    return snapshot.dump(path, values, missing,
+                         snapshot.load_key(args.snapshot_key_file))
+
+
+def fetch_plan(args: argparse.Namespace,
+               store: ssm.ParameterStore,
+               learned: typing.Optional[
+                   typing.Dict[pathlib.Path, discovery.Variables]] = None) \
+        -> typing.Tuple[plan.Plan, ssm.Values]:
+    """Plan the templates and fetch their values, listing the prefixes of
+    fanned-out templates first and adding the variables `learned` by
+    earlier renders to their plans. Raises ``ssm.DeadlineExceeded`` if the
+    fetch deadline passes first.
+
+    """
+    recorder = metrics.get()
+    deadline = args.fetch_deadline or args.config[0].fetch_deadline
+    expires = time.monotonic() + deadline if deadline else None
+
+    def remaining() -> typing.Optional[float]:
+        if expires is None:
+            return None
+        return max(expires - time.monotonic(), 0)
+
+    templates, listed = args.config[0].templates, None
+    if plan.listings(templates):
+        with recorder.timer('fetch'):
+            listed = store.fetch(
+                [], plan.listings(templates), timeout=remaining())
+    render_plan = plan.build(
+        templates, args.prefix, args.replace_underscores, listed)
+    for template_plan in render_plan.templates:
+        if template_plan.template.destination in (learned or {}):
+            template_plan.extend(learned[template_plan.template.destination])
+    with recorder.timer('fetch'):
+        values = store.fetch(
+            render_plan.parameters, render_plan.parameters_by_path,
+            listed.parameter_index if listed else None, remaining())
+    return render_plan, values
+
+
+def last_known_good(args: argparse.Namespace) \
+        -> typing.Optional[pathlib.Path]:
+    return args.last_known_good or args.config[0].last_known_good
+
+
+def load_snapshot(args: argparse.Namespace,
+                  path: pathlib.Path) -> snapshot.Snapshot:
+    """Load the snapshot at the path, exiting if it can not be read"""
+    try:
+        return snapshot.load(path, snapshot.load_key(args.snapshot_key_file))
+    except (OSError, snapshot.SnapshotError) as err:
+        LOGGER.error('Error loading snapshot: %s', err)
+        sys.exit(1)
+
+
+def snapshot_plan(args: argparse.Namespace, path: pathlib.Path) \
+        -> typing.Tuple[plan.Plan, ssm.Values, snapshot.Snapshot]:
+    """Plan the templates with the values in the snapshot, warning about
+    the names and paths used by the templates that were not fetched when
+    it was taken
+
+    """
+    with metrics.get().timer('fetch'):
+        loaded = load_snapshot(args, path)
+    render_plan = plan.build(
+        args.config[0].templates, args.prefix, args.replace_underscores,
+        loaded.values)
+    absent = loaded.absent(
+        render_plan.parameters, render_plan.parameters_by_path)
+    if absent:
+        LOGGER.warning('%s does not include %s', path, ', '.join(absent))
+    return render_plan, loaded.values, loaded
+
+
+def render_template(template_plan: plan.TemplatePlan,
+                    values: ssm.Values,
+                    resolver: typing.Optional[plan.LazyResolver] = None,
+                    durability: writer.Durability = writer.Durability.NONE,
+                    stream: bool = False) \
+        -> typing.Tuple[writer.Status, float]:
+    """Render and write the template, returning the write status and the
+    number of seconds it took. When `stream` is set, the output is written
+    as it is rendered instead of being rendered in memory first.
+
+    """
+    start_time = time.time()
+    template = template_plan.template
+    recorder = metrics.get()
+    label = str(template.destination)
+
+    if not template.destination.parent.exists():
+        template.destination.parent.mkdir(parents=True, exist_ok=True)
+
+    renderer = render.Renderer(
+        source=template.source,
+        resolver=functools.partial(resolver.resolve, template_plan)
+        if resolver else None,
+        context={'tenant': template.tenant} if template.tenant else None,
+        planned=template_plan.variables)
+    owner = (uid(template.user), gid(template.group)) \
+        if template.user or template.group else None
+    if stream:
+        with writer.AtomicFile(template.destination, template.mode, owner,
+                               durability) as output:
+            with recorder.timer('render', template=label):
+                renderer.stream(output, template_plan.values(values))
+        status = output.status
+    else:
+        with recorder.timer('render', template=label):
+            content = renderer.render(template_plan.values(values))
+        status = writer.write(
+            template.destination, content, template.mode, owner, durability)
+
+    with recorder.timer('permissions', template=label):
+        if status == writer.Status.UNCHANGED and \
+                permissions_changed(template):
+            if owner:
+                chown(label, template.user, template.group)
+            if template.mode:
+                template.destination.chmod(template.mode)
+
+    if status == writer.Status.WRITTEN:
+        with recorder.timer('reload', template=label):
+            reload.reload(template)
+    return status, time.time() - start_time
+
+
+def render_plans(template_plans: typing.List[plan.TemplatePlan],
+                 values: ssm.Values,
+                 resolver: typing.Optional[plan.LazyResolver] = None,
+                 parallelism: int = 1,
+                 durability: writer.Durability = writer.Durability.NONE,
+                 stream: bool = False,
+                 fail_fast: bool = True) \
+        -> typing.Dict[pathlib.Path, writer.Status]:
+    """Render the templates across `parallelism` workers, logging the
+    results in template order. Once a template fails no more are started,
+    the templates already being rendered finish and the first failure is
+    raised. When `fail_fast` is false, every template is rendered and the
+    failures are only logged and left out of the results. The directories
+    written to are synced once all of the templates are written when
+    `durability` includes directories.
+
+    """
+    with futures.ThreadPoolExecutor(max(parallelism, 1)) as executor:
+        pending = [executor.submit(render_template, template_plan, values,
+                                   resolver, durability, stream)
+                   for template_plan in template_plans]
+        _done, not_done = futures.wait(
+            pending, return_when=futures.FIRST_EXCEPTION
+            if fail_fast else futures.ALL_COMPLETED)
+        for future in not_done:
+            future.cancel()
+
+    results, error = {}, None
+    for template_plan, future in zip(template_plans, pending):
+        destination = template_plan.template.destination
+        if future.cancelled():
+            LOGGER.info('Skipped rendering %s', destination)
+        elif future.exception():
+            LOGGER.error('Failed to render %s: %s',
+                         destination, future.exception())
+            error = error or future.exception()
+        else:
+            status, duration = future.result()
+            LOGGER.info('Rendered %s in %0.2f seconds (%s)',
+                        destination, duration, status.value)
+            results[destination] = status
+    if durability == writer.Durability.FILE_AND_DIRECTORY:
+        writer.sync_directories(
+            destination.parent for destination, status in results.items()
+            if status == writer.Status.WRITTEN)
+    if error and fail_fast:
+        raise error
+    return results
+
+
+def render_templates(args: argparse.Namespace) \
+        -> typing.Dict[pathlib.Path, writer.Status]:
+    recorder = metrics.configure(args.metrics_file is not None)
+    try:
+        with recorder.timer('total'):
+            environment.configure(args.config[0].bytecode_cache)
+            # Snapshots are rendered without an SSM Parameter Store client
+            store, stale = None, None
+            if args.values_from:
+                render_plan, values, _loaded = snapshot_plan(
+                    args, args.values_from)
+            else:
+                store = parameter_store(args)
+                try:
+                    render_plan, values = fetch_plan(args, store)
+                except ssm.SSMClientException as err:
+                    LOGGER.error('Error fetching parameters: %s', err)
+                    if last_known_good(args) is None:
+                        sys.exit(1)
+                    render_plan, values, stale = snapshot_plan(
+                        args, last_known_good(args))
+
+            resolver = plan.LazyResolver(store, render_plan, values) \
+                if store and stale is None and (
+                    args.lazy or args.config[0].lazy) else None
+
+            results = render_plans(
+                render_plan.templates, values, resolver,
+                args.parallelism or args.config[0].parallelism,
+                write_durability(args), args.stream or args.config[0].stream)
+            if store and stale is None:
+                save_last_known_good(args, render_plan, values)
+    finally:
+        write_metrics(args, recorder)
+
+    LOGGER.info('Rendered %i templates: %i written, %i unchanged',
+                len(results),
+                list(results.values()).count(writer.Status.WRITTEN),
+                list(results.values()).count(writer.Status.UNCHANGED))
+    if stale:
+        LOGGER.warning(
+            'Rendered from stale data: the values in %s were fetched at %s',
+            last_known_good(args), time.strftime(
+                '%Y-%m-%dT%H:%M:%S%z', time.localtime(stale.created_at)))
+        sys.exit(STALE_EXIT_CODE)
+    return results
+
+
+def save_last_known_good(args: argparse.Namespace,
+                         render_plan: plan.Plan,
+                         values: ssm.Values) -> typing.NoReturn:
+    """Keep the values of a successful run to render from when SSM
+    Parameter Store can not be reached in a later run
+
+    """
+    path = last_known_good(args)
+    if path is None:
+        return
+    try:
+        dump_snapshot(args, path, render_plan, values)
+    except (OSError, snapshot.SnapshotError) as err:
+        LOGGER.warning('Failed to write the last known good values to %s: '
+                       '%s', path, err)
+
+
+def watch_templates(args: argparse.Namespace) -> typing.NoReturn:
+    """Poll SSM Parameter Store with a single client, re-rendering the
+    templates whose inputs changed since they were last rendered. Templates
+    that fail to render are logged and retried on the next poll.
+
+    """
+    environment.configure(args.config[0].bytecode_cache)
+    store = parameter_store(args)
+    interval = args.interval or args.config[0].watch_interval
+    parallelism = args.parallelism or args.config[0].parallelism
+    fingerprints: typing.Dict[pathlib.Path, str] = {}
+    # Variables fetched lazily are fetched up front in later polls
+    lazy = args.lazy or args.config[0].lazy
+    learned: typing.Dict[pathlib.Path, discovery.Variables] = {}
+    while True:
+        # Each poll is recorded separately
+        recorder = metrics.configure(args.metrics_file is not None)
+        with recorder.timer('total'):
+            try:
+                render_plan, values = fetch_plan(args, store, learned)
+            except ssm.SSMClientException as err:
+                LOGGER.error('Error fetching parameters: %s', err)
+            else:
+                resolver = plan.LazyResolver(store, render_plan, values) \
+                    if lazy else None
+                changed = [
+                    template_plan for template_plan in render_plan.templates
+                    if template_changed(template_plan, values, fingerprints)]
+                results = render_plans(
+                    changed, values, resolver, parallelism,
+                    write_durability(args),
+                    args.stream or args.config[0].stream, fail_fast=False)
+                for template_plan in changed:
+                    destination = template_plan.template.destination
+                    if destination not in results:
+                        continue
+                    learned[destination] = template_plan.variables
+                    fingerprints[destination] = \
+                        template_fingerprint(template_plan, values)
+                if results:
+                    save_last_known_good(args, render_plan, values)
+        write_metrics(args, recorder)
+        jitter = args.config[0].watch_jitter
+        time.sleep(interval * (1 + random.uniform(-jitter, jitter)))
+
+
+def write_metrics(args: argparse.Namespace,
+                  recorder: metrics.Recorder) -> typing.NoReturn:
+    if args.metrics_file is None:
+        return
+    try:
+        recorder.write(args.metrics_file, args.metrics_format)
+    except OSError as err:
+        LOGGER.warning('Failed to write metrics to %s: %s',
+                       args.metrics_file, err)
+
+
+def template_changed(template_plan: plan.TemplatePlan,
+                     values: ssm.Values,
+                     fingerprints: typing.Dict[pathlib.Path, str]) -> bool:
+    """Return True if the template needs to be rendered again"""
+    destination = template_plan.template.destination
+    if not destination.exists():
+        return True
+    fingerprint = template_fingerprint(template_plan, values)
+    return fingerprints.get(destination) != fingerprint
+
+
+def template_fingerprint(template_plan: plan.TemplatePlan,
+                         values: ssm.Values) -> str:
+    """Return a hash of the inputs used to render the template, including
+    the templates it includes or imports
+
+    """
+    hasher = hashlib.sha256()
+    for path in discovery.sources(template_plan.template.source):
+        try:
+            mtime = path.stat().st_mtime_ns
+        except OSError:
+            mtime = None
+        hasher.update(f'{path}:{mtime}'.encode('utf-8'))
+    hasher.update(json.dumps(
+        dataclasses.asdict(template_plan.values(values)),
+        sort_keys=True).encode('utf-8'))
+    return hasher.hexdigest()
 
 
 def main():  # pragma: no cover
@@ -105,4 +648,15 @@ def main():  # pragma: no cover
         logging.getLogger(logger).setLevel(logging.INFO)
 
     LOGGER.info('ssm-ps-template v%s', metadata.version('ssm-ps-template'))
-    render_templates(args)
+    with profiling.profile(args.profile, args.profile_top):
+        if args.plan:
+            plan_templates(args)
+        elif args.values_to:
+            export_values(args)
+        elif args.watch:
+            try:
+                watch_templates(args)
+            except KeyboardInterrupt:
+                LOGGER.info('Exiting')
+        else:
+            render_templates(args)
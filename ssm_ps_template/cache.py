@@ -0,0 +1,203 @@
+import base64
+import collections
+import datetime
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import tempfile
+import time
+import typing
+
+try:
+    from cryptography import fernet
+except ImportError:  # pragma: nocover
+    fernet = None
+
+LOGGER = logging.getLogger(__name__)
+
+KEY_ENV_VAR = 'SSM_PS_TEMPLATE_CACHE_KEY'
+SECURE_STRING = 'SecureString'
+
+
+class ParameterCache:
+    """On-disk cache of parameters keyed by their fully-qualified name and
+    of the parameter names found under fully-qualified paths. Entries
+    expire after `ttl` seconds and are dropped when the cache is saved,
+    unless `keep_expired` is set for incremental refreshes. The least
+    recently used entries are evicted once there are more than
+    `max_entries`.
+
+    SecureString values are encrypted with a key derived from `key`, or are
+    not cached at all if there is no key.
+
+    """
+    def __init__(self,
+                 path: pathlib.Path,
+                 ttl: float = 60,
+                 max_entries: int = 10000,
+                 key: typing.Optional[str] = None,
+                 keep_expired: bool = False):
+        self._path = path
+        self._keep_expired = keep_expired
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._fernet = self._build_fernet(key)
+        self._parameters: collections.OrderedDict = collections.OrderedDict()
+        self._paths: collections.OrderedDict = collections.OrderedDict()
+        self._load()
+
+    def get_parameter(self, name: str, expired: bool = False) \
+            -> typing.Optional[dict]:
+        """Return the cached parameter, or ``None`` if the parameter is
+        cached as not existing. Raises ``KeyError`` on a cache miss,
+        including expired entries unless `expired` is set.
+
+        """
+        entry = self._get(self._parameters, name, expired)
+        if entry['parameter'] is None:
+            return None
+        parameter = dict(entry['parameter'])
+        if parameter['Type'] == SECURE_STRING:
+            parameter['Value'] = self._decrypt(parameter['Value'])
+        return parameter
+
+    def set_parameter(self,
+                      name: str,
+                      parameter: typing.Optional[dict]) -> typing.NoReturn:
+        """Cache the parameter, ``None`` caching that it does not exist"""
+        if parameter is not None:
+            parameter = self._serialize(parameter)
+            if parameter is None:
+                self._parameters.pop(name, None)
+                return
+        self._set(self._parameters, name, {'parameter': parameter})
+
+    def get_path(self, path: str, expired: bool = False) \
+            -> typing.Dict[str, dict]:
+        """Return the cached parameters for the path, keyed by name. Raises
+        ``KeyError`` on a cache miss, including expired entries unless
+        `expired` is set.
+
+        """
+        entry = self._get(self._paths, path, expired)
+        return {name: self.get_parameter(name, expired)
+                for name in entry['names']}
+
+    def set_path(self,
+                 path: str,
+                 parameters: typing.Dict[str, dict]) -> typing.NoReturn:
+        """Cache the parameters found under the path"""
+        for name, parameter in parameters.items():
+            self.set_parameter(name, parameter)
+        if all(name in self._parameters for name in parameters):
+            self._set(self._paths, path, {'names': sorted(parameters)})
+
+    def save(self) -> typing.NoReturn:
+        """Atomically write the cache to disk"""
+        self._evict()
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(
+            dir=self._path.parent, prefix=f'.{self._path.name}.')
+        try:
+            with os.fdopen(fd, 'w') as handle:
+                json.dump({'parameters': self._parameters,
+                           'paths': self._paths}, handle)
+            os.replace(temp_path, self._path)
+        except OSError as err:
+            LOGGER.warning('Failed to write cache to %s: %s', self._path, err)
+            pathlib.Path(temp_path).unlink(missing_ok=True)
+
+    @staticmethod
+    def _build_fernet(key: typing.Optional[str]):
+        if not key:
+            return None
+        if fernet is None:
+            LOGGER.warning('cryptography is not installed, SecureString '
+                           'values will not be cached')
+            return None
+        return fernet.Fernet(base64.urlsafe_b64encode(
+            hashlib.sha256(key.encode('utf-8')).digest()))
+
+    def _decrypt(self, value: str) -> str:
+        if self._fernet is None:
+            raise KeyError(value)
+        try:
+            return self._fernet.decrypt(value.encode('utf-8')).decode('utf-8')
+        except fernet.InvalidToken:
+            raise KeyError(value)
+
+    def _evict(self) -> typing.NoReturn:
+        if not self._keep_expired:
+            now = time.time()
+            for entries in [self._parameters, self._paths]:
+                for key in [key for key, entry in entries.items()
+                            if entry['expires_at'] <= now]:
+                    del entries[key]
+        while len(self._parameters) + len(self._paths) > self._max_entries:
+            oldest = min(
+                [entries for entries in [self._parameters, self._paths]
+                 if entries],
+                key=lambda entries: next(iter(entries.values()))['used_at'])
+            oldest.popitem(last=False)
+
+    def _get(self,
+             entries: collections.OrderedDict,
+             key: str,
+             expired: bool = False) -> dict:
+        entry = entries[key]
+        if not expired and entry['expires_at'] <= time.time():
+            raise KeyError(key)
+        entry['used_at'] = time.time()
+        entries.move_to_end(key)
+        return entry
+
+    def _load(self) -> typing.NoReturn:
+        if not self._path.exists():
+            return
+        try:
+            with self._path.open('r') as handle:
+                data = json.load(handle)
+        except (OSError, ValueError) as err:
+            LOGGER.warning('Ignoring invalid cache %s: %s', self._path, err)
+            return
+        for name in ['parameters', 'paths']:
+            entries = getattr(self, f'_{name}')
+            for key, entry in sorted(data.get(name, {}).items(),
+                                     key=lambda item: item[1]['used_at']):
+                entries[key] = entry
+
+    def _serialize(self, parameter: dict) -> typing.Optional[dict]:
+        modified = parameter.get('LastModifiedDate')
+        if isinstance(modified, datetime.datetime):
+            modified = modified.timestamp()
+        value = {'Name': parameter['Name'],
+                 'Type': parameter['Type'],
+                 'Value': parameter['Value'],
+                 'Version': parameter.get('Version'),
+                 'LastModifiedDate': modified}
+        if parameter['Type'] == SECURE_STRING:
+            if self._fernet is None:
+                return None
+            value['Value'] = self._fernet.encrypt(
+                parameter['Value'].encode('utf-8')).decode('utf-8')
+        return value
+
+    def _set(self,
+             entries: collections.OrderedDict,
+             key: str,
+             entry: dict) -> typing.NoReturn:
+        now = time.time()
+        entry.update({'expires_at': now + self._ttl, 'used_at': now})
+        entries[key] = entry
+        entries.move_to_end(key)
+
+
+def load_key(key_file: typing.Optional[str] = None) -> typing.Optional[str]:
+    """Return the cache encryption key from the environment or key file"""
+    if os.environ.get(KEY_ENV_VAR):
+        return os.environ[KEY_ENV_VAR]
+    if key_file:
+        return pathlib.Path(key_file).read_text().strip()
+    return None
@@ -4,8 +4,17 @@ import json
 import pathlib
 import typing
 
-import toml
-import yaml
+from ssm_ps_template import lazy
+
+botocore_config = lazy.load('botocore.config')
+# Only the parser for the configuration file type is imported
+toml = lazy.load('toml')
+yaml = lazy.load('yaml')
+
+DURABILITY = ['none', 'file', 'file+dir']
+# Replaced with the last segment of each prefix in fanned-out destinations
+TENANT = '{tenant}'
+TRANSPORTS = ['boto3', 'http']
 
 
 @dataclasses.dataclass
@@ -16,6 +25,21 @@ class Template:
     user: typing.Union[int, str, None]
     group: typing.Union[int, str, None]
     mode: typing.Optional[str]
+    reload_command: typing.Optional[str] = None
+    reload_signal: typing.Optional[str] = None
+    pidfile: typing.Optional[str] = None
+    prefixes: typing.Optional[typing.List[str]] = None
+    prefixes_from: typing.Optional[str] = None
+    tenant: typing.Optional[str] = None
+
+
+@dataclasses.dataclass
+class Cache:
+    path: pathlib.Path
+    ttl: float = 60
+    max_entries: int = 10000
+    key_file: typing.Optional[str] = None
+    incremental: bool = False
 
 
 @dataclasses.dataclass
@@ -26,6 +50,23 @@ class Configuration:
     replace_underscores: typing.Optional[bool]
     templates: list[Template]
     verbose: bool
+    max_concurrency: int = 1
+    rate_limit: typing.Optional[float] = None
+    max_retries: int = 5
+    cache: typing.Optional[Cache] = None
+    watch_interval: float = 60
+    watch_jitter: float = 0.1
+    bytecode_cache: typing.Optional[pathlib.Path] = None
+    lazy: bool = False
+    parallelism: int = 1
+    durability: str = 'none'
+    stream: bool = False
+    transport: str = 'boto3'
+    client: typing.Optional[dict] = None
+    connect_timeout: typing.Optional[float] = None
+    read_timeout: typing.Optional[float] = None
+    fetch_deadline: typing.Optional[float] = None
+    last_known_good: typing.Optional[pathlib.Path] = None
 
 
 def _load_configuration(value: dict) -> Configuration:
@@ -40,7 +81,16 @@ def _load_configuration(value: dict) -> Configuration:
                 prefix=template.get('prefix'),
                 user=template.get('user'),
                 group=template.get('group'),
-                mode=mode))
+                mode=mode,
+                reload_command=template.get('reload_command'),
+                reload_signal=template.get('reload_signal'),
+                pidfile=template.get('pidfile'),
+                prefixes=template.get('prefixes'),
+                prefixes_from=template.get('prefixes_from')))
+        cache = _entry_to_cache(value['cache']) \
+            if value.get('cache') else None
+        client = _entry_to_client(value['client']) \
+            if value.get('client') else None
     except KeyError as error:
         raise argparse.ArgumentTypeError(
             f'Failed to load configuration due to invalid key: {error}')
@@ -50,7 +100,57 @@ def _load_configuration(value: dict) -> Configuration:
         region=value.get('region'),
         replace_underscores=value.get('replace_underscores', False),
         templates=templates,
-        verbose=value.get('verbose', False))
+        verbose=value.get('verbose', False),
+        max_concurrency=int(value.get('max_concurrency', 1)),
+        rate_limit=value.get('rate_limit'),
+        max_retries=int(value.get('max_retries', 5)),
+        cache=cache,
+        watch_interval=float(value.get('watch_interval', 60)),
+        watch_jitter=float(value.get('watch_jitter', 0.1)),
+        bytecode_cache=pathlib.Path(value['bytecode_cache'])
+        if value.get('bytecode_cache') else None,
+        lazy=bool(value.get('lazy', False)),
+        parallelism=int(value.get('parallelism', 1)),
+        durability=_choice(
+            'durability', value.get('durability', 'none'), DURABILITY),
+        stream=bool(value.get('stream', False)),
+        transport=_choice(
+            'transport', value.get('transport', 'boto3'), TRANSPORTS),
+        client=client,
+        connect_timeout=_float(value.get('connect_timeout')),
+        read_timeout=_float(value.get('read_timeout')),
+        fetch_deadline=_float(value.get('fetch_deadline')),
+        last_known_good=pathlib.Path(value['last_known_good'])
+        if value.get('last_known_good') else None)
+
+
+def _choice(name: str, value: str, choices: typing.List[str]) -> str:
+    if value not in choices:
+        raise argparse.ArgumentTypeError(
+            f'Invalid {name} {value!r}, must be one of {", ".join(choices)}')
+    return value
+
+
+def _float(value: typing.Optional[str]) -> typing.Optional[float]:
+    return float(value) if value is not None else None
+
+
+def _entry_to_cache(value: dict) -> Cache:
+    return Cache(path=pathlib.Path(value['path']),
+                 ttl=float(value.get('ttl', 60)),
+                 max_entries=int(value.get('max_entries', 10000)),
+                 key_file=value.get('key_file'),
+                 incremental=bool(value.get('incremental', False)))
+
+
+def _entry_to_client(value: dict) -> dict:
+    """Validate the botocore client configuration settings"""
+    for key in value:
+        if key not in botocore_config.Config.OPTION_DEFAULTS or \
+                key == 'retries':
+            raise argparse.ArgumentTypeError(
+                f'Invalid client configuration setting: {key}')
+    return dict(value)
 
 
 def _entry_to_template(**kwargs) -> Template:
@@ -58,12 +158,23 @@ def _entry_to_template(**kwargs) -> Template:
     if not source.exists():
         raise argparse.ArgumentTypeError(
             f'Specified template {source} does not exist')
+    # Templates rendered for multiple prefixes each need a destination
+    if (kwargs.get('prefixes') or kwargs.get('prefixes_from')) and \
+            TENANT not in kwargs['destination']:
+        raise argparse.ArgumentTypeError(
+            f'The destination for {source} must include {TENANT} when '
+            f'prefixes or prefixes_from are set')
     return Template(source=source,
                     destination=pathlib.Path(kwargs['destination']),
                     prefix=kwargs['prefix'],
                     user=kwargs['user'],
                     group=kwargs['group'],
-                    mode=kwargs['mode'])
+                    mode=kwargs['mode'],
+                    reload_command=kwargs.get('reload_command'),
+                    reload_signal=kwargs.get('reload_signal'),
+                    pidfile=kwargs.get('pidfile'),
+                    prefixes=kwargs.get('prefixes'),
+                    prefixes_from=kwargs.get('prefixes_from'))
 
 
 def configuration_file(value: str) -> Configuration:
@@ -1,21 +1,23 @@
 import dataclasses
-import enum
+import itertools
 import logging
 import pathlib
 import typing
 
-from jinja2 import sandbox
+import jinja2
+from jinja2 import nodes
+
+from ssm_ps_template import environment
 
 LOGGER = logging.getLogger(__name__)
 
 GET_PARAMETER = 'get_parameter'
 GET_PARAMETERS_BY_PATH = 'get_parameters_by_path'
 FUNCTIONS = {GET_PARAMETER, GET_PARAMETERS_BY_PATH}
+ARGUMENTS = {GET_PARAMETER: 'key', GET_PARAMETERS_BY_PATH: 'path'}
 
-
-class State(enum.Enum):
-    OFF = 0
-    BLOCK_PENDING = 1
+# The maximum number of values a folded expression may resolve to
+MAX_VALUES = 1000
 
 
 @dataclasses.dataclass
@@ -24,34 +26,252 @@ class Variables:
     parameters_by_path: set
 
 
+# Discovered variables, the up-to-date checks for the parsed templates, and
+# the names of the templates that were included or imported
+_discovered: typing.Dict[
+    str, typing.Tuple[Variables, typing.List[typing.Callable[[], bool]],
+                      typing.List[str]]] = {}
+
+
 class VariableDiscovery:
-    """Reads the template and parses out the variables to fetch"""
+    """Parses the template, and the templates it includes or imports, and
+    walks their AST to find the variables to fetch
+
+    """
 
     def __init__(self, source: pathlib.Path):
-        env = sandbox.ImmutableSandboxedEnvironment()
-        with source.open('r') as handle:
-            self._tokens = list(env.lex(env.preprocess(handle.read())))
-        self._offset = 0
+        self._name = environment.template_name(source)
 
     def discover(self) -> Variables:
         """Discover the variables that to look up in SSM Parameter Store"""
-        variable_type, state = None, State.OFF
+        cached = _discovered.get(self._name)
+        if cached and all(uptodate() for uptodate in cached[1]):
+            return Variables(set(cached[0].parameters),
+                             set(cached[0].parameters_by_path))
+
+        try:
+            templates, checks, names = self._parse(self._name)
+        except jinja2.TemplateSyntaxError as err:
+            LOGGER.warning('Failed to parse %s, discovering literal '
+                           'arguments only: %s', self._name, err)
+            return self._scan(self._name)
+
+        symbols = _Symbols(templates)
         variables = Variables(set(), set())
-        for (line_no, ident, value) in self.tokens():
-            if state == State.OFF and ident == 'name' and value in FUNCTIONS:
-                state = State.BLOCK_PENDING
-                variable_type = value
-            elif state == State.BLOCK_PENDING and ident == 'string':
+        for template in templates:
+            for call, macro in _walk(template):
+                if not isinstance(call, nodes.Call) or \
+                        not isinstance(call.node, nodes.Name) or \
+                        call.node.name not in FUNCTIONS:
+                    continue
+                function = call.node.name
+                argument = _argument(call, ARGUMENTS[function])
+                values = symbols.resolve(argument, macro) \
+                    if argument else None
+                if values is None:
+                    LOGGER.debug('Unable to resolve the %s argument on '
+                                 'line %i of %s', function, call.lineno,
+                                 self._name)
+                elif function == GET_PARAMETER:
+                    variables.parameters.update(values)
+                else:
+                    variables.parameters_by_path.update(values)
+        _discovered[self._name] = variables, checks, names
+        return Variables(set(variables.parameters),
+                         set(variables.parameters_by_path))
+
+    @staticmethod
+    def _parse(name: str) \
+            -> typing.Tuple[typing.List[nodes.Template],
+                            typing.List[typing.Callable[[], bool]],
+                            typing.List[str]]:
+        """Parse the template and the templates it includes or imports,
+        returning their ASTs, the checks for whether they are up to date,
+        and the names of every template referenced, found or not
+
+        """
+        env = environment.get()
+        templates, checks, pending, seen = [], [], [name], []
+        while pending:
+            name = pending.pop(0)
+            if name in seen:
+                continue
+            seen.append(name)
+            try:
+                template, uptodate = env.parse_template(name)
+            except jinja2.TemplateNotFound:
+                LOGGER.debug('Unable to find %s for discovery', name)
+                continue
+            templates.append(template)
+            checks.append(uptodate)
+            symbols = _Symbols([template])
+            for node in template.find_all(
+                    (nodes.Include, nodes.Import, nodes.FromImport)):
+                for value in symbols.resolve(node.template) or []:
+                    pending.append(env.join_path(value, name))
+        return templates, checks, seen
+
+    @staticmethod
+    def _scan(name: str) -> Variables:
+        """Find the functions called with literal string arguments in the
+        tokens of a template that can not be parsed
+
+        """
+        env = environment.get()
+        source, _filename, _uptodate = env.loader.get_source(env, name)
+        variables, function = Variables(set(), set()), None
+        for _line_no, ident, value in env.lex(env.preprocess(source)):
+            if function is None and ident == 'name' and value in FUNCTIONS:
+                function = value
+            elif function is not None and ident == 'string':
                 value = value.strip('"').strip("'")
-                if variable_type == GET_PARAMETER:
+                if function == GET_PARAMETER:
                     variables.parameters.add(value)
-                elif variable_type == GET_PARAMETERS_BY_PATH:
+                else:
                     variables.parameters_by_path.add(value)
-                state, variable_type = State.OFF, None
+                function = None
         return variables
 
-    def tokens(self) \
-            -> typing.Generator[typing.Tuple[int, str, str], None, None]:
-        while self._offset < len(self._tokens):
-            yield self._tokens[self._offset]
-            self._offset += 1
+
+def sources(source: pathlib.Path) -> typing.List[pathlib.Path]:
+    """Return the paths of the template and of the templates it includes or
+    imports, as of when its variables were last discovered
+
+    """
+    cached = _discovered.get(environment.template_name(source))
+    return [pathlib.Path(name) for name in cached[2]] if cached else [source]
+
+
+class _Symbols:
+    """Constant folds expressions using the variables that are assigned
+    constant values with ``set``, iterated over in ``for`` loops, or passed
+    as arguments to macros in the templates. A variable may resolve to
+    multiple values. Macro arguments are scoped to the macro.
+
+    """
+    def __init__(self, templates: typing.List[nodes.Template]):
+        self._values: typing.Dict[
+            typing.Optional[str], typing.Dict[str, typing.Set[str]]] = {}
+        self._templates = templates
+        self._macros = {macro.name: macro for template in templates
+                        for macro in template.find_all(nodes.Macro)}
+        # Bindings may depend on each other, so iterate until stable
+        for _offset in range(10):
+            if not self._bind():
+                break
+
+    def resolve(self,
+                node: nodes.Node,
+                macro: typing.Optional[str] = None) \
+            -> typing.Optional[typing.Set[str]]:
+        """Return the values the expression may evaluate to within the
+        macro, or ``None`` if it can not be resolved
+
+        """
+        if isinstance(node, nodes.Const):
+            return {node.value} if isinstance(node.value, str) else None
+        elif isinstance(node, nodes.Name):
+            if node.name in self._values.get(macro, {}):
+                return self._values[macro][node.name]
+            return self._values.get(None, {}).get(node.name)
+        elif isinstance(node, nodes.Concat):
+            return self._product(
+                [self.resolve(item, macro) for item in node.nodes])
+        elif isinstance(node, nodes.Add):
+            return self._product([self.resolve(node.left, macro),
+                                  self.resolve(node.right, macro)])
+        elif isinstance(node, nodes.CondExpr) and node.expr2 is not None:
+            values = [self.resolve(node.expr1, macro),
+                      self.resolve(node.expr2, macro)]
+            if None in values:
+                return None
+            return values[0] | values[1]
+        return None
+
+    def _bind(self) -> bool:
+        """Bind the variable values, returning True if any were added"""
+        changed = False
+        for template in self._templates:
+            for node, macro in _walk(template):
+                if isinstance(node, nodes.Assign) and \
+                        isinstance(node.target, nodes.Name):
+                    changed |= self._add(
+                        macro, node.target.name,
+                        self.resolve(node.node, macro))
+                elif isinstance(node, nodes.For) and \
+                        isinstance(node.target, nodes.Name) and \
+                        isinstance(node.iter, (nodes.List, nodes.Tuple)):
+                    for item in node.iter.items:
+                        changed |= self._add(
+                            macro, node.target.name,
+                            self.resolve(item, macro))
+                elif isinstance(node, nodes.Call) and \
+                        _function_name(node) in self._macros:
+                    changed |= self._bind_call(node, macro)
+                elif isinstance(node, nodes.Macro):
+                    defaults = node.args[len(node.args) - len(node.defaults):]
+                    for argument, value in zip(defaults, node.defaults):
+                        changed |= self._add(
+                            node.name, argument.name, self.resolve(value))
+        return changed
+
+    def _bind_call(self,
+                   call: nodes.Call,
+                   macro: typing.Optional[str]) -> bool:
+        """Bind the arguments of a call to a macro to its arguments"""
+        changed, called = False, self._macros[_function_name(call)]
+        for argument, value in zip(called.args, call.args):
+            changed |= self._add(
+                called.name, argument.name, self.resolve(value, macro))
+        for keyword in call.kwargs:
+            changed |= self._add(
+                called.name, keyword.key, self.resolve(keyword.value, macro))
+        return changed
+
+    def _add(self,
+             macro: typing.Optional[str],
+             name: str,
+             values: typing.Optional[typing.Set[str]]) -> bool:
+        scope = self._values.setdefault(macro, {})
+        if not values or values <= scope.get(name, set()):
+            return False
+        scope.setdefault(name, set()).update(values)
+        return True
+
+    @staticmethod
+    def _product(values: typing.List[typing.Optional[typing.Set[str]]]) \
+            -> typing.Optional[typing.Set[str]]:
+        if None in values:
+            return None
+        result = {''.join(parts) for parts in itertools.product(*values)}
+        return result if len(result) <= MAX_VALUES else None
+
+
+def _argument(call: nodes.Call, keyword: str) -> typing.Optional[nodes.Node]:
+    if call.args:
+        return call.args[0]
+    for value in call.kwargs:
+        if value.key == keyword:
+            return value.value
+    return None
+
+
+def _function_name(call: nodes.Call) -> typing.Optional[str]:
+    if isinstance(call.node, nodes.Name):
+        return call.node.name
+    elif isinstance(call.node, nodes.Getattr):
+        return call.node.attr
+    return None
+
+
+def _walk(node: nodes.Node, macro: typing.Optional[str] = None) \
+        -> typing.Generator[
+            typing.Tuple[nodes.Node, typing.Optional[str]], None, None]:
+    """Yield every node below the node, with the name of the macro it is
+    defined in, if any
+
+    """
+    for child in node.iter_child_nodes():
+        yield child, macro
+        yield from _walk(
+            child, child.name if isinstance(child, nodes.Macro) else macro)
@@ -0,0 +1,95 @@
+import logging
+import pathlib
+import typing
+
+import jinja2
+from jinja2 import nodes, sandbox
+
+LOGGER = logging.getLogger(__name__)
+
+_environment: typing.Optional['Environment'] = None
+
+
+class Environment(sandbox.ImmutableSandboxedEnvironment):
+    """Sandboxed environment that resolves relative template names used in
+    includes and imports relative to the including template, and that
+    compiles templates from the AST parsed for variable discovery instead
+    of parsing their source a second time
+
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._parsed: typing.Dict[str, typing.Tuple[str, nodes.Template]] = {}
+
+    def compile(self, source, name=None, filename=None, *args, **kwargs):
+        # Templates may be compiled concurrently by the render workers
+        parsed_source, parsed = self._parsed.pop(name, (None, None))
+        if isinstance(source, str) and parsed_source == source:
+            source = parsed
+        return super().compile(source, name, filename, *args, **kwargs)
+
+    def join_path(self, template: str, parent: str) -> str:
+        if pathlib.Path(template).is_absolute():
+            return template
+        return str(pathlib.Path(parent).parent / template)
+
+    def parse_template(self, name: str) \
+            -> typing.Tuple[nodes.Template, typing.Callable[[], bool]]:
+        """Parse the template, keeping the AST to compile the template
+        from when it is loaded. Returns the AST and a callable that returns
+        False once the template source has changed.
+
+        """
+        source, filename, uptodate = self.loader.get_source(self, name)
+        parsed = self.parse(source, name, filename)
+        self._parsed[name] = source, parsed
+        return parsed, uptodate
+
+
+class Loader(jinja2.BaseLoader):
+    """Loads templates by their path, reloading them when they change"""
+
+    def get_source(self,
+                   environment: jinja2.Environment,
+                   template: str) \
+            -> typing.Tuple[str, str, typing.Callable[[], bool]]:
+        path = pathlib.Path(template)
+        try:
+            mtime = path.stat().st_mtime_ns
+            source = path.read_text()
+        except (FileNotFoundError, NotADirectoryError):
+            raise jinja2.TemplateNotFound(template)
+
+        def uptodate() -> bool:
+            try:
+                return path.stat().st_mtime_ns == mtime
+            except OSError:
+                return False
+
+        return source, str(path), uptodate
+
+
+def configure(bytecode_cache: typing.Optional[pathlib.Path] = None) \
+        -> Environment:
+    """Replace the shared environment, optionally caching the compiled
+    templates in the `bytecode_cache` directory
+
+    """
+    global _environment
+    cache = None
+    if bytecode_cache is not None:
+        bytecode_cache.mkdir(parents=True, exist_ok=True)
+        cache = jinja2.FileSystemBytecodeCache(str(bytecode_cache))
+    _environment = Environment(
+        auto_reload=True, bytecode_cache=cache, loader=Loader())
+    return _environment
+
+
+def get() -> Environment:
+    """Return the environment shared by the process"""
+    return _environment or configure()
+
+
+def template_name(source: pathlib.Path) -> str:
+    """Return the name to load the template at the source path by"""
+    return str(source.resolve())
@@ -0,0 +1,112 @@
+import typing
+
+
+class Index:
+    """Prefix tree of parameters keyed by the ``/`` delimited segments of
+    their names. Paths fetched recursively are marked in the tree, so the
+    names and nested paths under them are answered from the index instead
+    of calling SSM Parameter Store again.
+
+    """
+    def __init__(self):
+        self._root = _Node()
+
+    def add(self, name: str, parameter: dict) -> typing.NoReturn:
+        """Add a parameter to the index"""
+        self._node(name.split('/'), True).parameter = parameter
+
+    def add_path(self, path: str, parameters: typing.Dict[str, dict]) \
+            -> typing.NoReturn:
+        """Add the parameters fetched recursively for the path, marking it
+        as fetched
+
+        """
+        self._node(_segments(path), True).fetched = True
+        for name, parameter in parameters.items():
+            self.add(name, parameter)
+
+    def covers(self, path: str) -> bool:
+        """Return True if the path is, or is under, a fetched path"""
+        return self._covers(_segments(path))
+
+    def covers_name(self, name: str) -> bool:
+        """Return True if the parameter is under a fetched path"""
+        return self._covers(name.split('/')[:-1])
+
+    def get(self, name: str) -> typing.Optional[dict]:
+        """Return the parameter, if it is in the index"""
+        node = self._node(name.split('/'))
+        return node.parameter if node else None
+
+    def plan(self, names: typing.Iterable[str], paths: typing.Iterable[str]) \
+            -> typing.Tuple[typing.List[str], typing.List[str]]:
+        """Return the names and paths that need to be fetched: paths that
+        are under another path are only fetched at the shortest one, and
+        names and paths under a fetched path are left to the index
+
+        """
+        pending, fetch = Index(), []
+        for path in sorted(paths, key=lambda value: len(_segments(value))):
+            if not self.covers(path) and not pending.covers(path):
+                pending.add_path(path, {})
+                fetch.append(path)
+        return ([name for name in names
+                 if not any(value.covers_name(name)
+                            for value in [self, pending])],
+                sorted(fetch))
+
+    def under(self, path: str) -> typing.Dict[str, dict]:
+        """Return the parameters under the path, keyed by name"""
+        parameters = {}
+        node = self._node(_segments(path))
+        stack = list(reversed(node.children.values())) if node else []
+        while stack:
+            node = stack.pop()
+            if node.parameter is not None:
+                parameters[node.parameter['Name']] = node.parameter
+            stack += reversed(node.children.values())
+        return parameters
+
+    def _covers(self, segments: typing.List[str]) -> bool:
+        node = self._root
+        for segment in segments:
+            node = node.children.get(segment)
+            if node is None:
+                return False
+            elif node.fetched:
+                return True
+        return False
+
+    def _node(self, segments: typing.List[str], create: bool = False) \
+            -> typing.Optional['_Node']:
+        node = self._root
+        for segment in segments:
+            if segment not in node.children:
+                if not create:
+                    return None
+                node.children[segment] = _Node()
+            node = node.children[segment]
+        return node
+
+
+class _Node:
+    __slots__ = ('children', 'fetched', 'parameter')
+
+    def __init__(self):
+        self.children: typing.Dict[str, '_Node'] = {}
+        self.fetched = False
+        self.parameter: typing.Optional[dict] = None
+
+
+def is_under(path: str, parent: str) -> bool:
+    """Return True if the path is, or is under, the parent path"""
+    segments = _segments(parent)
+    return _segments(path)[:len(segments)] == segments
+
+
+def _segments(path: str) -> typing.List[str]:
+    """Return the segments of the path, ignoring the trailing ``/`` so
+    ``/foo/bar`` and ``/foo/bar/`` are the same path
+
+    """
+    return path.rstrip('/').split('/')
@@ -0,0 +1,20 @@
+import importlib
+import sys
+import types
+
+
+class Module(types.ModuleType):
+    """Stands in for a module that is imported when one of its attributes
+    is first used, deferring the cost of importing it until it is needed
+
+    """
+    def __getattr__(self, name: str):
+        return getattr(importlib.import_module(self.__name__), name)
+
+
+def load(name: str) -> types.ModuleType:
+    """Return the module if it is already imported, otherwise a stand-in
+    that imports it on first use
+
+    """
+    return sys.modules.get(name) or Module(name)
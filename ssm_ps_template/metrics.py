@@ -0,0 +1,140 @@
+import collections
+import contextlib
+import json
+import logging
+import pathlib
+import threading
+import time
+import typing
+
+from ssm_ps_template import writer
+
+LOGGER = logging.getLogger(__name__)
+
+JSON_LINES = 'jsonl'
+PROMETHEUS = 'prometheus'
+FORMATS = [JSON_LINES, PROMETHEUS]
+
+PREFIX = 'ssm_ps_template'
+
+_recorder: typing.Optional['Recorder'] = None
+
+
+class Recorder:
+    """Records the time spent in each phase of a run and the calls made to
+    SSM Parameter Store. Nothing is recorded unless `enabled` is set.
+
+    """
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.events: typing.List[dict] = []
+        self._lock = threading.Lock()
+
+    def api_call(self,
+                 operation: str,
+                 seconds: float,
+                 parameters: int,
+                 retries: int,
+                 **labels: str) -> typing.NoReturn:
+        """Record a call to SSM Parameter Store, including its retries"""
+        self._record({'type': 'api_call', 'operation': operation,
+                      'seconds': seconds, 'parameters': parameters,
+                      'retries': retries, **labels})
+
+    @contextlib.contextmanager
+    def timer(self, phase: str, **labels: str) \
+            -> typing.Generator[None, None, None]:
+        """Record the time spent in the phase"""
+        if not self.enabled:
+            yield
+            return
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._record({'type': 'phase', 'phase': phase,
+                          'seconds': time.monotonic() - start, **labels})
+
+    def write(self, path: pathlib.Path, fmt: str = JSON_LINES) \
+            -> typing.NoReturn:
+        """Write the metrics, appending JSON lines to the file or atomically
+        replacing it with the Prometheus text format
+
+        """
+        with self._lock:
+            events = list(self.events)
+        if fmt == PROMETHEUS:
+            writer.write(path, prometheus(events))
+            return
+        with path.open('a') as handle:
+            for event in events:
+                handle.write(json.dumps(event, sort_keys=True) + '\n')
+
+    def _record(self, event: dict) -> typing.NoReturn:
+        if self.enabled:
+            event['timestamp'] = time.time()
+            with self._lock:
+                self.events.append(event)
+
+
+def configure(enabled: bool = False) -> Recorder:
+    """Replace the recorder shared by the process"""
+    global _recorder
+    _recorder = Recorder(enabled)
+    return _recorder
+
+
+def get() -> Recorder:
+    """Return the recorder shared by the process"""
+    return _recorder or configure()
+
+
+def prometheus(events: typing.List[dict]) -> str:
+    """Return the events in the Prometheus text exposition format, with
+    the phase timings per template and the API calls summed by operation
+
+    """
+    phases: typing.Dict[typing.Tuple, float] = collections.defaultdict(float)
+    calls: typing.Dict[str, typing.Dict[str, float]] = \
+        collections.defaultdict(lambda: collections.defaultdict(float))
+    for event in events:
+        if event['type'] == 'phase':
+            labels = tuple(sorted(
+                (key, str(value)) for key, value in event.items()
+                if key not in {'type', 'seconds', 'timestamp'}))
+            phases[labels] += event['seconds']
+        else:
+            totals = calls[event['operation']]
+            totals['calls'] += 1
+            totals['seconds'] += event['seconds']
+            totals['parameters'] += event['parameters']
+            totals['retries'] += event['retries']
+
+    lines = [f'# HELP {PREFIX}_phase_seconds Seconds spent in each phase',
+             f'# TYPE {PREFIX}_phase_seconds gauge']
+    for labels, seconds in sorted(phases.items()):
+        lines.append(f'{PREFIX}_phase_seconds{_labels(labels)} {seconds:.6f}')
+    for name, description in [
+            ('calls', 'Calls made to SSM Parameter Store'),
+            ('seconds', 'Seconds spent calling SSM Parameter Store'),
+            ('parameters', 'Parameters returned by SSM Parameter Store'),
+            ('retries', 'Calls to SSM Parameter Store retried after being '
+                        'throttled or failing')]:
+        lines += [f'# HELP {PREFIX}_api_{name} {description}',
+                  f'# TYPE {PREFIX}_api_{name} gauge']
+        for operation, totals in sorted(calls.items()):
+            lines.append(f'{PREFIX}_api_{name}'
+                         f'{_labels([("operation", operation)])} '
+                         f'{totals[name]:g}')
+    lines += [f'# HELP {PREFIX}_last_run_timestamp_seconds When the metrics '
+              f'were written',
+              f'# TYPE {PREFIX}_last_run_timestamp_seconds gauge',
+              f'{PREFIX}_last_run_timestamp_seconds {time.time():.3f}']
+    return '\n'.join(lines) + '\n'
+
+
+def _labels(labels: typing.Iterable[typing.Tuple[str, str]]) -> str:
+    values = ','.join(
+        '{}="{}"'.format(key, value.replace('\\', '\\\\').replace('"', '\\"'))
+        for key, value in labels)
+    return f'{{{values}}}' if values else ''
@@ -0,0 +1,229 @@
+import collections
+import dataclasses
+import logging
+import math
+import pathlib
+import threading
+import typing
+
+from ssm_ps_template import config, discovery, index, metrics, ssm
+
+LOGGER = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class TemplatePlan:
+    template: config.Template
+    variables: discovery.Variables
+    parameters: typing.Dict[str, str]
+    parameters_by_path: typing.Dict[str, str]
+    prefix: str = ''
+    replace_underscores: bool = False
+
+    def extend(self, variables: discovery.Variables) -> typing.NoReturn:
+        """Add variables that were not found by discovery to the plan"""
+        self.variables.parameters.update(variables.parameters)
+        self.variables.parameters_by_path.update(variables.parameters_by_path)
+        self.parameters.update(ssm.build_names(
+            variables.parameters, self.prefix, self.replace_underscores))
+        self.parameters_by_path.update(ssm.build_names(
+            variables.parameters_by_path, self.prefix,
+            self.replace_underscores))
+
+    def values(self, values: ssm.Values) -> ssm.Values:
+        """Return the slice of the fetched values used by the template"""
+        return values.subset(self.parameters, self.parameters_by_path)
+
+
+@dataclasses.dataclass
+class Plan:
+    templates: typing.List[TemplatePlan]
+    # The paths listed to find the prefixes fanned-out templates render for
+    listings: typing.List[str] = dataclasses.field(default_factory=list)
+
+    @property
+    def parameters(self) -> typing.List[str]:
+        """The deduplicated fully-qualified parameter names to fetch"""
+        return sorted({name for template in self.templates
+                       for name in template.parameters.values()})
+
+    @property
+    def parameters_by_path(self) -> typing.List[str]:
+        """The deduplicated fully-qualified parameter paths to fetch"""
+        paths = {name for template in self.templates
+                 for name in template.parameters_by_path.values()}
+        paths.update(self.listings)
+        return sorted(paths)
+
+
+def build(templates: typing.List[config.Template],
+          prefix: typing.Optional[str],
+          replace_underscores: bool,
+          listed: typing.Optional[ssm.Values] = None) -> Plan:
+    """Discover the variables for all of the templates, resolving the
+    fully-qualified names that need to be fetched for each. Templates with
+    ``prefixes`` or ``prefixes_from`` are discovered once and planned for
+    each prefix, finding the prefixes under the ``prefixes_from`` paths in
+    the `listed` values.
+
+    """
+    plan = Plan([], listings(templates))
+    discovered: typing.Dict[pathlib.Path, discovery.Variables] = {}
+    for template in fan_out(templates, listed):
+        template_prefix = (template.prefix if template.tenant else (
+            prefix or template.prefix or '')).rstrip('/')
+        if template.source not in discovered:
+            with metrics.get().timer(
+                    'discover', template=str(template.destination)):
+                discovered[template.source] = \
+                    discovery.VariableDiscovery(template.source).discover()
+        variables = discovery.Variables(
+            set(discovered[template.source].parameters),
+            set(discovered[template.source].parameters_by_path))
+        plan.templates.append(TemplatePlan(
+            template=template,
+            variables=variables,
+            parameters=ssm.build_names(
+                variables.parameters, template_prefix, replace_underscores),
+            parameters_by_path=ssm.build_names(
+                variables.parameters_by_path, template_prefix,
+                replace_underscores),
+            prefix=template_prefix,
+            replace_underscores=replace_underscores))
+    LOGGER.debug('Planned %i parameters and %i paths for %i templates',
+                 len(plan.parameters), len(plan.parameters_by_path),
+                 len(plan.templates))
+    return plan
+
+
+def fan_out(templates: typing.List[config.Template],
+            listed: typing.Optional[ssm.Values] = None) \
+        -> typing.List[config.Template]:
+    """Replace each template with ``prefixes`` or ``prefixes_from`` with a
+    template per prefix, named for the last segment of the prefix. The
+    prefixes under a ``prefixes_from`` path are the first segments of the
+    names under it in the `listed` values that have parameters below them.
+
+    """
+    expanded = []
+    for template in templates:
+        if not template.prefixes and not template.prefixes_from:
+            expanded.append(template)
+            continue
+        prefixes = [value.rstrip('/') for value in template.prefixes or []]
+        if template.prefixes_from and listed is not None:
+            path = template.prefixes_from.rstrip('/')
+            for name in listed.parameters_by_path.get(
+                    template.prefixes_from, {}):
+                tenant, _, rest = name.strip('/').partition('/')
+                if rest and f'{path}/{tenant}' not in prefixes:
+                    prefixes.append(f'{path}/{tenant}')
+        for value in prefixes:
+            tenant = value.rpartition('/')[2]
+            expanded.append(dataclasses.replace(
+                template,
+                destination=pathlib.Path(str(template.destination).replace(
+                    config.TENANT, tenant)),
+                prefix=value,
+                pidfile=_tenant(template.pidfile, tenant),
+                reload_command=_tenant(template.reload_command, tenant),
+                prefixes=None,
+                prefixes_from=None,
+                tenant=tenant))
+    return expanded
+
+
+def listings(templates: typing.List[config.Template]) -> typing.List[str]:
+    """Return the paths listed to find the prefixes of the templates"""
+    return sorted({template.prefixes_from for template in templates
+                   if template.prefixes_from})
+
+
+def _tenant(value: typing.Optional[str], tenant: str) -> typing.Optional[str]:
+    return value.replace(config.TENANT, tenant) if value else value
+
+
+def estimate(plan: Plan) -> dict:
+    """Return the fully-qualified names and paths the plan uses, which of
+    them are answered by another path, the inputs shared by templates, and
+    the calls to SSM Parameter Store needed to fetch them without a cache.
+    The number of parameters under a path is not known until it is
+    fetched, so each path is counted as one call, a lower bound.
+
+    """
+    names, paths = index.Index().plan(
+        plan.parameters, plan.parameters_by_path)
+    shared = collections.defaultdict(list)
+    for template_plan in plan.templates:
+        for name in sorted(set(template_plan.parameters.values()) | set(
+                template_plan.parameters_by_path.values())):
+            shared[name].append(str(template_plan.template.destination))
+    return {
+        'templates': [{
+            'source': str(template_plan.template.source),
+            'destination': str(template_plan.template.destination),
+            'parameters': dict(sorted(template_plan.parameters.items())),
+            'parameters_by_path': dict(
+                sorted(template_plan.parameters_by_path.items()))}
+            for template_plan in plan.templates],
+        'parameters': plan.parameters,
+        'parameters_by_path': plan.parameters_by_path,
+        'listings': plan.listings,
+        'overlapping_paths': {
+            path: _covering(path, paths)
+            for path in plan.parameters_by_path if path not in paths},
+        'parameters_under_paths': {
+            name: _covering(name.rpartition('/')[0], paths)
+            for name in plan.parameters if name not in names},
+        'shared': {name: destinations
+                   for name, destinations in sorted(shared.items())
+                   if len(destinations) > 1},
+        'fetch': {'parameters': names, 'parameters_by_path': paths},
+        'calls': {'GetParameters': math.ceil(len(names) / 10),
+                  'GetParametersByPath': len(paths)}}
+
+
+def _covering(path: str, paths: typing.List[str]) -> str:
+    """Return the fetched path that the path is answered from"""
+    return next(value for value in paths if index.is_under(path, value))
+
+
+class LazyResolver:
+    """Fetches the variables requested while rendering a template that
+    were not found by discovery, adding them to the template's plan and to
+    the values fetched for the run so that each is only fetched once
+
+    """
+    def __init__(self,
+                 parameter_store: ssm.ParameterStore,
+                 plan: Plan,
+                 values: ssm.Values):
+        self._lock = threading.Lock()
+        self._parameter_store = parameter_store
+        self._requested = discovery.Variables(
+            set(plan.parameters), set(plan.parameters_by_path))
+        self._values = values
+
+    def resolve(self,
+                template_plan: TemplatePlan,
+                variables: discovery.Variables) -> ssm.Values:
+        """Fetch the variables for the template, returning its values"""
+        with self._lock:
+            template_plan.extend(variables)
+            names = set(template_plan.parameters.values()) - \
+                self._requested.parameters
+            paths = set(template_plan.parameters_by_path.values()) - \
+                self._requested.parameters_by_path
+            if names or paths:
+                LOGGER.debug('Lazily fetching %i parameters and %i paths '
+                             'for %s', len(names), len(paths),
+                             template_plan.template.destination)
+                values = self._parameter_store.fetch(
+                    names, paths, self._values.parameter_index)
+                self._values.parameters.update(values.parameters)
+                self._values.parameters_by_path.update(
+                    values.parameters_by_path)
+                self._values.parameter_index = values.parameter_index
+            self._requested.parameters.update(names)
+            self._requested.parameters_by_path.update(paths)
+            return template_plan.values(self._values)
@@ -0,0 +1,189 @@
+import cProfile
+import collections
+import contextlib
+import io
+import logging
+import os
+import pathlib
+import pstats
+import sys
+import threading
+import typing
+
+LOGGER = logging.getLogger(__name__)
+
+IMPORT = 'import'
+OTHER = 'other'
+PHASES = [IMPORT, 'discover', 'fetch', 'render', 'write', OTHER]
+
+# The phase each module's functions are counted towards, matched by prefix
+MODULES = [
+    ('ssm_ps_template.discovery', 'discover'),
+    ('ssm_ps_template.plan', 'discover'),
+    ('jinja2.lexer', 'discover'),
+    ('jinja2.parser', 'discover'),
+    ('ssm_ps_template.cache', 'fetch'),
+    ('ssm_ps_template.ssm', 'fetch'),
+    ('ssm_ps_template.throttle', 'fetch'),
+    ('ssm_ps_template.transport', 'fetch'),
+    ('asyncio', 'fetch'),
+    ('boto3', 'fetch'),
+    ('botocore', 'fetch'),
+    ('http.client', 'fetch'),
+    ('socket', 'fetch'),
+    ('ssl', 'fetch'),
+    ('urllib3', 'fetch'),
+    ('ssm_ps_template.environment', 'render'),
+    ('ssm_ps_template.render', 'render'),
+    ('jinja2', 'render'),
+    ('markupsafe', 'render'),
+    ('yaml', 'render'),
+    ('ssm_ps_template.reload', 'write'),
+    ('ssm_ps_template.writer', 'write')
+]
+
+Function = typing.Tuple[str, int, str]
+
+
+class Profiler:
+    """Profiles the calling thread and the threads it starts with cProfile,
+    so the work done by the fetch and render thread pools is included
+
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profiles: typing.List[cProfile.Profile] = []
+
+    def start(self) -> typing.NoReturn:
+        # Before Python 3.12, cProfile only profiles the thread enabling it
+        if sys.version_info < (3, 12):
+            threading.setprofile(self._start)
+        self._start()
+
+    def stop(self) -> typing.NoReturn:
+        threading.setprofile(None)
+        self._profiles[0].disable()
+
+    def stats(self) -> pstats.Stats:
+        """Return the combined statistics of every profiled thread"""
+        with self._lock:
+            profiles = list(self._profiles)
+        return pstats.Stats(*profiles, stream=io.StringIO())
+
+    def _start(self, *_args) -> typing.NoReturn:
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+
+
+@contextlib.contextmanager
+def profile(path: typing.Optional[pathlib.Path], top: int = 0) \
+        -> typing.Generator[None, None, None]:
+    """Profile the block when `path` is set, writing the statistics to it
+    for ``pstats`` or tools like snakeviz and, when `top` is set, the
+    functions that took the most time in each phase to stderr
+
+    """
+    if path is None:
+        yield
+        return
+    profiler = Profiler()
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        stats = profiler.stats()
+        stats.dump_stats(path)
+        LOGGER.info('Wrote profile to %s', path)
+        if top:
+            sys.stderr.write(summary(stats, top))
+
+
+def summary(stats: pstats.Stats, top: int) -> str:
+    """Return the `top` functions by time spent in the function itself for
+    each phase. Functions outside of the modules in ``MODULES``, like
+    builtins, are counted towards the phase of the caller they spent the
+    most time being called by.
+
+    """
+    phases = _Phases(stats.stats)
+    functions = collections.defaultdict(list)
+    for function, (_cc, calls, own, cumulative, _callers) in \
+            stats.stats.items():
+        functions[phases.get(function)].append(
+            (own, cumulative, calls, function))
+
+    lines = []
+    for phase in PHASES:
+        if not functions[phase]:
+            continue
+        rows = sorted(functions[phase], reverse=True)
+        lines += ['', f'{phase}: {sum(row[0] for row in rows):.3f} seconds',
+                  f'  {"own":>9} {"cumulative":>11} {"calls":>9}  function']
+        for own, cumulative, calls, function in rows[:top]:
+            lines.append(f'  {own:9.4f} {cumulative:11.4f} {calls:9d}  '
+                         f'{_describe(function)}')
+    return '\n'.join(lines) + '\n'
+
+
+class _Phases:
+    """Resolves the phase of each profiled function, following the most
+    expensive caller of functions that are not in ``MODULES``
+
+    """
+    def __init__(self, stats: dict):
+        self._phases: typing.Dict[Function, str] = {}
+        self._stats = stats
+
+    def get(self, function: Function) -> str:
+        chain, phase = [], None
+        while phase is None:
+            if function in self._phases:
+                phase = self._phases[function]
+                break
+            chain.append(function)
+            phase = _module_phase(function)
+            callers = self._stats.get(function, (0, 0, 0, 0, {}))[4]
+            if phase is None and not callers:
+                phase = OTHER
+            elif phase is None:
+                function = max(callers, key=lambda caller: callers[caller][3])
+                if function in chain:
+                    phase = OTHER
+        for function in chain:
+            self._phases[function] = phase
+        return phase
+
+
+def _describe(function: Function) -> str:
+    filename, line, name = function
+    if filename == '~':
+        return name
+    return f'{_relative(filename)}:{line}({name})'
+
+
+def _module_phase(function: Function) -> typing.Optional[str]:
+    filename = function[0]
+    if filename.startswith('<frozen importlib'):
+        return IMPORT
+    elif filename == '~' or filename.startswith('<'):
+        return None
+    module = os.path.splitext(_relative(filename))[0].replace(os.sep, '.')
+    for prefix, phase in MODULES:
+        if module == prefix or module.startswith(f'{prefix}.'):
+            return phase
+    return None
+
+
+def _relative(filename: str) -> str:
+    """Return the path of the file relative to the entry of ``sys.path``
+    it was imported from
+
+    """
+    for entry in sorted({os.path.abspath(path or os.curdir)
+                         for path in sys.path}, key=len, reverse=True):
+        if filename.startswith(entry.rstrip(os.sep) + os.sep):
+            return filename[len(entry.rstrip(os.sep)) + 1:]
+    return filename
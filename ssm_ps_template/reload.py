@@ -0,0 +1,38 @@
+import logging
+import os
+import pathlib
+import shlex
+import signal
+import subprocess
+import typing
+
+from ssm_ps_template import config
+
+LOGGER = logging.getLogger(__name__)
+
+
+def reload(template: config.Template) -> typing.NoReturn:
+    """Run the reload command and signal the process in the pidfile that
+    are configured for the template, logging any failures
+
+    """
+    if template.reload_command:
+        LOGGER.info('Running %r for %s',
+                    template.reload_command, template.destination)
+        try:
+            subprocess.run(shlex.split(template.reload_command), check=True)
+        except (OSError, subprocess.CalledProcessError) as err:
+            LOGGER.error('Failed to run %r: %s', template.reload_command, err)
+
+    if template.reload_signal and template.pidfile:
+        name = template.reload_signal.upper()
+        signum = getattr(signal, name if name.startswith('SIG')
+                         else f'SIG{name}')
+        try:
+            pid = int(pathlib.Path(template.pidfile).read_text().strip())
+            LOGGER.info('Sending %s to %i for %s',
+                        signum.name, pid, template.destination)
+            os.kill(pid, signum)
+        except (OSError, ValueError) as err:
+            LOGGER.error('Failed to send %s to the process in %s: %s',
+                         signum.name, template.pidfile, err)
@@ -1,114 +1,280 @@
+import collections
+import contextvars
+import functools
 import json
 import logging
 import os
 import pathlib
+import threading
 import typing
 from urllib import parse
 
-import flatdict
-import yaml
-from jinja2 import sandbox
+from ssm_ps_template import discovery, environment, lazy, ssm
 
-from ssm_ps_template import ssm
+yaml = lazy.load('yaml')
 
 LOGGER = logging.getLogger(__name__)
 
+# The maximum number of times a template is rendered to resolve values
+MAX_PASSES = 3
+
+# The renderer whose values are used by the template globals
+_renderer: contextvars.ContextVar = contextvars.ContextVar('renderer')
+
+
+_CONSTANTS = {'true': True, 'false': False, '~': None, 'null': None}
+
 
 def coerce_type(value_in: str) -> typing.Union[bool, int, None, str]:
-    if value_in.lower() in ['true', 'false']:
-        return True if value_in.lower() == 'true' else False
-    elif value_in.lower() in ['~', 'null']:
-        return None
-    elif value_in.isnumeric() and '.' not in value_in:
+    value = _CONSTANTS.get(value_in.lower(), value_in)
+    if value is value_in and value_in.isnumeric():
         return int(value_in)
-    return value_in
+    return value
 
 
 def coerce(value_in: typing.Union[dict, list]) -> typing.Union[dict, list]:
-    if isinstance(value_in, dict):
-        output = {}
-        for key, value in value_in.items():
-            new_key = key.replace('-', '_')
-            if isinstance(value, (dict, list)):
-                output[new_key] = coerce(value)
-            else:
-                output[new_key] = coerce_type(value)
-        return output
-    elif isinstance(value_in, list):
-        output = []
-        for value in value_in:
-            if isinstance(value, (dict, list)):
-                output.append(coerce(value))
-            else:
-                output.append(coerce_type(value))
-        return output
-    else:
-        raise TypeError('Method invoked with incorrect data type')
+    return _transform(value_in, _replace_dashes, _coerce_scalar)
 
 
-def path_to_dict(value: dict) -> dict:
-    flat = flatdict.FlatDict(value, delimiter='/')
-    return flat.as_dict()
+def path_to_dict(value: dict,
+                 dashes_to_underscores: bool = False,
+                 coerce_types: bool = False) -> dict:
+    """Convert a dict with forward-slash delimited keys to nested dicts,
+    optionally replacing dashes with underscores in the keys and coercing
+    the values in the same pass, like chaining the ``dashes_to_underscores``
+    and ``coerce_types`` filters
+
+    """
+    dashes = dashes_to_underscores or coerce_types
+    output = {}
+    stack = [(value, output)]
+    while stack:
+        source, target = stack.pop()
+        for name, item in source.items():
+            node = target
+            if isinstance(name, str):
+                *parents, name = \
+                    (name.replace('-', '_') if dashes else name).split('/')
+                for parent in parents:
+                    child = node.setdefault(parent, {})
+                    if not isinstance(child, dict):
+                        raise TypeError(
+                            f'Assignment to invalid type for key {parent}')
+                    node = child
+            if isinstance(item, dict):
+                node[name] = {}
+                stack.append((item, node[name]))
+            elif isinstance(item, list) and dashes:
+                node[name] = _transform(
+                    item, _replace_dashes,
+                    _coerce_scalar if coerce_types else None)
+            elif coerce_types and isinstance(item, str):
+                node[name] = coerce_type(item)
+            else:
+                node[name] = item
+    return output
 
 
 def replace_dashes_with_underscores(value_in: typing.Union[dict, list]) \
         -> typing.Union[dict, list]:
-    if isinstance(value_in, dict):
-        output = {}
-        for key, value in value_in.items():
-            new_key = key.replace('-', '_')
-            if isinstance(value, (dict, list)):
-                output[new_key] = replace_dashes_with_underscores(value)
-            else:
-                output[new_key] = value
-        return output
-    elif isinstance(value_in, list):
-        output = []
-        for value in value_in:
+    return _transform(value_in, _replace_dashes)
+
+
+def _coerce_scalar(value: typing.Any) -> typing.Any:
+    return coerce_type(value) if isinstance(value, str) else value
+
+
+def _replace_dashes(key: typing.Any) -> typing.Any:
+    return key.replace('-', '_') if isinstance(key, str) else key
+
+
+def _transform(value_in: typing.Union[dict, list],
+               key: typing.Callable[[typing.Any], typing.Any],
+               scalar: typing.Optional[
+                   typing.Callable[[typing.Any], typing.Any]] = None) \
+        -> typing.Union[dict, list]:
+    """Return a copy of the nested dicts and lists, applying `key` to the
+    keys of the dicts and `scalar` to the other values. Nested values are
+    copied from a stack instead of recursively, so deep structures do not
+    reach the recursion limit.
+
+    """
+    if not isinstance(value_in, (dict, list)):
+        raise TypeError('Method invoked with incorrect data type')
+    output = {} if isinstance(value_in, dict) else []
+    stack = [(value_in, output)]
+    while stack:
+        source, target = stack.pop()
+        is_dict = isinstance(source, dict)
+        for name, value in source.items() if is_dict else enumerate(source):
             if isinstance(value, (dict, list)):
-                output.append(replace_dashes_with_underscores(value))
+                child = {} if isinstance(value, dict) else []
+                stack.append((value, child))
+                value = child
+            elif scalar:
+                value = scalar(value)
+            if is_dict:
+                target[key(name)] = value
             else:
-                output.append(value)
-        return output
-    else:
-        raise TypeError('Method invoked with incorrect data type')
+                target.append(value)
+    return output
+
+
+class _Memo:
+    """Caches the results of the data structure filters keyed on the
+    identity of the value they are applied to, so a filter chain applied
+    to the same ``get_parameters_by_path`` result by several templates is
+    only computed once. The values are kept with the results so their ids
+    are not reused while they are cached, and the sandbox does not allow
+    templates to modify either.
+
+    """
+    def __init__(self, max_entries: int = 256):
+        self._entries: collections.OrderedDict = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._max_entries = max_entries
+
+    def clear(self) -> typing.NoReturn:
+        with self._lock:
+            self._entries.clear()
+
+    def wrap(self, function: typing.Callable) -> typing.Callable:
+        """Return the filter function, memoized"""
+        @functools.wraps(function)
+        def wrapper(value, *args, **kwargs):
+            if not isinstance(value, (dict, list)):
+                return function(value, *args, **kwargs)
+            key = (function, id(value), args, tuple(sorted(kwargs.items())))
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] is value:
+                    self._entries.move_to_end(key)
+                    return entry[1]
+            result = function(value, *args, **kwargs)
+            with self._lock:
+                self._entries[key] = value, result
+                self._entries.move_to_end(key)
+                while len(self._entries) > self._max_entries:
+                    self._entries.popitem(last=False)
+            return result
+        return wrapper
+
+
+_memo = _Memo()
+
+
+class Output(typing.Protocol):
+    """The destination a template is streamed to"""
+
+    def reset(self) -> typing.NoReturn:
+        ...
+
+    def write(self, content: str) -> typing.NoReturn:
+        ...
+
+
+class _Buffer(list):
+    """Collects the output of a template in memory"""
+    reset = list.clear
+    write = list.append
 
 
 class Renderer:
+    """Renders a template with the values fetched for it.
+
+    When a `resolver` is passed, the values the template asks for that
+    are not in the values are collected while rendering, fetched in one
+    batch by the resolver, and the template is rendered again with them.
+    The `planned` variables were already fetched, so those missing from
+    the values do not exist and are not resolved. The `context` is passed
+    to the template as variables, along with ``environ``.
 
-    def __init__(self, source: pathlib.Path):
-        with source.open('r') as handle:
-            self._source = handle.read()
+    """
+    def __init__(self,
+                 source: pathlib.Path,
+                 resolver: typing.Optional[
+                     typing.Callable[[discovery.Variables],
+                                     ssm.Values]] = None,
+                 context: typing.Optional[dict] = None,
+                 planned: typing.Optional[discovery.Variables] = None):
+        self._context = {'environ': os.environ, **(context or {})}
+        self._name = environment.template_name(source)
+        self._resolver = resolver
+        self._missing = discovery.Variables(set(), set())
+        self._requested = discovery.Variables(
+            set(planned.parameters), set(planned.parameters_by_path)) \
+            if planned else discovery.Variables(set(), set())
         self._values: typing.Optional[ssm.Values] = None
 
     def render(self, values: ssm.Values) -> str:
-        """Render the template to the internal buffer"""
+        """Render the template, returning the output"""
+        output = _Buffer()
+        self.stream(output, values)
+        return ''.join(output)
+
+    def stream(self, output: 'Output', values: ssm.Values) -> typing.NoReturn:
+        """Render the template to the output as it is generated, so the
+        whole output is never held in memory. The output is reset when the
+        template is rendered again to resolve values.
+
+        """
         self._values = values
-        environment = sandbox.ImmutableSandboxedEnvironment()
-        environment.filters['coerce_types'] = coerce
-        environment.filters['dashes_to_underscores'] = \
-            replace_dashes_with_underscores
-        environment.filters['fromjson'] = lambda v: json.loads(v)
-        environment.filters['fromyaml'] = lambda v: yaml.safe_load(v)
-        environment.filters['path_to_dict'] = path_to_dict
-        environment.filters['toyaml'] = lambda v: yaml.safe_dump(v)
-        environment.globals['get_parameter'] = self._get_parameter
-        environment.globals['get_parameters_by_path'] = \
-            self._get_parameters_by_path
-        environment.globals['parse_qs'] = parse.parse_qs
-        environment.globals['unquote'] = parse.unquote
-        environment.globals['urlparse'] = parse.urlparse
-        return environment.from_string(self._source).render(
-            **{'environ': os.environ})
+        template = _environment().get_template(self._name)
+        token = _renderer.set(self)
+        try:
+            for offset in range(MAX_PASSES):
+                if offset:
+                    output.reset()
+                self._missing = discovery.Variables(set(), set())
+                for chunk in template.generate(**self._context):
+                    output.write(chunk)
+                if self._resolver is None or \
+                        self._missing == discovery.Variables(set(), set()):
+                    break
+                self._values = self._resolver(self._missing)
+        finally:
+            _renderer.reset(token)
 
     def _get_parameter(self,
                        key: str,
                        default: typing.Optional[str] = None) \
             -> typing.Optional[str]:
+        if key not in self._values.parameters and \
+                key not in self._requested.parameters:
+            self._missing.parameters.add(key)
+            self._requested.parameters.add(key)
         return self._values.parameters.get(key, default)
 
     def _get_parameters_by_path(self,
                                 path: str,
                                 default: typing.Optional[dict] = None) \
             -> typing.Optional[dict]:
+        if path not in self._values.parameters_by_path and \
+                path not in self._requested.parameters_by_path:
+            self._missing.parameters_by_path.add(path)
+            self._requested.parameters_by_path.add(path)
         return self._values.parameters_by_path.get(path, default)
+
+
+def _environment() -> environment.Environment:
+    """Return the shared environment, registering the filters and globals
+    the first time it is used
+
+    """
+    env = environment.get()
+    if 'get_parameter' not in env.globals:
+        env.filters['coerce_types'] = _memo.wrap(coerce)
+        env.filters['dashes_to_underscores'] = \
+            _memo.wrap(replace_dashes_with_underscores)
+        env.filters['fromjson'] = lambda v: json.loads(v)
+        env.filters['fromyaml'] = lambda v: yaml.safe_load(v)
+        env.filters['path_to_dict'] = _memo.wrap(path_to_dict)
+        env.filters['toyaml'] = lambda v: yaml.safe_dump(v)
+        env.globals['get_parameter'] = lambda *args, **kwargs: \
+            _renderer.get()._get_parameter(*args, **kwargs)
+        env.globals['get_parameters_by_path'] = lambda *args, **kwargs: \
+            _renderer.get()._get_parameters_by_path(*args, **kwargs)
+        env.globals['parse_qs'] = parse.parse_qs
+        env.globals['unquote'] = parse.unquote
+        env.globals['urlparse'] = parse.urlparse
+    return env
@@ -0,0 +1,115 @@
+import base64
+import dataclasses
+import gzip
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import time
+import typing
+
+from ssm_ps_template import ssm, writer
+
+try:
+    from cryptography import fernet
+except ImportError:  # pragma: nocover
+    fernet = None
+
+LOGGER = logging.getLogger(__name__)
+
+KEY_ENV_VAR = 'SSM_PS_TEMPLATE_SNAPSHOT_KEY'
+VERSION = 1
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+@dataclasses.dataclass
+class Snapshot:
+    values: ssm.Values
+    missing: typing.Set[str]
+    created_at: float
+
+    def absent(self,
+               names: typing.Iterable[str],
+               paths: typing.Iterable[str]) -> typing.List[str]:
+        """Return the names and paths that were not fetched for the
+        snapshot, as opposed to those that did not exist when it was taken
+
+        """
+        absent = [name for name in names
+                  if name not in self.values.parameters]
+        absent = [name for name in absent if name not in self.missing]
+        absent += [path for path in paths
+                   if path not in self.values.parameters_by_path]
+        return sorted(absent)
+
+
+def dump(path: pathlib.Path,
+         values: ssm.Values,
+         missing: typing.Iterable[str] = (),
+         key: typing.Optional[str] = None) -> writer.Status:
+    """Write the values to a gzip compressed JSON snapshot that is only
+    readable by its owner, encrypting it with a key derived from `key` when
+    it is set. `missing` are the names that were fetched but do not exist.
+
+    """
+    content = gzip.compress(json.dumps({
+        'version': VERSION,
+        'created_at': time.time(),
+        'parameters': values.parameters,
+        'parameters_by_path': values.parameters_by_path,
+        'missing': sorted(missing)},
+        separators=(',', ':'), sort_keys=True).encode('utf-8'), mtime=0)
+    if key:
+        content = _fernet(key).encrypt(content)
+    return writer.write(path, content, 0o600)
+
+
+def load(path: pathlib.Path, key: typing.Optional[str] = None) -> Snapshot:
+    """Read a snapshot written by ``dump``, raising ``SnapshotError`` if it
+    can not be read or decrypted
+
+    """
+    try:
+        content = path.read_bytes()
+    except OSError as err:
+        raise SnapshotError(f'Failed to read {path}: {err}')
+    if not content.startswith(GZIP_MAGIC):
+        if not key:
+            raise SnapshotError(f'{path} is encrypted and no key is set')
+        try:
+            content = _fernet(key).decrypt(content)
+        except fernet.InvalidToken:
+            raise SnapshotError(f'Failed to decrypt {path}')
+    try:
+        data = json.loads(gzip.decompress(content))
+    except (OSError, EOFError, ValueError) as err:
+        raise SnapshotError(f'Invalid snapshot {path}: {err}')
+    if data.get('version') != VERSION:
+        raise SnapshotError(f'Unsupported snapshot version in {path}')
+    return Snapshot(
+        values=ssm.Values(data['parameters'], data['parameters_by_path']),
+        missing=set(data['missing']),
+        created_at=data['created_at'])
+
+
+def load_key(key_file: typing.Optional[str] = None) -> typing.Optional[str]:
+    """Return the snapshot encryption key from the environment or key file"""
+    if os.environ.get(KEY_ENV_VAR):
+        return os.environ[KEY_ENV_VAR]
+    if key_file:
+        return pathlib.Path(key_file).read_text().strip()
+    return None
+
+
+def _fernet(key: str):
+    if fernet is None:
+        raise SnapshotError(
+            'cryptography is required to encrypt and decrypt snapshots')
+    return fernet.Fernet(base64.urlsafe_b64encode(
+        hashlib.sha256(key.encode('utf-8')).digest()))
+
+
+class SnapshotError(Exception):
+    pass
@@ -1,89 +1,396 @@
+import asyncio
 import dataclasses
+import functools
 import logging
+import threading
+import time
 import typing
 
-import boto3
-from botocore import exceptions
+from ssm_ps_template import (cache, discovery, index, lazy, metrics,
+                             throttle, transport)
 
-from ssm_ps_template import discovery
+boto3 = lazy.load('boto3')
+config = lazy.load('botocore.config')
+exceptions = lazy.load('botocore.exceptions')
 
 LOGGER = logging.getLogger(__name__)
 
+# The default number of connections botocore keeps open
+MAX_POOL_CONNECTIONS = 10
+
+THROTTLING_ERRORS = {'ThrottlingException', 'Throttling',
+                     'TooManyRequestsException', 'RequestLimitExceeded'}
+
 
 @dataclasses.dataclass
 class Values:
     parameters: typing.Dict[str, str]
     parameters_by_path: typing.Dict[str, typing.Dict[str, str]]
+    # The index of the fetched parameters, set by ParameterStore.fetch to
+    # answer later fetches in the run. It is not a field, so it is not
+    # compared or included by dataclasses.asdict
+    parameter_index: typing.ClassVar[typing.Optional[index.Index]] = None
 
+    def subset(self,
+               parameters: typing.Dict[str, str],
+               parameters_by_path: typing.Dict[str, str]) -> 'Values':
+        """Return the values for the variable to fully-qualified name maps,
+        keyed by the variable names
 
-class ParameterStore:
+        """
+        return Values(
+            {key: self.parameters[name]
+             for key, name in parameters.items()
+             if name in self.parameters},
+            {key: self.parameters_by_path.get(name, {})
+             for key, name in parameters_by_path.items()})
 
+
+class AsyncParameterStore:
+    """Fetches values from SSM Parameter Store on an asyncio event loop.
+    The calls for batches of names and for each path, including its pages,
+    run concurrently, up to `max_concurrency` at a time. The ``http``
+    transport sends them from the event loop, while boto3 calls are run in
+    a thread pool. `connect_timeout` and `read_timeout` bound each call.
+
+    """
     def __init__(self,
                  profile: typing.Optional[str] = None,
                  region: typing.Optional[str] = None,
-                 endpoint_url: typing.Optional[str] = None):
-        self._session = boto3.Session(profile_name=profile, region_name=region)
-        self._client = self._session.client('ssm', endpoint_url=endpoint_url)
-        self._ssm = boto3.client('ssm')
+                 endpoint_url: typing.Optional[str] = None,
+                 max_concurrency: int = 1,
+                 rate_limit: typing.Optional[float] = None,
+                 max_retries: int = 5,
+                 parameter_cache: typing.Optional[
+                     cache.ParameterCache] = None,
+                 incremental: bool = False,
+                 transport: str = 'boto3',
+                 client_config: typing.Optional[dict] = None,
+                 connect_timeout: typing.Optional[float] = None,
+                 read_timeout: typing.Optional[float] = None):
+        self._cache = parameter_cache
+        self._client = None
+        self._client_config = client_config or {}
+        self._connect_timeout = connect_timeout
+        self._endpoint_url = endpoint_url
+        self._incremental = incremental and parameter_cache is not None
+        self._lock = threading.Lock()
+        self._max_concurrency = max(max_concurrency, 1)
+        self._profile = profile
+        self._rate_controller = throttle.RateController(
+            rate_limit, max_retries, _is_throttling_error,
+            _is_transient_error)
+        self._read_timeout = read_timeout
+        self._region = region
+        self._transport = transport
 
-    def fetch_variables(self,
-                        variables: discovery.Variables,
-                        prefix: str,
-                        replace_underscores: bool) -> Values:
+    async def fetch_variables(self,
+                              variables: discovery.Variables,
+                              prefix: str,
+                              replace_underscores: bool) -> Values:
+        """Fetch the values for the variables discovered in a template,
+        keyed by the variable names used in the template
+
+        """
+        parameters = build_names(
+            variables.parameters, prefix, replace_underscores)
+        parameters_by_path = build_names(
+            variables.parameters_by_path, prefix, replace_underscores)
+        values = await self.fetch(
+            parameters.values(), parameters_by_path.values())
+        return values.subset(parameters, parameters_by_path)
+
+    async def fetch(self,
+                    names: typing.Iterable[str],
+                    paths: typing.Iterable[str],
+                    parameter_index: typing.Optional[index.Index] = None,
+                    timeout: typing.Optional[float] = None) -> Values:
+        """Fetch the fully-qualified parameter names and paths, each only
+        once, keyed by the fully-qualified name.
+
+        Paths under another path are only fetched at the shortest one, and
+        names and paths under a fetched path are answered from the index
+        of the fetched parameters, including those already in
+        `parameter_index`. When the fetch takes longer than `timeout`
+        seconds, the calls in flight are cancelled and
+        ``DeadlineExceeded`` is raised.
+
+        """
+        fetch = self._fetch(
+            sorted(set(names)), sorted(set(paths)),
+            parameter_index if parameter_index is not None
+            else index.Index())
         try:
-            return self._fetch_variables(
-                variables, prefix, replace_underscores)
-        except (exceptions.ClientError,
-                exceptions.UnauthorizedSSOTokenError) as err:
+            return await asyncio.wait_for(fetch, timeout)
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(
+                f'Fetching did not finish within {timeout} seconds')
+        except (exceptions.BotoCoreError,
+                exceptions.ClientError,
+                OSError) as err:
             raise SSMClientException(str(err))
 
-    def _fetch_variables(self,
-                         variables: discovery.Variables,
-                         prefix: str,
-                         replace_underscores: bool) -> Values:
-        values = Values({}, {})
+    def close(self) -> typing.NoReturn:
+        """Close the connections and threads used to call SSM Parameter
+        Store
 
-        names, name_map = self._build_names(
-            variables.parameters, prefix, replace_underscores)
+        """
+        if isinstance(self._client, transport.AsyncClient):
+            self._client.close()
+
+    @property
+    def retries(self) -> int:
+        """The number of calls that were retried after being throttled or
+        failing with a server or connection error
+
+        """
+        return self._rate_controller.retries
 
+    async def _fetch(self,
+                     names: typing.List[str],
+                     paths: typing.List[str],
+                     parameter_index: index.Index) -> Values:
+        requested = discovery.Variables(set(names), set(paths))
+        names, paths = parameter_index.plan(names, paths)
+        LOGGER.debug('Answering %i parameters and %i paths from fetched paths',
+                     len(requested.parameters) - len(names),
+                     len(requested.parameters_by_path) - len(paths))
+        parameters, by_path = self._from_cache(names, paths)
+        hits = set(parameters) | set(by_path)
+        if self._incremental:
+            await self._refresh(
+                [name for name in names if name not in parameters],
+                [path for path in paths if path not in by_path],
+                parameters, by_path)
+        names = [name for name in names if name not in parameters]
+        paths = [path for path in paths if path not in by_path]
+
+        batches = _batches(names, 10)
         LOGGER.debug('Fetching Parameters %r', names)
-        while names:
-            response = self._client.get_parameters(
-                Names=names[:10], WithDecryption=True)
-            for param in response['Parameters']:
-                values.parameters[name_map[param['Name']]] = \
-                    self._parameter_value(param)
-            names = names[10:]
-
-        names, name_map = self._build_names(
-            variables.parameters_by_path, prefix, replace_underscores)
-        for key in name_map.values():
-            values.parameters_by_path[key] = {}
+        LOGGER.debug('Fetching Parameters By Path %r', paths)
+        semaphore = asyncio.Semaphore(self._max_concurrency)
 
-        LOGGER.debug('Fetching Parameters By Path %r', names)
-        paginator = self._client.get_paginator('get_parameters_by_path')
+        async def run(method: typing.Callable, argument: typing.Any):
+            async with semaphore:
+                return await method(argument)
+
+        # Results are merged in submission order to keep it deterministic
+        results = await asyncio.gather(
+            *[run(self._get_parameters, batch) for batch in batches],
+            *[run(self._get_parameters_by_path, path) for path in paths])
+        LOGGER.debug('Fetched with %i calls and %i retries',
+                     self._rate_controller.calls,
+                     self._rate_controller.retries)
+
+        for batch, result in zip(batches, results[:len(batches)]):
+            parameters.update({name: result.get(name) for name in batch})
+        for path, result in zip(paths, results[len(batches):]):
+            by_path[path] = result
+        # Cache hits are not written back, so they keep their expiry
+        self._to_cache(
+            {name: parameter for name, parameter in parameters.items()
+             if name not in hits},
+            {path: path_parameters for path, path_parameters
+             in by_path.items() if path not in hits})
+
+        for name, parameter in parameters.items():
+            if parameter is not None:
+                parameter_index.add(name, parameter)
+        for path, path_parameters in by_path.items():
+            parameter_index.add_path(path, path_parameters)
+
+        values = Values({}, {})
+        values.parameter_index = parameter_index
+        for name in sorted(requested.parameters):
+            parameter = parameter_index.get(name)
+            if parameter is not None:
+                values.parameters[name] = self._parameter_value(parameter)
+        for path in sorted(requested.parameters_by_path):
+            values.parameters_by_path[path] = {
+                name[len(path):]: self._parameter_value(param)
+                for name, param in parameter_index.under(path).items()}
+        return values
+
+    async def _call(self, method: str, **kwargs) -> dict:
+        client = self._get_client()
+        function, attempts = getattr(client, method), 0
+
+        async def attempt(**values) -> dict:
+            nonlocal attempts
+            attempts += 1
+            if isinstance(client, transport.AsyncClient):
+                return await function(**values)
+            return await _in_thread(functools.partial(function, **values))
+
+        start = time.monotonic()
+        response = await self._rate_controller.call_async(attempt, **kwargs)
+        # Calls for paths are recorded per page
+        labels = {'path': kwargs['Path']} if 'Path' in kwargs else {}
+        metrics.get().api_call(
+            ''.join(word.title() for word in method.split('_')),
+            time.monotonic() - start, len(response.get('Parameters', [])),
+            attempts - 1, **labels)
+        return response
+
+    def _get_client(self):
+        """Create the client when it is first used, so runs answered from
+        the cache do not pay for creating it
+
+        """
+        with self._lock:
+            if self._client is None:
+                if self._transport == 'http':
+                    timeouts = {'timeout': self._read_timeout} \
+                        if self._read_timeout else {}
+                    self._client = transport.AsyncClient(
+                        self._profile, self._region, self._endpoint_url,
+                        connect_timeout=self._connect_timeout, **timeouts)
+                else:
+                    session = boto3.Session(
+                        profile_name=self._profile, region_name=self._region)
+                    self._client = session.client(
+                        'ssm', endpoint_url=self._endpoint_url,
+                        config=self._botocore_config())
+            return self._client
+
+    def _from_cache(self, names: typing.List[str], paths: typing.List[str]) \
+            -> typing.Tuple[typing.Dict[str, typing.Optional[dict]],
+                            typing.Dict[str, typing.Dict[str, dict]]]:
+        parameters, by_path = {}, {}
+        if self._cache is None:
+            return parameters, by_path
+        for name in names:
+            try:
+                parameters[name] = self._cache.get_parameter(name)
+            except KeyError:
+                pass
+        for path in paths:
+            try:
+                by_path[path] = self._cache.get_path(path)
+            except KeyError:
+                pass
+        LOGGER.debug('Found %i parameters and %i paths in the cache',
+                     len(parameters), len(by_path))
+        return parameters, by_path
+
+    async def _refresh(self,
+                       names: typing.List[str],
+                       paths: typing.List[str],
+                       parameters: typing.Dict[str, typing.Optional[dict]],
+                       by_path: typing.Dict[str, typing.Dict[str, dict]]) \
+            -> typing.NoReturn:
+        """Use the parameter metadata to reuse expired cache entries whose
+        version has not changed, adding them to `parameters` and `by_path`
+
+        """
+        reused, expired = 0, {}
         for name in names:
-            for page in paginator.paginate(
-                    Path=name, Recursive=True, WithDecryption=True):
+            try:
+                expired[name] = self._cache.get_parameter(name, True)
+            except KeyError:
+                pass
+        if expired:
+            versions = await self._describe_parameters(
+                [{'Key': 'Name', 'Option': 'Equals', 'Values': batch}
+                 for batch in _batches(list(expired), 50)])
+            for name, parameter in expired.items():
+                version = parameter.get('Version') if parameter else None
+                if version == versions.get(name):
+                    parameters[name] = parameter
+                    reused += 1
+
+        for path in paths:
+            try:
+                cached = self._cache.get_path(path, True)
+            except KeyError:
+                continue
+            versions = await self._describe_parameters(
+                [{'Key': 'Path', 'Option': 'Recursive',
+                  'Values': [path.rstrip('/') or '/']}])
+            unchanged = {name: parameter
+                         for name, parameter in cached.items()
+                         if parameter.get('Version') == versions.get(name)}
+            changed = sorted(set(versions) - set(unchanged))
+            # Refetching the whole path is cheaper if most of it changed
+            if len(changed) > len(versions) / 2:
+                continue
+            for batch in _batches(changed, 10):
+                unchanged.update(await self._get_parameters(batch))
+            reused += len(versions) - len(changed)
+            by_path[path] = {name: unchanged[name]
+                             for name in sorted(unchanged)}
+        LOGGER.debug('Reused %i expired parameters with unchanged versions',
+                     reused)
+
+    def _botocore_config(self) -> 'config.Config':
+        """Build the client configuration, sizing the connection pool so
+        that concurrent requests do not wait for connections
+
+        """
+        settings = {
+            'max_pool_connections': max(
+                self._max_concurrency, MAX_POOL_CONNECTIONS),
+            'tcp_keepalive': True}
+        if self._connect_timeout:
+            settings['connect_timeout'] = self._connect_timeout
+        if self._read_timeout:
+            settings['read_timeout'] = self._read_timeout
+        settings.update(self._client_config)
+        # Throttling, server and connection errors are retried by the rate
+        # controller instead of botocore
+        settings['retries'] = {'total_max_attempts': 1}
+        return config.Config(**settings)
+
+    async def _describe_parameters(self, filters: typing.List[dict]) \
+            -> typing.Dict[str, int]:
+        """Return the current version of the parameters matching each of
+        the filters, keyed by name
+
+        """
+        versions = {}
+        for parameter_filter in filters:
+            kwargs = {}
+            while True:
+                page = await self._call(
+                    'describe_parameters',
+                    ParameterFilters=[parameter_filter], **kwargs)
                 for param in page['Parameters']:
-                    key = param['Name'][len(name):]
-                    values.parameters_by_path[name_map[name]][key] = \
-                        self._parameter_value(param)
+                    versions[param['Name']] = param['Version']
+                if not page.get('NextToken'):
+                    break
+                kwargs['NextToken'] = page['NextToken']
+        return versions
 
-        return values
+    def _to_cache(self,
+                  parameters: typing.Dict[str, typing.Optional[dict]],
+                  by_path: typing.Dict[str, typing.Dict[str, dict]]) \
+            -> typing.NoReturn:
+        if self._cache is None:
+            return
+        for name, parameter in parameters.items():
+            self._cache.set_parameter(name, parameter)
+        for path, path_parameters in by_path.items():
+            self._cache.set_path(path, path_parameters)
+        self._cache.save()
 
-    @staticmethod
-    def _build_names(variables: set,
-                     prefix: str,
-                     replace_underscores: bool) \
-            -> typing.Tuple[typing.List[str], typing.Dict[str, str]]:
-        names, name_map = [], {}
-        for param in variables:
-            value = param.replace('_', '-') if replace_underscores else param
-            name = value if value.startswith('/') else f'{prefix}/{value}'
-            name_map[name] = param
-            names.append(name)
-        return names, name_map
+    async def _get_parameters(self, names: typing.List[str]) \
+            -> typing.Dict[str, dict]:
+        response = await self._call(
+            'get_parameters', Names=names, WithDecryption=True)
+        return {param['Name']: param for param in response['Parameters']}
+
+    async def _get_parameters_by_path(self, path: str) \
+            -> typing.Dict[str, dict]:
+        parameters, kwargs = {}, {}
+        while True:
+            page = await self._call(
+                'get_parameters_by_path', Path=path, Recursive=True,
+                WithDecryption=True, **kwargs)
+            for param in page['Parameters']:
+                parameters[param['Name']] = param
+            if not page.get('NextToken'):
+                return parameters
+            kwargs['NextToken'] = page['NextToken']
 
     @staticmethod
     def _parameter_value(parameter: dict) \
@@ -93,5 +400,137 @@ class ParameterStore:
         return parameter['Value'].rstrip()
 
 
+class ParameterStore:
+    """Synchronous interface to ``AsyncParameterStore``, taking the same
+    arguments. Each fetch runs on an event loop owned by the store, so the
+    connections opened by a fetch are reused by the next. It can not be
+    used from a thread that is running an event loop; use
+    ``AsyncParameterStore`` there instead.
+
+    """
+    def __init__(self, *args, **kwargs):
+        self._engine = AsyncParameterStore(*args, **kwargs)
+        self._lock = threading.Lock()
+        self._loop: typing.Optional[asyncio.AbstractEventLoop] = None
+
+    def fetch_variables(self,
+                        variables: discovery.Variables,
+                        prefix: str,
+                        replace_underscores: bool) -> Values:
+        """Fetch the values for the variables discovered in a template,
+        keyed by the variable names used in the template
+
+        """
+        return self._run(self._engine.fetch_variables(
+            variables, prefix, replace_underscores))
+
+    def fetch(self,
+              names: typing.Iterable[str],
+              paths: typing.Iterable[str],
+              parameter_index: typing.Optional[index.Index] = None,
+              timeout: typing.Optional[float] = None) -> Values:
+        """Fetch the fully-qualified parameter names and paths, as
+        ``AsyncParameterStore.fetch`` does
+
+        """
+        return self._run(self._engine.fetch(
+            names, paths, parameter_index, timeout))
+
+    def close(self) -> typing.NoReturn:
+        """Close the connections, threads, and event loop of the store"""
+        with self._lock:
+            self._engine.close()
+            if self._loop is not None:
+                self._loop.close()
+                self._loop = None
+
+    @property
+    def retries(self) -> int:
+        """The number of calls that were retried after being throttled or
+        failing with a server or connection error
+
+        """
+        return self._engine.retries
+
+    def _run(self, coroutine: typing.Coroutine) -> typing.Any:
+        # Fetches from other threads, like lazy resolvers, wait their turn
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+            return self._loop.run_until_complete(coroutine)
+
+
+def build_names(variables: typing.Iterable[str],
+                prefix: str,
+                replace_underscores: bool) -> typing.Dict[str, str]:
+    """Map the variable names used in a template to their fully-qualified
+    SSM Parameter Store names
+
+    """
+    names = {}
+    for param in variables:
+        value = param.replace('_', '-') if replace_underscores else param
+        names[param] = value if value.startswith('/') else f'{prefix}/{value}'
+    return names
+
+
+def _batches(values: typing.List[str], size: int) \
+        -> typing.List[typing.List[str]]:
+    return [values[offset:offset + size]
+            for offset in range(0, len(values), size)]
+
+
+def _in_thread(function: typing.Callable) -> asyncio.Future:
+    """Run a blocking call in a daemon thread, so calls abandoned when the
+    fetch deadline passes do not keep the process from exiting
+
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def run() -> None:
+        try:
+            settle = functools.partial(_settle, future, function(), None)
+        except Exception as err:
+            settle = functools.partial(_settle, future, None, err)
+        try:
+            loop.call_soon_threadsafe(settle)
+        except RuntimeError:  # The loop was closed after the deadline
+            pass
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+def _settle(future: asyncio.Future,
+            result: typing.Any,
+            err: typing.Optional[Exception]) -> None:
+    if future.cancelled():
+        return
+    if err is not None:
+        future.set_exception(err)
+    else:
+        future.set_result(result)
+
+
+def _is_throttling_error(err: Exception) -> bool:
+    return isinstance(err, exceptions.ClientError) and \
+        err.response.get('Error', {}).get('Code') in THROTTLING_ERRORS
+
+
+def _is_transient_error(err: Exception) -> bool:
+    """Server errors and failed connections are worth retrying"""
+    if isinstance(err, exceptions.ClientError):
+        status = err.response.get('ResponseMetadata', {}).get(
+            'HTTPStatusCode', 0)
+        return status >= 500
+    return isinstance(err, (exceptions.ConnectionError,
+                            exceptions.HTTPClientError, ConnectionError))
+
+
 class SSMClientException(Exception):
     pass
+
+
+class DeadlineExceeded(SSMClientException):
+    pass
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+import typing
+
+LOGGER = logging.getLogger(__name__)
+
+ADDITIVE_INCREASE = 0.5
+BASE_DELAY = 0.1
+MAX_DELAY = 10.0
+MINIMUM_RATE = 0.5
+MULTIPLICATIVE_DECREASE = 0.5
+
+
+class TokenBucket:
+    """Token bucket, refilled at `rate` tokens per second. A rate
+    of ``None`` does not limit the number of requests.
+
+    """
+    def __init__(self, rate: typing.Optional[float] = None):
+        self._lock = threading.Lock()
+        self._rate = rate
+        self._tokens = max(rate or 0, 1.0)
+        self._updated_at = time.monotonic()
+
+    @property
+    def rate(self) -> typing.Optional[float]:
+        return self._rate
+
+    @rate.setter
+    def rate(self, value: float) -> typing.NoReturn:
+        with self._lock:
+            self._refill()
+            self._rate = value
+            self._tokens = min(self._tokens, max(value, 1.0))
+
+    async def acquire_async(self) -> typing.NoReturn:
+        """Wait for a token to be available without blocking the event
+        loop and consume it
+
+        """
+        if self._rate is None:
+            return
+        delay = self._take()
+        while delay:
+            await asyncio.sleep(delay)
+            delay = self._take()
+
+    def _take(self) -> float:
+        """Consume a token, returning 0, or return the seconds until one is
+        available
+
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self._rate
+
+    def _refill(self) -> typing.NoReturn:
+        now = time.monotonic()
+        self._tokens = min(
+            self._tokens + (now - self._updated_at) * self._rate,
+            max(self._rate, 1.0))
+        self._updated_at = now
+
+
+class RateController:
+    """Rate limits calls with a token bucket, retrying throttled and
+    transient errors with jittered exponential backoff and adjusting the
+    rate on throttling using additive increase, multiplicative decrease
+    (AIMD).
+
+    """
+    def __init__(self,
+                 rate: typing.Optional[float] = None,
+                 max_retries: int = 5,
+                 is_throttle: typing.Optional[
+                     typing.Callable[[Exception], bool]] = None,
+                 is_transient: typing.Optional[
+                     typing.Callable[[Exception], bool]] = None):
+        self.bucket = TokenBucket(rate)
+        self.calls = 0
+        self.retries = 0
+        self._is_throttle = is_throttle or (lambda _err: False)
+        self._is_transient = is_transient or (lambda _err: False)
+        self._lock = threading.Lock()
+        self._max_rate = rate
+        self._max_retries = max_retries
+
+    async def call_async(self,
+                         method: typing.Callable[..., typing.Awaitable],
+                         **kwargs) -> typing.Any:
+        """Await the coroutine function, retrying on throttling and
+        transient errors without blocking the event loop
+
+        """
+        attempt = 0
+        while True:
+            await self.bucket.acquire_async()
+            with self._lock:
+                self.calls += 1
+            try:
+                result = await method(**kwargs)
+            except Exception as err:
+                await asyncio.sleep(self._retry_delay(err, attempt))
+                attempt += 1
+            else:
+                self._on_success()
+                return result
+
+    def _retry_delay(self, err: Exception, attempt: int) -> float:
+        """Return the jittered delay before retrying a throttled or failed
+        call, re-raising the error if it can not be retried
+
+        """
+        throttled = self._is_throttle(err)
+        if attempt >= self._max_retries \
+                or not (throttled or self._is_transient(err)):
+            raise err
+        with self._lock:
+            self.retries += 1
+        if throttled:
+            self._on_throttle()
+        delay = random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+        LOGGER.debug('%s, retrying in %0.2f seconds',
+                     'Throttled' if throttled else err, delay)
+        return delay
+
+    def _on_success(self) -> typing.NoReturn:
+        if self._max_rate is None or self.bucket.rate >= self._max_rate:
+            return
+        self.bucket.rate = min(
+            self._max_rate, self.bucket.rate + ADDITIVE_INCREASE)
+
+    def _on_throttle(self) -> typing.NoReturn:
+        if self._max_rate is not None:
+            self.bucket.rate = max(
+                MINIMUM_RATE, self.bucket.rate * MULTIPLICATIVE_DECREASE)
+            LOGGER.debug('Reduced request rate to %0.2f requests per second',
+                         self.bucket.rate)
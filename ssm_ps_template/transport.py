@@ -0,0 +1,284 @@
+import asyncio
+import dataclasses
+import datetime
+import hashlib
+import hmac
+import json
+import logging
+import os
+import ssl
+import threading
+import typing
+from urllib import parse
+
+from ssm_ps_template import lazy
+
+exceptions = lazy.load('botocore.exceptions')
+session = lazy.load('botocore.session')
+
+LOGGER = logging.getLogger(__name__)
+
+ALGORITHM = 'AWS4-HMAC-SHA256'
+CONTENT_TYPE = 'application/x-amz-json-1.1'
+SERVICE = 'ssm'
+TARGET_PREFIX = 'AmazonSSM'
+
+
+@dataclasses.dataclass
+class Credentials:
+    access_key: str
+    secret_key: str
+    token: typing.Optional[str] = None
+
+
+class Client:
+    """Signs SSM Parameter Store requests with AWS Signature Version 4,
+    avoiding the cost of loading botocore's service model. Requests are
+    sent by ``AsyncClient``.
+
+    Credentials are taken from the environment, falling back to botocore's
+    credential chain when they are not set or a profile is specified.
+
+    """
+    def __init__(self,
+                 profile: typing.Optional[str] = None,
+                 region: typing.Optional[str] = None,
+                 endpoint_url: typing.Optional[str] = None,
+                 timeout: float = 60):
+        self._lock = threading.Lock()
+        self._profile = profile
+        self._credentials: typing.Optional[Credentials] = None
+        self._botocore_credentials = None
+        self._region = region or _environ('AWS_REGION', 'AWS_DEFAULT_REGION')
+        if not self._region:
+            self._region = self._session().get_config_variable('region')
+        self._timeout = timeout
+        self._url = parse.urlsplit(
+            endpoint_url or f'https://ssm.{self._region}.amazonaws.com')
+
+    def sign(self,
+             credentials: Credentials,
+             operation: str,
+             body: bytes,
+             now: datetime.datetime) -> typing.Dict[str, str]:
+        """Return the headers for the request, including the Signature
+        Version 4 ``Authorization`` header
+
+        """
+        amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+        headers = {'Content-Type': CONTENT_TYPE,
+                   'Host': self._url.netloc,
+                   'X-Amz-Date': amz_date,
+                   'X-Amz-Target': f'{TARGET_PREFIX}.{operation}'}
+        if credentials.token:
+            headers['X-Amz-Security-Token'] = credentials.token
+        names = sorted(headers, key=str.lower)
+        signed_headers = ';'.join(name.lower() for name in names)
+        canonical_request = '\n'.join([
+            'POST',
+            self._url.path or '/',
+            '',
+            ''.join(f'{name.lower()}:{headers[name].strip()}\n'
+                    for name in names),
+            signed_headers,
+            hashlib.sha256(body).hexdigest()])
+        scope = f'{amz_date[:8]}/{self._region}/{SERVICE}/aws4_request'
+        string_to_sign = '\n'.join([
+            ALGORITHM, amz_date, scope,
+            hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()])
+        key = f'AWS4{credentials.secret_key}'.encode('utf-8')
+        for value in [amz_date[:8], self._region, SERVICE, 'aws4_request']:
+            key = hmac.new(key, value.encode('utf-8'), hashlib.sha256).digest()
+        signature = hmac.new(
+            key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+        headers['Authorization'] = (
+            f'{ALGORITHM} Credential={credentials.access_key}/{scope}, '
+            f'SignedHeaders={signed_headers}, Signature={signature}')
+        return headers
+
+    def _get_credentials(self) -> Credentials:
+        with self._lock:
+            if self._credentials is not None:
+                return self._credentials
+            access_key = _environ('AWS_ACCESS_KEY_ID')
+            secret_key = _environ('AWS_SECRET_ACCESS_KEY')
+            if access_key and secret_key and not self._profile:
+                self._credentials = Credentials(
+                    access_key, secret_key, _environ('AWS_SESSION_TOKEN'))
+                return self._credentials
+            # botocore refreshes temporary credentials when they expire
+            if self._botocore_credentials is None:
+                self._botocore_credentials = self._session().get_credentials()
+                if self._botocore_credentials is None:
+                    raise exceptions.NoCredentialsError()
+            frozen = self._botocore_credentials.get_frozen_credentials()
+            return Credentials(
+                frozen.access_key, frozen.secret_key, frozen.token)
+
+    def _session(self):
+        return session.Session(profile=self._profile)
+
+    def _signed(self, operation: str, params: dict) \
+            -> typing.Tuple[bytes, typing.Dict[str, str]]:
+        """Return the body and signed headers of the request"""
+        body = json.dumps(params).encode('utf-8')
+        return body, self.sign(
+            self._get_credentials(), operation, body,
+            datetime.datetime.now(datetime.timezone.utc))
+
+
+class AsyncClient(Client):
+    """Minimal asyncio SSM Parameter Store client implementing the subset
+    of the boto3 SSM client used by ``ParameterStore``, raising botocore's
+    ``ClientError`` for error responses. Requests are sent over a pool of
+    kept-alive connections opened with ``asyncio.open_connection`` so
+    concurrent requests share one event loop instead of a thread each. The
+    pool is replaced when the client is used from a different event loop.
+    `connect_timeout` defaults to `timeout`, which bounds each response.
+
+    """
+    def __init__(self,
+                 *args,
+                 connect_timeout: typing.Optional[float] = None,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self._connect_timeout = connect_timeout
+        self._pool: typing.List[
+            typing.Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._pool_loop: typing.Optional[asyncio.AbstractEventLoop] = None
+
+    async def describe_parameters(self, **kwargs) -> dict:
+        return await self._request('DescribeParameters', kwargs)
+
+    async def get_parameters(self, **kwargs) -> dict:
+        return await self._request('GetParameters', kwargs)
+
+    async def get_parameters_by_path(self, **kwargs) -> dict:
+        return await self._request('GetParametersByPath', kwargs)
+
+    def close(self) -> typing.NoReturn:
+        """Close the pooled connections"""
+        for _reader, writer in self._pool:
+            writer.close()
+        self._pool = []
+
+    async def _open(self) \
+            -> typing.Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        """Return an idle connection from the pool or open a new one"""
+        if self._pool_loop is not asyncio.get_running_loop():
+            self._pool, self._pool_loop = [], asyncio.get_running_loop()
+        if self._pool:
+            return self._pool.pop()
+        try:
+            return await asyncio.wait_for(asyncio.open_connection(
+                self._url.hostname,
+                self._url.port or (
+                    443 if self._url.scheme == 'https' else 80),
+                ssl=ssl.create_default_context()
+                if self._url.scheme == 'https' else None),
+                self._connect_timeout or self._timeout)
+        except asyncio.TimeoutError:
+            raise exceptions.ConnectTimeoutError(
+                endpoint_url=self._url.geturl())
+
+    async def _request(self, operation: str, params: dict) -> dict:
+        # Resolving credentials with botocore may block on network calls
+        if self._credentials is None:
+            body, headers = await asyncio.to_thread(
+                self._signed, operation, params)
+        else:
+            body, headers = self._signed(operation, params)
+        headers['Content-Length'] = str(len(body))
+        lines = [f'POST {self._url.path or "/"} HTTP/1.1']
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        request = '\r\n'.join(lines + ['', '']).encode('latin-1') + body
+        for attempt in range(2):
+            reader, writer = await self._open()
+            try:
+                writer.write(request)
+                status, data, keep_alive = await asyncio.wait_for(
+                    _read_response(reader), self._timeout)
+                break
+            except (asyncio.IncompleteReadError, ConnectionError) as err:
+                # The server may have closed an idle kept-alive connection
+                writer.close()
+                if attempt:
+                    raise exceptions.ConnectionClosedError(
+                        endpoint_url=self._url.geturl()) from err
+            except (asyncio.LimitOverrunError, ValueError) as err:
+                # The response is malformed
+                writer.close()
+                raise exceptions.ConnectionClosedError(
+                    endpoint_url=self._url.geturl()) from err
+            except asyncio.TimeoutError:
+                writer.close()
+                raise exceptions.ReadTimeoutError(
+                    endpoint_url=self._url.geturl())
+            except asyncio.CancelledError:
+                # The response is abandoned when a fetch deadline is hit
+                writer.close()
+                raise
+        if keep_alive:
+            self._pool.append((reader, writer))
+        else:
+            writer.close()
+        return _payload(operation, status, data)
+
+
+def _payload(operation: str, status: int, data: bytes) -> dict:
+    """Return the decoded response, raising botocore's ``ClientError`` for
+    error responses
+
+    """
+    try:
+        payload = json.loads(data) if data else {}
+    except ValueError:
+        payload = {}
+    if status >= 400:
+        code = payload.get('__type', '').rpartition('#')[2]
+        raise exceptions.ClientError({
+            'Error': {'Code': code or str(status),
+                      'Message': payload.get('message',
+                                             payload.get('Message', ''))},
+            'ResponseMetadata': {'HTTPStatusCode': status}},
+            operation)
+    return payload
+
+
+async def _read_response(reader: asyncio.StreamReader) \
+        -> typing.Tuple[int, bytes, bool]:
+    """Read an HTTP/1.1 response, returning the status, the body, and if
+    the connection can be reused
+
+    """
+    status_line = await reader.readuntil(b'\r\n')
+    version, status = status_line.decode('latin-1').split(' ', 2)[:2]
+    headers = {}
+    while True:
+        line = (await reader.readuntil(b'\r\n')).decode('latin-1')
+        if line == '\r\n':
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        chunks = []
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            chunk = await reader.readexactly(size + 2)
+            if not size:
+                break
+            chunks.append(chunk[:-2])
+        data = b''.join(chunks)
+    else:
+        data = await reader.readexactly(int(headers.get('content-length', 0)))
+    keep_alive = headers.get('connection', '').lower() != 'close' and \
+        version == 'HTTP/1.1'
+    return int(status), data, keep_alive
+
+
+def _environ(*names: str) -> typing.Optional[str]:
+    """Return the value of the first environment variable that is set"""
+    for name in names:
+        if os.environ.get(name):
+            return os.environ[name]
+    return None
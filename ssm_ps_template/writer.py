@@ -0,0 +1,189 @@
+import enum
+import hashlib
+import logging
+import os
+import pathlib
+import secrets
+import typing
+
+from ssm_ps_template import metrics
+
+LOGGER = logging.getLogger(__name__)
+
+CHUNK_SIZE = 65536
+
+
+class Durability(enum.Enum):
+    NONE = 'none'
+    FILE = 'file'
+    FILE_AND_DIRECTORY = 'file+dir'
+
+
+class Status(enum.Enum):
+    UNCHANGED = 'unchanged'
+    WRITTEN = 'written'
+
+
+def digest(path: pathlib.Path) -> typing.Optional[str]:
+    """Return the SHA-256 hex digest of the file, reading it in chunks, or
+    ``None`` if it does not exist
+
+    """
+    hasher = hashlib.sha256()
+    try:
+        with path.open('rb') as handle:
+            for chunk in iter(lambda: handle.read(CHUNK_SIZE), b''):
+                hasher.update(chunk)
+    except FileNotFoundError:
+        return None
+    return hasher.hexdigest()
+
+
+class AtomicFile:
+    """Streams content to a temporary file next to the path, hashing it as
+    it is written, that replaces the path when the content differs from
+    the path's once the context exits. If the context exits with an error,
+    the temporary file is removed and the path is left as it was.
+
+    The mode and owner are applied to the temporary file before anything
+    is written to it, keeping those of the replaced file when not
+    specified, so the content is never readable by others in between. With
+    ``FILE`` or ``FILE_AND_DIRECTORY`` durability, the file is synced to
+    disk before it replaces the path. Syncing the directory is left to
+    ``sync_directories`` so it can be done once per directory. When the
+    `current` digest of the path is passed, the path is not read again to
+    compare it with the content.
+
+    """
+    def __init__(self,
+                 path: pathlib.Path,
+                 mode: typing.Optional[int] = None,
+                 owner: typing.Optional[typing.Tuple[int, int]] = None,
+                 durability: Durability = Durability.NONE,
+                 current: typing.Optional[str] = None):
+        self.path = path
+        self._current = current
+        self.status: typing.Optional[Status] = None
+        self._durability = durability
+        self._hasher = hashlib.sha256()
+        self._handle: typing.Optional[typing.BinaryIO] = None
+        self._mode = mode
+        self._owner = owner
+        self._temp_path = path.with_name(
+            f'.{path.name}.{secrets.token_hex(4)}')
+
+    def __enter__(self) -> 'AtomicFile':
+        # New files without a mode are created with the umask applied
+        private = self._mode is not None or self.path.exists()
+        fd = os.open(self._temp_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY,
+                     0o600 if private else 0o666)
+        self._handle = os.fdopen(fd, 'wb')
+        try:
+            _set_permissions(self.path, fd, self._mode, self._owner)
+        except BaseException:
+            self._handle.close()
+            self._temp_path.unlink(missing_ok=True)
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> typing.NoReturn:
+        try:
+            if exc_type is None:
+                self._commit()
+        finally:
+            if not self._handle.closed:
+                self._handle.close()
+            self._temp_path.unlink(missing_ok=True)
+
+    def reset(self) -> typing.NoReturn:
+        """Discard the content written so far"""
+        self._handle.seek(0)
+        self._handle.truncate()
+        self._hasher = hashlib.sha256()
+
+    def write(self, content: typing.Union[str, bytes]) -> typing.NoReturn:
+        value = _encode(content)
+        self._hasher.update(value)
+        self._handle.write(value)
+
+    def _commit(self) -> typing.NoReturn:
+        with metrics.get().timer('hash', template=str(self.path)):
+            current = self._current or digest(self.path)
+            unchanged = current == self._hasher.hexdigest()
+        if unchanged:
+            LOGGER.debug('Skipping write of unchanged %s', self.path)
+            self.status = Status.UNCHANGED
+            return
+        with metrics.get().timer('write', template=str(self.path)):
+            if self._durability != Durability.NONE:
+                self._handle.flush()
+                os.fsync(self._handle.fileno())
+            self._handle.close()
+            os.replace(self._temp_path, self.path)
+        self.status = Status.WRITTEN
+
+
+def write(path: pathlib.Path,
+          content: typing.Union[str, bytes],
+          mode: typing.Optional[int] = None,
+          owner: typing.Optional[typing.Tuple[int, int]] = None,
+          durability: Durability = Durability.NONE) -> Status:
+    """Write the content to the path with an ``AtomicFile``, skipping the
+    write if the file already has the same content
+
+    """
+    recorder = metrics.get()
+    with recorder.timer('hash', template=str(path)):
+        current = digest(path)
+        unchanged = current == hashlib.sha256(_encode(content)).hexdigest()
+    if unchanged:
+        LOGGER.debug('Skipping write of unchanged %s', path)
+        return Status.UNCHANGED
+    with recorder.timer('write', template=str(path)):
+        with AtomicFile(path, mode, owner, durability, current) as handle:
+            handle.write(content)
+    return handle.status
+
+
+def sync_directories(paths: typing.Iterable[pathlib.Path]) \
+        -> typing.NoReturn:
+    """Sync each directory once, persisting the files renamed into them"""
+    for path in sorted(set(paths)):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _encode(content: typing.Union[str, bytes]) -> bytes:
+    return content.encode('utf-8') if isinstance(content, str) else content
+
+
+def _set_permissions(path: pathlib.Path,
+                     fd: int,
+                     mode: typing.Optional[int],
+                     owner: typing.Optional[typing.Tuple[int, int]]) \
+        -> typing.NoReturn:
+    """Set the mode and ownership of the temporary file, keeping those of
+    the file being replaced when they are not specified
+
+    """
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        stat = None
+    if mode is None and stat is not None:
+        mode = stat.st_mode & 0o7777
+    if owner is None and stat is not None:
+        owner = stat.st_uid, stat.st_gid
+    if owner is not None and owner != (os.getuid(), os.getgid()):
+        try:
+            os.fchown(fd, *owner)
+        except PermissionError:
+            if stat is None or owner != (stat.st_uid, stat.st_gid):
+                raise
+            LOGGER.debug('Unable to keep the ownership of %s', path)
+    # Changing the owner may clear the setuid and setgid bits
+    if mode is not None:
+        os.fchmod(fd, mode)
@@ -0,0 +1,121 @@
+import pathlib
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from ssm_ps_template import cache
+
+
+def parameter(name: str, value: str, type_: str = 'String') -> dict:
+    return {'Name': name, 'Type': type_, 'Value': value,
+            'Version': 1, 'LastModifiedDate': 1700000000.0}
+
+
+class ParameterCacheTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.path = pathlib.Path(self.temp_dir.name) / 'cache.json'
+
+    def test_parameters_are_persisted(self):
+        parameter_cache = cache.ParameterCache(self.path)
+        parameter_cache.set_parameter('/foo', parameter('/foo', 'bar'))
+        parameter_cache.set_parameter('/missing', None)
+        parameter_cache.set_path(
+            '/baz/', {'/baz/qux': parameter('/baz/qux', 'corgie')})
+        parameter_cache.save()
+
+        parameter_cache = cache.ParameterCache(self.path)
+        self.assertEqual(
+            parameter_cache.get_parameter('/foo'), parameter('/foo', 'bar'))
+        self.assertIsNone(parameter_cache.get_parameter('/missing'))
+        self.assertDictEqual(
+            parameter_cache.get_path('/baz/'),
+            {'/baz/qux': parameter('/baz/qux', 'corgie')})
+        with self.assertRaises(KeyError):
+            parameter_cache.get_parameter('/unknown')
+
+    def test_entries_expire(self):
+        parameter_cache = cache.ParameterCache(self.path, ttl=10)
+        parameter_cache.set_parameter('/foo', parameter('/foo', 'bar'))
+        with mock.patch('time.time', return_value=time.time() + 11):
+            with self.assertRaises(KeyError):
+                parameter_cache.get_parameter('/foo')
+            self.assertEqual(
+                parameter_cache.get_parameter('/foo', expired=True),
+                parameter('/foo', 'bar'))
+
+    def test_expired_entries_are_dropped_on_save(self):
+        parameter_cache = cache.ParameterCache(self.path, ttl=10)
+        parameter_cache.set_path('/foo/', {'/foo/bar': parameter(
+            '/foo/bar', 'baz')})
+        with mock.patch('time.time', return_value=time.time() + 11):
+            parameter_cache.save()
+        parameter_cache = cache.ParameterCache(self.path)
+        with self.assertRaises(KeyError):
+            parameter_cache.get_parameter('/foo/bar', expired=True)
+        with self.assertRaises(KeyError):
+            parameter_cache.get_path('/foo/', expired=True)
+
+    def test_expired_entries_are_kept_for_incremental_refreshes(self):
+        parameter_cache = cache.ParameterCache(
+            self.path, ttl=10, keep_expired=True)
+        parameter_cache.set_parameter('/foo', parameter('/foo', 'bar'))
+        with mock.patch('time.time', return_value=time.time() + 11):
+            parameter_cache.save()
+        parameter_cache = cache.ParameterCache(self.path)
+        self.assertEqual(parameter_cache.get_parameter('/foo', expired=True),
+                         parameter('/foo', 'bar'))
+
+    def test_least_recently_used_are_evicted(self):
+        parameter_cache = cache.ParameterCache(self.path, max_entries=2)
+        for name in ['/a', '/b', '/c']:
+            parameter_cache.set_parameter(name, parameter(name, 'value'))
+            parameter_cache.get_parameter('/a')
+        parameter_cache.save()
+
+        parameter_cache = cache.ParameterCache(self.path)
+        parameter_cache.get_parameter('/a')
+        parameter_cache.get_parameter('/c')
+        with self.assertRaises(KeyError):
+            parameter_cache.get_parameter('/b')
+
+    def test_secure_strings_are_encrypted(self):
+        parameter_cache = cache.ParameterCache(self.path, key='secret')
+        parameter_cache.set_parameter(
+            '/foo', parameter('/foo', 'password', cache.SECURE_STRING))
+        parameter_cache.save()
+        self.assertNotIn('password', self.path.read_text())
+
+        parameter_cache = cache.ParameterCache(self.path, key='secret')
+        self.assertEqual(
+            parameter_cache.get_parameter('/foo')['Value'], 'password')
+
+        parameter_cache = cache.ParameterCache(self.path, key='other')
+        with self.assertRaises(KeyError):
+            parameter_cache.get_parameter('/foo')
+
+    def test_secure_strings_are_not_cached_without_key(self):
+        parameter_cache = cache.ParameterCache(self.path)
+        parameter_cache.set_path('/foo/', {
+            '/foo/bar': parameter('/foo/bar', 'password',
+                                  cache.SECURE_STRING)})
+        with self.assertRaises(KeyError):
+            parameter_cache.get_path('/foo/')
+
+    def test_invalid_cache_file_is_ignored(self):
+        self.path.write_text('{')
+        with self.assertRaises(KeyError):
+            cache.ParameterCache(self.path).get_parameter('/foo')
+
+    def test_load_key(self):
+        key_file = pathlib.Path(self.temp_dir.name) / 'key'
+        key_file.write_text('from-file\n')
+        with mock.patch.dict('os.environ', {cache.KEY_ENV_VAR: ''}):
+            self.assertIsNone(cache.load_key())
+            self.assertEqual(cache.load_key(str(key_file)), 'from-file')
+        with mock.patch.dict('os.environ', {cache.KEY_ENV_VAR: 'from-env'}):
+            self.assertEqual(cache.load_key(str(key_file)), 'from-env')
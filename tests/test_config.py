@@ -86,3 +86,40 @@ class TestCase2(unittest.TestCase):
         with self.assertRaises(argparse.ArgumentTypeError):
             config.configuration_file(
                 utils.TEST_DATA_PATH / 'config/case2d.yaml')
+
+    def test_invalid_durability(self):
+        with self.assertRaises(argparse.ArgumentTypeError):
+            config.configuration_file(
+                utils.TEST_DATA_PATH / 'config/case2e.yaml')
+
+    def test_invalid_client_setting(self):
+        with self.assertRaises(argparse.ArgumentTypeError):
+            config.configuration_file(
+                utils.TEST_DATA_PATH / 'config/case2f.yaml')
+
+    def test_fan_out_destination_without_tenant(self):
+        with self.assertRaises(argparse.ArgumentTypeError):
+            config.configuration_file(
+                utils.TEST_DATA_PATH / 'config/case2g.yaml')
+
+
+class TestCase3(unittest.TestCase):
+
+    def test_load_fan_out(self):
+        template = config.configuration_file(
+            utils.TEST_DATA_PATH / 'config/case3.yaml').templates[0]
+        self.assertEqual(template.destination,
+                         pathlib.Path('build/{tenant}/case1a.out'))
+        self.assertListEqual(template.prefixes, ['/tenants/acme'])
+        self.assertEqual(template.prefixes_from, '/tenants')
+        self.assertIsNone(template.tenant)
+
+    def test_load_timeouts(self):
+        configuration = config.configuration_file(
+            utils.TEST_DATA_PATH / 'config/case4.yaml')
+        self.assertEqual(configuration.connect_timeout, 1.0)
+        self.assertEqual(configuration.read_timeout, 2.5)
+        self.assertEqual(configuration.fetch_deadline, 10.0)
+        self.assertEqual(
+            configuration.last_known_good,
+            pathlib.Path('/var/lib/ssm-ps-template/values.snapshot'))
@@ -1,9 +1,13 @@
 import dataclasses
+import os
+import pathlib
+import tempfile
 import unittest
+from unittest import mock
 
 import yaml
 
-from ssm_ps_template import discovery
+from ssm_ps_template import discovery, environment, render, ssm
 from tests import utils
 
 
@@ -23,3 +27,53 @@ class DiscoveryTestCase(unittest.TestCase):
         self.assertDictEqual(
             dataclasses.asdict(result),
             dataclasses.asdict(expectation))
+
+    def test_discovery_resolves_expressions(self) -> None:
+        discoverer = discovery.VariableDiscovery(
+            utils.TEST_DATA_PATH / 'discovery/advanced/template.j2')
+        self.assertDictEqual(
+            dataclasses.asdict(discoverer.discover()),
+            {'parameters': {'app_db_host',
+                            '/db/port',
+                            'db_user',
+                            'db_password',
+                            'settings/timeout'},
+             'parameters_by_path': {'secrets/', 'included/path/'}})
+
+    def test_sources_include_imported_and_included_templates(self) -> None:
+        path = utils.TEST_DATA_PATH / 'discovery/advanced'
+        discovery.VariableDiscovery(path / 'template.j2').discover()
+        self.assertListEqual(
+            discovery.sources(path / 'template.j2'),
+            [(path / name).resolve()
+             for name in ['template.j2', 'macros.j2', 'include.j2']])
+
+    def test_renderer_reuses_discovery_ast(self) -> None:
+        environment.configure()
+        self.addCleanup(environment.configure)
+        template_path = utils.TEST_DATA_PATH / 'discovery/advanced/template.j2'
+        discovery.VariableDiscovery(template_path).discover()
+        with mock.patch.object(
+                environment.get(), 'parse',
+                side_effect=AssertionError('parsed twice')):
+            result = render.Renderer(template_path).render(
+                ssm.Values({'app_db_host': 'localhost'}, {'secrets/': {}}))
+        self.assertIn('host: localhost', result)
+
+    def test_discovery_is_cached_until_the_template_changes(self) -> None:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = pathlib.Path(temp_dir) / 'template.j2'
+            path.write_text("{{ get_parameter('foo') }}")
+            self.assertSetEqual(
+                discovery.VariableDiscovery(path).discover().parameters,
+                {'foo'})
+            with mock.patch.object(
+                    environment.get(), 'parse',
+                    side_effect=AssertionError('parsed twice')):
+                discovery.VariableDiscovery(path).discover()
+            path.write_text("{{ get_parameter('bar') }}")
+            stat = path.stat()
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+            self.assertSetEqual(
+                discovery.VariableDiscovery(path).discover().parameters,
+                {'bar'})
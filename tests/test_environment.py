@@ -0,0 +1,57 @@
+import os
+import pathlib
+import tempfile
+import unittest
+from unittest import mock
+
+import jinja2
+
+from ssm_ps_template import environment
+
+
+class EnvironmentTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.addCleanup(environment.configure)
+        self.path = pathlib.Path(self.temp_dir.name) / 'template.j2'
+        self.path.write_text('{{ value }}')
+
+    def test_environment_is_shared(self):
+        self.assertIs(environment.get(), environment.get())
+        env = environment.configure()
+        self.assertIs(environment.get(), env)
+
+    def test_templates_are_compiled_once(self):
+        env = environment.configure()
+        name = environment.template_name(self.path)
+        self.assertIs(env.get_template(name), env.get_template(name))
+
+    def test_templates_are_reloaded_when_changed(self):
+        env = environment.configure()
+        name = environment.template_name(self.path)
+        self.assertEqual(env.get_template(name).render(value=1), '1')
+        self.path.write_text('{{ value }}!')
+        stat = self.path.stat()
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+        self.assertEqual(env.get_template(name).render(value=1), '1!')
+
+    def test_missing_template(self):
+        with self.assertRaises(jinja2.TemplateNotFound):
+            environment.get().get_template(
+                str(pathlib.Path(self.temp_dir.name) / 'missing.j2'))
+
+    def test_bytecode_cache(self):
+        cache_dir = pathlib.Path(self.temp_dir.name) / 'bytecode'
+        env = environment.configure(cache_dir)
+        env.get_template(environment.template_name(self.path))
+        self.assertEqual(len(list(cache_dir.iterdir())), 1)
+
+        env = environment.configure(cache_dir)
+        with mock.patch.object(env, 'compile') as compile_:
+            template = env.get_template(
+                environment.template_name(self.path))
+        compile_.assert_not_called()
+        self.assertEqual(template.render(value=2), '2')
@@ -0,0 +1,62 @@
+import unittest
+
+from ssm_ps_template import index
+
+
+def parameter(name: str) -> dict:
+    return {'Name': name, 'Type': 'String', 'Value': name}
+
+
+class IndexTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.index = index.Index()
+        self.index.add_path('/app/', {
+            name: parameter(name)
+            for name in ['/app/name', '/app/db/host', '/app/db/port']})
+        self.index.add('/other/key', parameter('/other/key'))
+
+    def test_covers(self):
+        self.assertTrue(self.index.covers('/app/'))
+        self.assertTrue(self.index.covers('/app'))
+        self.assertTrue(self.index.covers('/app/db/'))
+        self.assertTrue(self.index.covers('/app/missing/'))
+        self.assertFalse(self.index.covers('/'))
+        self.assertFalse(self.index.covers('/application/'))
+        self.assertFalse(self.index.covers('/other/'))
+
+    def test_covers_name(self):
+        self.assertTrue(self.index.covers_name('/app/db/host'))
+        self.assertTrue(self.index.covers_name('/app/missing'))
+        self.assertFalse(self.index.covers_name('/app'))
+        self.assertFalse(self.index.covers_name('/other/key'))
+
+    def test_get(self):
+        self.assertEqual(self.index.get('/app/db/host'),
+                         parameter('/app/db/host'))
+        self.assertEqual(self.index.get('/other/key'),
+                         parameter('/other/key'))
+        self.assertIsNone(self.index.get('/app/db'))
+        self.assertIsNone(self.index.get('/app/missing'))
+
+    def test_under(self):
+        self.assertListEqual(
+            list(self.index.under('/app/db/')),
+            ['/app/db/host', '/app/db/port'])
+        self.assertListEqual(
+            list(self.index.under('/app')),
+            ['/app/name', '/app/db/host', '/app/db/port'])
+        self.assertDictEqual(self.index.under('/app/missing/'), {})
+
+    def test_plan(self):
+        names, paths = self.index.plan(
+            ['/app/name', '/foo/bar', '/foo/baz/qux', '/corgie'],
+            ['/app/db/', '/foo/baz/', '/foo/', '/foo/baz/qux/', '/grault'])
+        self.assertListEqual(names, ['/corgie'])
+        self.assertListEqual(paths, ['/foo/', '/grault'])
+
+    def test_plan_root(self):
+        names, paths = index.Index().plan(['/foo'], ['/foo/', '/'])
+        self.assertListEqual(names, [])
+        self.assertListEqual(paths, ['/'])
@@ -0,0 +1,19 @@
+import sys
+import unittest
+from unittest import mock
+
+from ssm_ps_template import lazy
+
+
+class LazyTestCase(unittest.TestCase):
+
+    def test_load_defers_import(self):
+        with mock.patch.dict(sys.modules):
+            sys.modules.pop('colorsys', None)
+            module = lazy.load('colorsys')
+            self.assertNotIn('colorsys', sys.modules)
+            self.assertEqual(module.rgb_to_hsv(0, 0, 0), (0, 0, 0))
+            self.assertIn('colorsys', sys.modules)
+
+    def test_load_returns_imported_module(self):
+        self.assertIs(lazy.load('unittest'), unittest)
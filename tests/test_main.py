@@ -1,11 +1,14 @@
+import asyncio
 import grp
+import json
 import os
 import pathlib
+import tempfile
 from unittest import mock
 
 import yaml
 
-from ssm_ps_template import __main__, ssm
+from ssm_ps_template import __main__, config, discovery, plan, ssm, writer
 from tests import utils
 
 
@@ -32,7 +35,10 @@ class MainTestCase(utils.ParameterStoreTestCase):
             '--prefix', '/my-application',
             str(utils.TEST_DATA_PATH / 'main/config.toml')])
 
-        __main__.render_templates(args)
+        results = __main__.render_templates(args)
+        self.assertListEqual(
+            list(results.values()),
+            [writer.Status.WRITTEN, writer.Status.WRITTEN])
 
         result_path = output_dir / 'main-test.yaml'
         self.assertEqual(result_path.stat().st_mode, 33152)  # 0o600
@@ -43,8 +49,332 @@ class MainTestCase(utils.ParameterStoreTestCase):
             result_path.read_text('utf-8').strip(),
             expectation.read_text('utf-8').strip())
 
-        # Run a second time for branch coverage
+        # Unchanged output is not written again
+        mtime = result_path.stat().st_mtime_ns
+        results = __main__.render_templates(args)
+        self.assertListEqual(
+            list(results.values()),
+            [writer.Status.UNCHANGED, writer.Status.UNCHANGED])
+        self.assertEqual(result_path.stat().st_mtime_ns, mtime)
+
+        # Permissions are still corrected for unchanged output
+        result_path.chmod(0o644)
         __main__.render_templates(args)
+        self.assertEqual(result_path.stat().st_mode, 33152)
+
+    def test_watch_templates(self):
+        output_dir = pathlib.Path('./build/test').resolve()
+        delete_folder(output_dir)
+
+        with (utils.TEST_DATA_PATH / 'main/data.yaml').open('r') as handle:
+            self.put_parameters(yaml.safe_load(handle))
+
+        args = __main__.parse_cli_arguments([
+            '--prefix', '/my-application', '--watch', '--interval', '5',
+            str(utils.TEST_DATA_PATH / 'main/config.toml')])
+
+        def update_parameter(*_args):
+            update_parameter.polls += 1
+            if update_parameter.polls == 1:
+                self.client.put_parameter(
+                    Name='/my-application/foo', Value='changed',
+                    Type='String', Overwrite=True)
+            elif update_parameter.polls == 3:
+                raise KeyboardInterrupt
+
+        update_parameter.polls = 0
+
+        with mock.patch('time.sleep', side_effect=update_parameter) as sleep, \
+                mock.patch('ssm_ps_template.__main__.render_template',
+                           wraps=__main__.render_template) as render:
+            with self.assertRaises(KeyboardInterrupt):
+                __main__.watch_templates(args)
+
+        # Rendered on the first two polls, unchanged on the third
+        self.assertEqual(render.call_count, 4)
+        self.assertGreaterEqual(sleep.call_args[0][0], 4.5)
+        self.assertLessEqual(sleep.call_args[0][0], 5.5)
+        self.assertIn(
+            'foo: changed', (output_dir / 'main-test.yaml').read_text())
+
+    def test_watch_templates_retries_failed_renders(self):
+        output_dir = pathlib.Path('./build/test').resolve()
+        delete_folder(output_dir)
+
+        with (utils.TEST_DATA_PATH / 'main/data.yaml').open('r') as handle:
+            self.put_parameters(yaml.safe_load(handle))
+
+        args = __main__.parse_cli_arguments([
+            '--prefix', '/my-application', '--watch',
+            str(utils.TEST_DATA_PATH / 'main/config.toml')])
+        failing = args.config[0].templates[0].destination
+        original, failed = __main__.render_template, []
+
+        def render_template(template_plan, *args):
+            if template_plan.template.destination == failing and not failed:
+                failed.append(failing)
+                raise OSError('Disk full')
+            return original(template_plan, *args)
+
+        def poll(*_args):
+            poll.count += 1
+            if poll.count == 2:
+                raise KeyboardInterrupt
+
+        poll.count = 0
+
+        with mock.patch('time.sleep', side_effect=poll), \
+                mock.patch('ssm_ps_template.__main__.render_template',
+                           side_effect=render_template) as render:
+            with self.assertLogs('ssm_ps_template.__main__') as logs, \
+                    self.assertRaises(KeyboardInterrupt):
+                __main__.watch_templates(args)
+
+        # Both are rendered on the first poll and the failed one again on
+        # the second
+        self.assertListEqual(
+            [call.args[0].template.destination
+             for call in render.call_args_list],
+            [failing, args.config[0].templates[1].destination, failing])
+        self.assertTrue(failing.exists())
+        self.assertIn('Disk full', '\n'.join(logs.output))
+
+    def test_render_templates_parallel(self):
+        output_dir = pathlib.Path('./build/test').resolve()
+        delete_folder(output_dir)
+
+        with (utils.TEST_DATA_PATH / 'main/data.yaml').open('r') as handle:
+            self.put_parameters(yaml.safe_load(handle))
+
+        args = __main__.parse_cli_arguments([
+            '--prefix', '/my-application', '--parallelism', '2',
+            '--durability', 'file+dir',
+            str(utils.TEST_DATA_PATH / 'main/config.toml')])
+
+        with self.assertLogs('ssm_ps_template.__main__') as logs, \
+                mock.patch('ssm_ps_template.writer.sync_directories') as sync:
+            results = __main__.render_templates(args)
+        self.assertListEqual(
+            [path.resolve() for path in sync.call_args[0][0]],
+            [output_dir, output_dir])
+        self.assertListEqual(
+            list(results.keys()),
+            [template.destination for template in args.config[0].templates])
+        self.assertListEqual(
+            [record.args[0] for record in logs.records
+             if record.msg.startswith('Rendered %s')],
+            list(results.keys()))
+        self.assertEqual(
+            (output_dir / 'main-test.yaml').read_text(),
+            (output_dir / 'main-test2.yaml').read_text())
+
+    def test_render_templates_stream(self):
+        output_dir = pathlib.Path('./build/test').resolve()
+        delete_folder(output_dir)
+
+        with (utils.TEST_DATA_PATH / 'main/data.yaml').open('r') as handle:
+            self.put_parameters(yaml.safe_load(handle))
+
+        args = __main__.parse_cli_arguments([
+            '--prefix', '/my-application', '--stream',
+            str(utils.TEST_DATA_PATH / 'main/config.toml')])
+        results = __main__.render_templates(args)
+        self.assertListEqual(
+            list(results.values()),
+            [writer.Status.WRITTEN, writer.Status.WRITTEN])
+        result_path = output_dir / 'main-test.yaml'
+        self.assertEqual(result_path.stat().st_mode, 33152)  # 0o600
+        expectation = utils.TEST_DATA_PATH / 'main/expectation.yaml'
+        self.assertEqual(
+            result_path.read_text('utf-8').strip(),
+            expectation.read_text('utf-8').strip())
+
+        results = __main__.render_templates(args)
+        self.assertListEqual(
+            list(results.values()),
+            [writer.Status.UNCHANGED, writer.Status.UNCHANGED])
+        self.assertListEqual(
+            sorted(path.name for path in output_dir.iterdir()),
+            ['main-test.yaml', 'main-test2.yaml'])
+
+    def test_render_templates_metrics(self):
+        output_dir = pathlib.Path('./build/test').resolve()
+        delete_folder(output_dir)
+        metrics_file = pathlib.Path('./build/metrics.jsonl').resolve()
+        if metrics_file.exists():
+            metrics_file.unlink()
+
+        with (utils.TEST_DATA_PATH / 'main/data.yaml').open('r') as handle:
+            self.put_parameters(yaml.safe_load(handle))
+
+        args = __main__.parse_cli_arguments([
+            '--prefix', '/my-application', '--metrics-file', str(metrics_file),
+            str(utils.TEST_DATA_PATH / 'main/config.toml')])
+        __main__.render_templates(args)
+        events = [json.loads(line)
+                  for line in metrics_file.read_text().splitlines()]
+        phases = {event['phase'] for event in events
+                  if event['type'] == 'phase'}
+        self.assertTrue(
+            {'discover', 'fetch', 'render', 'hash', 'write', 'permissions',
+             'total'}.issubset(phases), phases)
+        self.assertIn('api_call', {event['type'] for event in events})
+
+    def test_render_templates_from_snapshot(self):
+        output_dir = pathlib.Path('./build/test').resolve()
+        delete_folder(output_dir)
+        snapshot_path = pathlib.Path('./build/values.snapshot').resolve()
+
+        with (utils.TEST_DATA_PATH / 'main/data.yaml').open('r') as handle:
+            self.put_parameters(yaml.safe_load(handle))
+
+        args = __main__.parse_cli_arguments([
+            '--prefix', '/my-application', '--values-to', str(snapshot_path),
+            str(utils.TEST_DATA_PATH / 'main/config.toml')])
+        __main__.export_values(args)
+        self.assertFalse(output_dir.exists())
+        self.prune_parameters()
+
+        args = __main__.parse_cli_arguments([
+            '--prefix', '/my-application',
+            '--values-from', str(snapshot_path),
+            str(utils.TEST_DATA_PATH / 'main/config.toml')])
+        with mock.patch('ssm_ps_template.ssm.ParameterStore') as store:
+            __main__.render_templates(args)
+        store.assert_not_called()
+        self.assertEqual(
+            (output_dir / 'main-test.yaml').read_text('utf-8').strip(),
+            (utils.TEST_DATA_PATH / 'main/expectation.yaml').read_text(
+                'utf-8').strip())
+
+    def test_render_templates_fan_out(self):
+        output_dir = pathlib.Path('./build/test/tenants').resolve()
+        delete_folder(output_dir)
+        self.put_parameters({
+            '/static/default/db/host': 'default-db',
+            '/tenants/acme/db/host': 'acme-db',
+            '/tenants/acme/db/port': '6432',
+            '/tenants/globex/db/host': 'globex-db'})
+
+        args = __main__.parse_cli_arguments([
+            '--parallelism', '2',
+            str(utils.TEST_DATA_PATH / 'tenants/config.toml')])
+        with mock.patch('ssm_ps_template.ssm.AsyncParameterStore._call',
+                        autospec=True,
+                        side_effect=ssm.AsyncParameterStore._call) as call:
+            results = __main__.render_templates(args)
+        self.assertListEqual(
+            list(results.values()), [writer.Status.WRITTEN] * 3)
+        self.assertEqual(
+            (output_dir / 'acme.conf').read_text('utf-8'),
+            'tenant = acme\nhost = acme-db\nport = 6432')
+        self.assertEqual(
+            (output_dir / 'globex.conf').read_text('utf-8'),
+            'tenant = globex\nhost = globex-db\nport = 5432')
+        self.assertEqual(
+            (output_dir / 'default.conf').read_text('utf-8'),
+            'tenant = default\nhost = default-db\nport = 5432')
+        # The tenants under the listed path are answered from its fetch
+        self.assertEqual(call.call_count, 2)
+
+    def test_render_templates_from_last_known_good(self):
+        output_dir = pathlib.Path('./build/test').resolve()
+        delete_folder(output_dir)
+        last_known_good = pathlib.Path('./build/last-known-good').resolve()
+        if last_known_good.exists():
+            last_known_good.unlink()
+
+        with (utils.TEST_DATA_PATH / 'main/data.yaml').open('r') as handle:
+            self.put_parameters(yaml.safe_load(handle))
+
+        # The successful run that writes the values has no deadline
+        args = __main__.parse_cli_arguments([
+            '--prefix', '/my-application',
+            '--last-known-good', str(last_known_good),
+            str(utils.TEST_DATA_PATH / 'main/config.toml')])
+        __main__.render_templates(args)
+        self.assertTrue(last_known_good.exists())
+        delete_folder(output_dir)
+
+        args.fetch_deadline = 0.1
+
+        async def call(*_args, **_kwargs):
+            await asyncio.sleep(5)
+
+        with mock.patch('ssm_ps_template.ssm.AsyncParameterStore._call',
+                        side_effect=call), \
+                self.assertLogs('ssm_ps_template.__main__') as logs, \
+                self.assertRaises(SystemExit) as system_exit:
+            __main__.render_templates(args)
+        self.assertEqual(system_exit.exception.code,
+                         __main__.STALE_EXIT_CODE)
+        self.assertIn('Rendered from stale data', logs.output[-1])
+        self.assertEqual(
+            (output_dir / 'main-test.yaml').read_text('utf-8').strip(),
+            (utils.TEST_DATA_PATH / 'main/expectation.yaml').read_text(
+                'utf-8').strip())
+
+    def test_plan_templates(self):
+        args = __main__.parse_cli_arguments([
+            '--prefix', '/my-application', '--plan', '--plan-format', 'json',
+            str(utils.TEST_DATA_PATH / 'main/config.toml')])
+        with mock.patch('sys.stdout.write') as write, \
+                mock.patch('ssm_ps_template.ssm.ParameterStore') as store:
+            __main__.plan_templates(args)
+        store.assert_not_called()
+        estimate = json.loads(write.call_args[0][0])
+        self.assertDictEqual(
+            estimate['calls'], {'GetParameters': 1, 'GetParametersByPath': 0})
+        self.assertEqual(len(estimate['shared']), 4)
+
+        args.plan_format = 'text'
+        with mock.patch('sys.stdout.write') as write:
+            __main__.plan_templates(args)
+        self.assertIn('  GetParameters: 1 (4 parameters)\n',
+                      write.call_args[0][0])
+
+    def test_plan_templates_lists_fan_out_prefixes(self):
+        self.put_parameters({
+            '/tenants/acme/db/host': 'acme-db',
+            '/tenants/globex/db/host': 'globex-db'})
+        args = __main__.parse_cli_arguments([
+            '--plan', '--plan-format', 'json',
+            str(utils.TEST_DATA_PATH / 'tenants/config.toml')])
+        with mock.patch('sys.stdout.write') as write:
+            __main__.plan_templates(args)
+        estimate = json.loads(write.call_args[0][0])
+        self.assertListEqual(
+            [pathlib.Path(template['destination']).name
+             for template in estimate['templates']],
+            ['default.conf', 'acme.conf', 'globex.conf'])
+        self.assertListEqual(estimate['listings'], ['/tenants'])
+        self.assertDictEqual(
+            estimate['calls'], {'GetParameters': 1, 'GetParametersByPath': 1})
+
+        args.plan_format = 'text'
+        with mock.patch('sys.stdout.write') as write:
+            __main__.plan_templates(args)
+        self.assertIn('Listed for prefixes:\n  /tenants\n',
+                      write.call_args[0][0])
+
+    def test_render_plans_failure(self):
+        template_plans = [
+            mock.Mock(template=mock.Mock(destination=pathlib.Path(name)))
+            for name in ['a', 'b', 'c']]
+
+        def render_template(template_plan, *_args):
+            if template_plan is template_plans[1]:
+                raise ValueError('Mock Error')
+            return writer.Status.WRITTEN, 0.0
+
+        with mock.patch('ssm_ps_template.__main__.render_template',
+                        side_effect=render_template):
+            with self.assertRaises(ValueError):
+                __main__.render_plans(template_plans, mock.Mock(),
+                                      parallelism=1)
+            with self.assertRaises(ValueError):
+                __main__.render_plans(template_plans, mock.Mock(),
+                                      parallelism=3)
 
     def test_ssm_error_exits(self):
         args = __main__.parse_cli_arguments([
@@ -52,12 +382,31 @@ class MainTestCase(utils.ParameterStoreTestCase):
             str(utils.TEST_DATA_PATH / 'main/config.toml')])
 
         with mock.patch(
-                'ssm_ps_template.ssm.ParameterStore.fetch_variables') as func:
+                'ssm_ps_template.ssm.ParameterStore.fetch') as func:
             func.side_effect = ssm.SSMClientException('Mock Error')
             with self.assertRaises(SystemExit) as system_exit:
                 __main__.render_templates(args)
             self.assertEqual(str(system_exit.exception), '1')
 
+    def test_template_fingerprint_includes_included_templates(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            source = pathlib.Path(temp_dir) / 'template.j2'
+            source.write_text("{% include 'include.j2' %}")
+            included = pathlib.Path(temp_dir) / 'include.j2'
+            included.write_text("{{ get_parameter('foo') }}")
+            template_plan = plan.TemplatePlan(
+                config.Template(source, pathlib.Path(temp_dir) / 'output',
+                                None, None, None, None),
+                discovery.VariableDiscovery(source).discover(), {}, {})
+            values = ssm.Values({}, {})
+            fingerprint = __main__.template_fingerprint(template_plan, values)
+
+            stat = included.stat()
+            os.utime(included, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+            self.assertNotEqual(
+                __main__.template_fingerprint(template_plan, values),
+                fingerprint)
+
     def test_chown_group(self):
         gids = os.getgroups()
         path = pathlib.Path('build/test-chown-group')
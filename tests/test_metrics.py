@@ -0,0 +1,102 @@
+import json
+import os
+import pathlib
+import tempfile
+import unittest
+import uuid
+
+from ssm_ps_template import discovery, metrics, ssm
+from tests import utils
+
+
+class RecorderTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.temp_dir.name) / 'metrics'
+
+    def tearDown(self) -> None:
+        metrics.configure()
+        self.temp_dir.cleanup()
+        super().tearDown()
+
+    def test_disabled(self):
+        recorder = metrics.Recorder()
+        with recorder.timer('fetch'):
+            pass
+        recorder.api_call('GetParameters', 0.1, 10, 0)
+        self.assertListEqual(recorder.events, [])
+
+    def test_configure(self):
+        recorder = metrics.configure(True)
+        self.assertIs(metrics.get(), recorder)
+        self.assertTrue(recorder.enabled)
+
+    def test_timer_records_errors(self):
+        recorder = metrics.Recorder(True)
+        with self.assertRaises(ValueError):
+            with recorder.timer('render', template='foo'):
+                raise ValueError
+        self.assertEqual(len(recorder.events), 1)
+        self.assertEqual(recorder.events[0]['phase'], 'render')
+        self.assertEqual(recorder.events[0]['template'], 'foo')
+
+    def test_json_lines_appended(self):
+        for _offset in range(2):
+            recorder = metrics.Recorder(True)
+            with recorder.timer('fetch'):
+                pass
+            recorder.write(self.path)
+        events = [json.loads(line)
+                  for line in self.path.read_text().splitlines()]
+        self.assertListEqual(
+            [event['phase'] for event in events], ['fetch', 'fetch'])
+
+    def test_prometheus(self):
+        recorder = metrics.Recorder(True)
+        with recorder.timer('render', template='/etc/"foo"'):
+            pass
+        recorder.api_call('GetParameters', 0.5, 10, 1)
+        recorder.api_call('GetParameters', 0.25, 5, 0)
+        recorder.write(self.path, metrics.PROMETHEUS)
+        lines = self.path.read_text().splitlines()
+        self.assertIn(
+            'ssm_ps_template_api_calls{operation="GetParameters"} 2', lines)
+        self.assertIn(
+            'ssm_ps_template_api_seconds{operation="GetParameters"} 0.75',
+            lines)
+        self.assertIn(
+            'ssm_ps_template_api_parameters{operation="GetParameters"} 15',
+            lines)
+        self.assertIn(
+            'ssm_ps_template_api_retries{operation="GetParameters"} 1',
+            lines)
+        self.assertTrue(any(
+            line.startswith('ssm_ps_template_phase_seconds{phase="render",'
+                            'template="/etc/\\"foo\\""} ')
+            for line in lines))
+
+
+class ParameterStoreMetricsTestCase(utils.ParameterStoreTestCase):
+
+    def tearDown(self) -> None:
+        metrics.configure()
+        super().tearDown()
+
+    def test_api_calls_recorded(self):
+        recorder = metrics.configure(True)
+        prefix = f'/{uuid.uuid4().hex}'
+        self.put_parameters({f'{prefix}/foo': 'bar',
+                             f'{prefix}/settings/baz': 'qux'})
+        store = ssm.ParameterStore(
+            endpoint_url=os.environ['SSM_ENDPOINT_URL'])
+        store.fetch_variables(
+            discovery.Variables({'foo'}, {'settings/'}), prefix, False)
+        calls = {event['operation']: event for event in recorder.events
+                 if event['type'] == 'api_call'}
+        self.assertEqual(calls['GetParameters']['parameters'], 1)
+        self.assertEqual(calls['GetParametersByPath']['parameters'], 1)
+        self.assertEqual(
+            calls['GetParametersByPath']['path'], f'{prefix}/settings/')
+        self.assertEqual(calls['GetParameters']['retries'], 0)
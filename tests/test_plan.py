@@ -0,0 +1,138 @@
+import unittest
+from unittest import mock
+
+from ssm_ps_template import config, discovery, plan, ssm
+from tests import utils
+
+
+class PlanTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        configuration = config.configuration_file(
+            str(utils.TEST_DATA_PATH / 'main/config.toml'))
+        self.plan = plan.build(
+            configuration.templates, '/my-application', False)
+
+    def test_parameters_are_deduplicated(self):
+        self.assertListEqual(
+            self.plan.parameters,
+            ['/my-application/baz',
+             '/my-application/foo',
+             '/my-application/values',
+             '/other-application/key'])
+        self.assertListEqual(self.plan.parameters_by_path, [])
+
+    def test_template_values(self):
+        values = ssm.Values(
+            {'/my-application/baz': 'qux',
+             '/my-application/foo': 'bar',
+             '/other-application/key': 'secret-value',
+             '/unused': 'value'},
+            {})
+        for template_plan in self.plan.templates:
+            self.assertDictEqual(
+                template_plan.values(values).parameters,
+                {'baz': 'qux',
+                 'foo': 'bar',
+                 '/other-application/key': 'secret-value'})
+
+
+class EstimateTestCase(unittest.TestCase):
+
+    def test_estimate(self):
+        render_plan = plan.Plan([
+            plan.TemplatePlan(
+                template=mock.Mock(source='a.j2', destination='a'),
+                variables=discovery.Variables(set(), set()),
+                parameters={f'key{offset}': f'/app/key{offset}'
+                            for offset in range(11)},
+                parameters_by_path={'db': '/app/db/'}),
+            plan.TemplatePlan(
+                template=mock.Mock(source='b.j2', destination='b'),
+                variables=discovery.Variables(set(), set()),
+                parameters={'host': '/app/db/host'},
+                parameters_by_path={'db': '/app/db/', 'root': '/app/db'})])
+        estimate = plan.estimate(render_plan)
+        self.assertDictEqual(estimate['overlapping_paths'],
+                             {'/app/db/': '/app/db'})
+        self.assertDictEqual(estimate['parameters_under_paths'],
+                             {'/app/db/host': '/app/db'})
+        self.assertDictEqual(estimate['shared'], {'/app/db/': ['a', 'b']})
+        self.assertListEqual(
+            estimate['fetch']['parameters_by_path'], ['/app/db'])
+        self.assertEqual(len(estimate['fetch']['parameters']), 11)
+        self.assertDictEqual(
+            estimate['calls'],
+            {'GetParameters': 2, 'GetParametersByPath': 1})
+
+
+class FanOutTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.templates = config.configuration_file(
+            str(utils.TEST_DATA_PATH / 'tenants/config.toml')).templates
+        self.listed = ssm.Values({}, {'/tenants': {
+            '/acme/db/host': 'acme-db',
+            '/globex/db/host': 'globex-db',
+            '/version': '1'}})
+
+    def test_fan_out(self):
+        templates = plan.fan_out(self.templates, self.listed)
+        self.assertListEqual(
+            [(str(template.destination), template.prefix, template.tenant)
+             for template in templates],
+            [('build/test/tenants/default.conf', '/static/default',
+              'default'),
+             ('build/test/tenants/acme.conf', '/tenants/acme', 'acme'),
+             ('build/test/tenants/globex.conf', '/tenants/globex',
+              'globex')])
+        self.assertIsNone(templates[0].prefixes)
+        self.assertIsNone(templates[0].prefixes_from)
+
+    def test_fan_out_without_listing(self):
+        self.assertListEqual(
+            [template.tenant
+             for template in plan.fan_out(self.templates)], ['default'])
+
+    def test_build_discovers_once(self):
+        with mock.patch('ssm_ps_template.discovery.VariableDiscovery',
+                        wraps=discovery.VariableDiscovery) as discover:
+            render_plan = plan.build(
+                self.templates, '/ignored', False, self.listed)
+        discover.assert_called_once()
+        self.assertListEqual(render_plan.listings, ['/tenants'])
+        self.assertListEqual(render_plan.parameters_by_path, ['/tenants'])
+        self.assertListEqual(
+            render_plan.parameters,
+            ['/static/default/db/host', '/static/default/db/port',
+             '/tenants/acme/db/host', '/tenants/acme/db/port',
+             '/tenants/globex/db/host', '/tenants/globex/db/port'])
+        # Each template gets its own copy of the discovered variables
+        render_plan.templates[0].variables.parameters.add('extra')
+        self.assertNotIn(
+            'extra', render_plan.templates[1].variables.parameters)
+
+
+class LazyResolverTestCase(unittest.TestCase):
+
+    def test_resolve(self):
+        configuration = config.configuration_file(
+            str(utils.TEST_DATA_PATH / 'main/config.toml'))
+        render_plan = plan.build(
+            configuration.templates, '/my-application', True)
+        values = ssm.Values({'/my-application/foo': 'bar'}, {})
+        store = mock.Mock()
+        store.fetch.return_value = ssm.Values(
+            {'/my-application/dynamic-key': 'value'}, {})
+        resolver = plan.LazyResolver(store, render_plan, values)
+
+        for template_plan in render_plan.templates:
+            result = resolver.resolve(
+                template_plan, discovery.Variables({'dynamic_key'}, set()))
+            self.assertEqual(result.parameters['dynamic_key'], 'value')
+            self.assertEqual(result.parameters['foo'], 'bar')
+            self.assertIn('dynamic_key', template_plan.variables.parameters)
+
+        # Only fetched once for both templates
+        store.fetch.assert_called_once_with(
+            {'/my-application/dynamic-key'}, set(), None)
@@ -0,0 +1,52 @@
+import pathlib
+import pstats
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from ssm_ps_template import profiling, render
+
+
+def busy() -> int:
+    return sum(len(str(render.coerce({'a-b': ['1', 'true']})))
+               for _offset in range(1000))
+
+
+class ProfilingTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.temp_dir.name) / 'render.pstats'
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+        super().tearDown()
+
+    def test_disabled(self):
+        with profiling.profile(None, 10):
+            busy()
+        self.assertFalse(self.path.exists())
+
+    def test_threads_profiled(self):
+        with profiling.profile(self.path):
+            thread = threading.Thread(target=busy)
+            thread.start()
+            thread.join()
+        names = {name for _filename, _line, name
+                 in pstats.Stats(str(self.path)).stats}
+        self.assertIn('busy', names)
+        self.assertIn('coerce', names)
+
+    def test_summary_grouped_by_phase(self):
+        with mock.patch('sys.stderr.write') as write:
+            with profiling.profile(self.path, 20):
+                busy()
+        output = write.call_args[0][0]
+        render_section = output.split('\nrender: ')[1].split('\n\n')[0]
+        self.assertIn('render.py', render_section)
+        # Builtins are counted towards the phase of their caller
+        self.assertIn('isinstance', render_section)
+        self.assertLessEqual(len(render_section.splitlines()), 22)
+        self.assertIn('\nother: ', output)
@@ -0,0 +1,48 @@
+import pathlib
+import signal
+import tempfile
+import unittest
+from unittest import mock
+
+from ssm_ps_template import config, reload
+
+
+def template(**kwargs) -> config.Template:
+    return config.Template(
+        source=pathlib.Path('source'), destination=pathlib.Path('dest'),
+        prefix=None, user=None, group=None, mode=None, **kwargs)
+
+
+class ReloadTestCase(unittest.TestCase):
+
+    def test_noop(self):
+        with mock.patch('subprocess.run') as run, \
+                mock.patch('os.kill') as kill:
+            reload.reload(template())
+        run.assert_not_called()
+        kill.assert_not_called()
+
+    def test_reload_command(self):
+        with mock.patch('subprocess.run') as run:
+            reload.reload(template(reload_command='systemctl reload "a b"'))
+        run.assert_called_once_with(
+            ['systemctl', 'reload', 'a b'], check=True)
+
+    def test_reload_command_failure_is_logged(self):
+        with self.assertLogs('ssm_ps_template.reload', 'ERROR'):
+            reload.reload(template(reload_command='/does/not/exist'))
+
+    def test_reload_signal(self):
+        with tempfile.NamedTemporaryFile('w') as pidfile:
+            pidfile.write('1234\n')
+            pidfile.flush()
+            for name in ['HUP', 'sighup']:
+                with mock.patch('os.kill') as kill:
+                    reload.reload(template(
+                        reload_signal=name, pidfile=pidfile.name))
+                kill.assert_called_once_with(1234, signal.SIGHUP)
+
+    def test_reload_signal_missing_pidfile_is_logged(self):
+        with self.assertLogs('ssm_ps_template.reload', 'ERROR'):
+            reload.reload(template(
+                reload_signal='HUP', pidfile='/does/not/exist.pid'))
@@ -1,8 +1,9 @@
 import unittest
+from unittest import mock
 
 import yaml
 
-from ssm_ps_template import render, ssm
+from ssm_ps_template import discovery, render, ssm
 from tests import utils
 
 
@@ -25,6 +26,56 @@ class DiscoveryTestCase(unittest.TestCase):
         self.assertEqual(result.strip(), expectation.strip())
 
 
+class LazyRenderTestCase(unittest.TestCase):
+
+    def test_missing_values_are_resolved(self):
+        resolver = mock.Mock(return_value=ssm.Values(
+            {'primary_password': 'secret'}, {'settings/': {'foo': 'bar'}}))
+        renderer = render.Renderer(
+            utils.TEST_DATA_PATH / 'render/lazy.j2', resolver)
+        result = renderer.render(ssm.Values({}, {}))
+        resolver.assert_called_once_with(discovery.Variables(
+            {'primary_password', 'replica_password'}, {'settings/'}))
+        self.assertEqual(
+            result,
+            'primary: secret\nreplica: default\nsettings: 1')
+
+    def test_planned_values_are_not_resolved(self):
+        resolver = mock.Mock()
+        renderer = render.Renderer(
+            utils.TEST_DATA_PATH / 'render/lazy.j2', resolver,
+            planned=discovery.Variables(
+                {'primary_password', 'replica_password'}, {'settings/'}))
+        output = mock.Mock()
+        renderer.stream(output, ssm.Values({}, {}))
+        resolver.assert_not_called()
+        output.reset.assert_not_called()
+        self.assertEqual(
+            ''.join(args[0] for name, args, _kwargs in output.mock_calls
+                    if name == 'write'),
+            'primary: default\nreplica: default\nsettings: 0')
+
+    def test_stream_is_reset_to_resolve_values(self):
+        resolver = mock.Mock(return_value=ssm.Values(
+            {'primary_password': 'secret'}, {'settings/': {'foo': 'bar'}}))
+        renderer = render.Renderer(
+            utils.TEST_DATA_PATH / 'render/lazy.j2', resolver)
+        output = mock.Mock()
+        renderer.stream(output, ssm.Values({}, {}))
+        output.reset.assert_called_once_with()
+        written = [args[0] for name, args, _kwargs in output.mock_calls
+                   if name == 'write']
+        self.assertIn('primary: default', ''.join(written))
+        self.assertTrue(''.join(written).endswith(
+            'primary: secret\nreplica: default\nsettings: 1'))
+
+    def test_missing_values_without_resolver(self):
+        renderer = render.Renderer(utils.TEST_DATA_PATH / 'render/lazy.j2')
+        self.assertEqual(
+            renderer.render(ssm.Values({}, {})),
+            'primary: default\nreplica: default\nsettings: 0')
+
+
 class DashesToUnderscoresTestCase(unittest.TestCase):
 
     def test_replace_dashes_with_underscores(self):
@@ -79,6 +130,67 @@ class PathToDictTestCase(unittest.TestCase):
         }
         self.assertDictEqual(render.path_to_dict(value), expectation)
 
+    def test_path_to_dict_single_pass(self):
+        value = {
+            'foo-bar/baz': 'true',
+            'foo-bar/qux-quux': ['1', 'corgie'],
+            'grault': {'garply/waldo-fred': 'NULL'}
+        }
+        expectation = render.coerce(render.replace_dashes_with_underscores(
+            render.path_to_dict(value)))
+        self.assertDictEqual(
+            render.path_to_dict(value, coerce_types=True), expectation)
+        self.assertDictEqual(
+            render.path_to_dict(value, dashes_to_underscores=True),
+            render.replace_dashes_with_underscores(
+                render.path_to_dict(value)))
+        self.assertDictEqual(expectation, {
+            'foo_bar': {'baz': True, 'qux_quux': [1, 'corgie']},
+            'grault': {'garply': {'waldo_fred': None}}})
+
+    def test_path_to_dict_conflict(self):
+        with self.assertRaises(TypeError):
+            render.path_to_dict({'foo': 'bar', 'foo/baz': 'qux'})
+
+    def test_deeply_nested(self):
+        value = []
+        for _offset in range(5000):
+            value = [{'foo-bar': value}]
+        result = render.replace_dashes_with_underscores(value)
+        for _offset in range(5000):
+            result = result[0]['foo_bar']
+        self.assertListEqual(result, [])
+
+
+class MemoTestCase(unittest.TestCase):
+
+    def test_memoized_by_identity(self):
+        memo = render._Memo(max_entries=1)
+        function = mock.Mock(side_effect=render.path_to_dict)
+        wrapped = memo.wrap(function)
+        value = {'foo/bar': 'baz'}
+        self.assertIs(wrapped(value), wrapped(value))
+        self.assertEqual(function.call_count, 1)
+
+        # Arguments are part of the key
+        wrapped(value, coerce_types=True)
+        self.assertEqual(function.call_count, 2)
+
+        # An equal value that is a different object is computed again
+        self.assertEqual(wrapped(dict(value)), {'foo': {'bar': 'baz'}})
+        self.assertEqual(function.call_count, 3)
+
+    def test_template_filter_chain(self):
+        values = ssm.Values(
+            {}, {'settings/': {'foo-bar/baz': 'qux'}})
+        render._memo.clear()
+        renderer = render.Renderer(utils.TEST_DATA_PATH / 'render/filters.j2')
+        self.assertEqual(
+            renderer.render(values),
+            "{'foo_bar': {'baz': 'qux'}}\n{'foo_bar': {'baz': 'qux'}}")
+        # Each filter in the chain is only computed once
+        self.assertEqual(len(render._memo._entries), 2)
+
 
 class CoerceTestCase(unittest.TestCase):
 
@@ -0,0 +1,63 @@
+import os
+import pathlib
+import tempfile
+import unittest
+from unittest import mock
+
+from ssm_ps_template import snapshot, ssm
+
+
+class SnapshotTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = pathlib.Path(self.temp_dir.name) / 'values.snapshot'
+        self.values = ssm.Values(
+            {'/foo/bar': 'baz', '/foo/list': ['a', 'b']},
+            {'/foo/settings/': {'value1': 'qux', 'nested/value2': 'quux'}})
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+        super().tearDown()
+
+    def test_round_trip(self):
+        snapshot.dump(self.path, self.values, {'/foo/missing'})
+        self.assertEqual(self.path.stat().st_mode & 0o777, 0o600)
+        loaded = snapshot.load(self.path)
+        self.assertEqual(loaded.values, self.values)
+        self.assertSetEqual(loaded.missing, {'/foo/missing'})
+
+    def test_encrypted(self):
+        snapshot.dump(self.path, self.values, key='secret')
+        self.assertNotIn(b'baz', self.path.read_bytes())
+        self.assertEqual(
+            snapshot.load(self.path, 'secret').values, self.values)
+        with self.assertRaises(snapshot.SnapshotError):
+            snapshot.load(self.path, 'wrong')
+        with self.assertRaises(snapshot.SnapshotError):
+            snapshot.load(self.path)
+
+    def test_invalid(self):
+        self.path.write_bytes(b'\x1f\x8bnot gzip')
+        with self.assertRaises(snapshot.SnapshotError):
+            snapshot.load(self.path)
+        with self.assertRaises(snapshot.SnapshotError):
+            snapshot.load(self.path.with_name('missing'))
+
+    def test_absent(self):
+        snapshot.dump(self.path, self.values, {'/foo/missing'})
+        loaded = snapshot.load(self.path)
+        self.assertListEqual(
+            loaded.absent(['/foo/bar', '/foo/missing', '/foo/other'],
+                          ['/foo/settings/', '/foo/other/']),
+            ['/foo/other', '/foo/other/'])
+
+    def test_load_key(self):
+        with mock.patch.dict(os.environ, {snapshot.KEY_ENV_VAR: 'env'}):
+            self.assertEqual(snapshot.load_key('/missing'), 'env')
+        with mock.patch.dict(os.environ, {snapshot.KEY_ENV_VAR: ''}):
+            key_file = pathlib.Path(self.temp_dir.name) / 'key'
+            key_file.write_text('file\n')
+            self.assertEqual(snapshot.load_key(str(key_file)), 'file')
+            self.assertIsNone(snapshot.load_key())
@@ -1,19 +1,43 @@
+import asyncio
 import dataclasses
 import os
+import pathlib
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
 import uuid
 from unittest import mock
 
 from botocore import exceptions
 
-from ssm_ps_template import discovery, ssm
+from ssm_ps_template import cache, discovery, ssm
 from tests import utils
 
 
+class ImportTestCase(unittest.TestCase):
+
+    def test_import_does_not_load_botocore(self):
+        code = ('import sys\n'
+                'import ssm_ps_template.ssm\n'
+                'print(any(name.startswith("botocore")'
+                ' for name in sys.modules))')
+        result = subprocess.run([sys.executable, '-c', code], check=True,
+                                capture_output=True, text=True)
+        self.assertEqual(result.stdout.strip(), 'False')
+
+
 class ParameterStoreTestCase(utils.ParameterStoreTestCase):
+    TRANSPORT = 'boto3'
+
     def setUp(self) -> None:
         super().setUp()
         self.ssm = ssm.ParameterStore(
-            endpoint_url=os.environ['SSM_ENDPOINT_URL'])
+            endpoint_url=os.environ['SSM_ENDPOINT_URL'],
+            transport=self.TRANSPORT)
 
     def test_fetch_variables(self):
         values = {
@@ -77,10 +101,335 @@ class ParameterStoreTestCase(utils.ParameterStoreTestCase):
 
     def test_fetch_variables_raises(self):
         with mock.patch(
-                'ssm_ps_template.ssm.ParameterStore._fetch_variables') as func:
+                'ssm_ps_template.ssm.AsyncParameterStore._fetch') as func:
             func.side_effect = exceptions.ClientError(
                 error_response={'err': 'Mock Error'},
                 operation_name='Mock Operation')
             with self.assertRaises(ssm.SSMClientException):
                 self.ssm.fetch_variables(
                     discovery.Variables(set(), set()), '/foo/bar', True)
+
+    def test_fetch_deduplicates_names(self):
+        values = {
+            '/foo/bar/baz': str(uuid.uuid4()),
+            '/foo/bar/settings/value1': str(uuid.uuid4())
+        }
+        self.put_parameters(values)
+
+        client = self.ssm._engine._get_client()
+        with mock.patch.object(
+                client, 'get_parameters',
+                wraps=client.get_parameters) as get_parameters:
+            result = self.ssm.fetch(
+                ['/foo/bar/baz', '/foo/bar/baz'],
+                ['/foo/bar/settings/', '/foo/bar/settings/'])
+        get_parameters.assert_called_once_with(
+            Names=['/foo/bar/baz'], WithDecryption=True)
+
+        self.assertDictEqual(
+            dataclasses.asdict(result),
+            dataclasses.asdict(ssm.Values(
+                {'/foo/bar/baz': values['/foo/bar/baz']},
+                {'/foo/bar/settings/': {
+                    'value1': values['/foo/bar/settings/value1']}})))
+
+    def test_fetch_nested_paths_once(self):
+        values = {
+            '/foo/bar/baz': str(uuid.uuid4()),
+            '/foo/bar/settings/value1': str(uuid.uuid4()),
+            '/foo/bar/settings/nested/value2': str(uuid.uuid4())
+        }
+        self.put_parameters(values)
+
+        engine = self.ssm._engine
+        with mock.patch.object(engine, '_call', wraps=engine._call) as call:
+            result = self.ssm.fetch(
+                ['/foo/bar/baz', '/foo/bar/settings/missing'],
+                ['/foo/bar/settings/', '/foo/bar/settings/nested/',
+                 '/foo/bar/'])
+        call.assert_called_once_with(
+            'get_parameters_by_path', Path='/foo/bar/', Recursive=True,
+            WithDecryption=True)
+        self.assertDictEqual(
+            dataclasses.asdict(result),
+            dataclasses.asdict(ssm.Values(
+                {'/foo/bar/baz': values['/foo/bar/baz']},
+                {'/foo/bar/': {
+                    'baz': values['/foo/bar/baz'],
+                    'settings/value1': values['/foo/bar/settings/value1'],
+                    'settings/nested/value2':
+                        values['/foo/bar/settings/nested/value2']},
+                 '/foo/bar/settings/': {
+                     'value1': values['/foo/bar/settings/value1'],
+                     'nested/value2':
+                         values['/foo/bar/settings/nested/value2']},
+                 '/foo/bar/settings/nested/': {
+                     'value2': values['/foo/bar/settings/nested/value2']}})))
+
+        # Later fetches under the fetched path are answered from the index
+        with mock.patch.object(self.ssm._engine, '_call') as call:
+            later = self.ssm.fetch(
+                ['/foo/bar/settings/value1'], ['/foo/bar/settings/nested'],
+                result.parameter_index)
+        call.assert_not_called()
+        self.assertDictEqual(
+            dataclasses.asdict(later),
+            dataclasses.asdict(ssm.Values(
+                {'/foo/bar/settings/value1':
+                    values['/foo/bar/settings/value1']},
+                {'/foo/bar/settings/nested': {
+                    '/value2': values['/foo/bar/settings/nested/value2']}})))
+
+    def test_fetch_concurrently(self):
+        values = {f'/foo/bar/key{offset:02}': str(uuid.uuid4())
+                  for offset in range(25)}
+        values.update({f'/foo/bar/path{offset}/value': str(uuid.uuid4())
+                       for offset in range(3)})
+        self.put_parameters(values)
+
+        names = [f'/foo/bar/key{offset:02}' for offset in range(25)]
+        paths = [f'/foo/bar/path{offset}/' for offset in range(3)]
+        parameter_store = ssm.ParameterStore(
+            endpoint_url=os.environ['SSM_ENDPOINT_URL'], max_concurrency=4)
+        result = parameter_store.fetch(names, paths)
+
+        self.assertDictEqual(
+            dataclasses.asdict(result),
+            dataclasses.asdict(self.ssm.fetch(names, paths)))
+        self.assertListEqual(list(result.parameters.keys()), names)
+        self.assertListEqual(list(result.parameters_by_path.keys()), paths)
+
+    def test_fetch_retries_throttling(self):
+        self.put_parameter('/foo/bar/baz', 'qux')
+        throttled = exceptions.ClientError(
+            error_response={'Error': {'Code': 'ThrottlingException'}},
+            operation_name='GetParameters')
+        client = self.ssm._engine._get_client()
+        responses = [throttled, {'Parameters': [
+            {'Name': '/foo/bar/baz', 'Type': 'String', 'Value': 'qux'}]}]
+        with mock.patch('asyncio.sleep'), mock.patch.object(
+                client, 'get_parameters', side_effect=responses):
+            result = self.ssm.fetch(['/foo/bar/baz'], [])
+        self.assertDictEqual(result.parameters, {'/foo/bar/baz': 'qux'})
+        self.assertEqual(self.ssm.retries, 1)
+
+    def test_fetch_retries_server_and_connection_errors(self):
+        unavailable = exceptions.ClientError(
+            error_response={'Error': {'Code': 'InternalServerError'},
+                            'ResponseMetadata': {'HTTPStatusCode': 500}},
+            operation_name='GetParameters')
+        disconnected = exceptions.EndpointConnectionError(
+            endpoint_url=os.environ['SSM_ENDPOINT_URL'])
+        client = self.ssm._engine._get_client()
+        responses = [unavailable, disconnected, {'Parameters': [
+            {'Name': '/foo/bar/baz', 'Type': 'String', 'Value': 'qux'}]}]
+        with mock.patch('asyncio.sleep'), mock.patch.object(
+                client, 'get_parameters', side_effect=responses):
+            result = self.ssm.fetch(['/foo/bar/baz'], [])
+        self.assertDictEqual(result.parameters, {'/foo/bar/baz': 'qux'})
+        self.assertEqual(self.ssm.retries, 2)
+
+    def test_fetch_does_not_retry_client_errors(self):
+        denied = exceptions.ClientError(
+            error_response={'Error': {'Code': 'AccessDeniedException'},
+                            'ResponseMetadata': {'HTTPStatusCode': 400}},
+            operation_name='GetParameters')
+        client = self.ssm._engine._get_client()
+        with mock.patch.object(client, 'get_parameters',
+                               side_effect=denied) as get_parameters:
+            with self.assertRaises(ssm.SSMClientException):
+                self.ssm.fetch(['/foo/bar/baz'], [])
+        self.assertEqual(get_parameters.call_count, 1)
+        self.assertEqual(self.ssm.retries, 0)
+
+    def test_client_config(self):
+        parameter_store = ssm.ParameterStore(
+            endpoint_url=os.environ['SSM_ENDPOINT_URL'], max_concurrency=25,
+            client_config={'connect_timeout': 5})
+        client_config = parameter_store._engine._botocore_config()
+        self.assertEqual(client_config.max_pool_connections, 25)
+        self.assertTrue(client_config.tcp_keepalive)
+        self.assertEqual(client_config.connect_timeout, 5)
+        self.assertEqual(
+            client_config.retries, {'total_max_attempts': 1})
+
+    def test_client_timeouts(self):
+        parameter_store = ssm.ParameterStore(
+            endpoint_url=os.environ['SSM_ENDPOINT_URL'],
+            connect_timeout=2, read_timeout=3)
+        client_config = parameter_store._engine._botocore_config()
+        self.assertEqual(client_config.connect_timeout, 2)
+        self.assertEqual(client_config.read_timeout, 3)
+
+    def test_fetch_deadline(self):
+        async def call(*_args, **_kwargs):
+            await asyncio.sleep(5)
+
+        with mock.patch.object(self.ssm._engine, '_call', side_effect=call):
+            with self.assertRaises(ssm.DeadlineExceeded):
+                self.ssm.fetch(['/foo/bar/baz'], ['/foo/bar/'], timeout=0.05)
+
+    def test_fetch_deadline_does_not_wait_for_boto3_calls(self):
+        daemon = []
+
+        def get_parameters(**_kwargs):
+            daemon.append(threading.current_thread().daemon)
+            time.sleep(1)
+
+        parameter_store = ssm.ParameterStore(
+            endpoint_url=os.environ['SSM_ENDPOINT_URL'], transport='boto3')
+        client = parameter_store._engine._get_client()
+        with mock.patch.object(client, 'get_parameters', get_parameters):
+            start = time.monotonic()
+            with self.assertRaises(ssm.DeadlineExceeded):
+                parameter_store.fetch(['/foo/bar/baz'], [], timeout=0.1)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(daemon, [True])
+
+    def test_fetch_from_cache(self):
+        self.put_parameters({'/foo/bar/baz': 'qux',
+                             '/foo/bar/settings/value1': 'value'})
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = pathlib.Path(temp_dir) / 'cache.json'
+            names, paths = ['/foo/bar/baz', '/foo/bar/missing'], \
+                ['/foo/bar/settings/']
+            parameter_store = ssm.ParameterStore(
+                endpoint_url=os.environ['SSM_ENDPOINT_URL'],
+                parameter_cache=cache.ParameterCache(path),
+                transport=self.TRANSPORT)
+            expectation = parameter_store.fetch(names, paths)
+
+            parameter_store = ssm.ParameterStore(
+                endpoint_url=os.environ['SSM_ENDPOINT_URL'],
+                parameter_cache=cache.ParameterCache(path),
+                transport=self.TRANSPORT)
+            with mock.patch.object(parameter_store._engine, '_call') as call:
+                result = parameter_store.fetch(names, paths)
+            call.assert_not_called()
+            self.assertIsNone(parameter_store._engine._client)
+
+        self.assertDictEqual(
+            dataclasses.asdict(result), dataclasses.asdict(expectation))
+
+    def test_cache_hits_do_not_extend_expiry(self):
+        self.put_parameters({'/foo/bar/baz': 'qux',
+                             '/foo/bar/settings/value1': 'value'})
+        names, paths = ['/foo/bar/baz'], ['/foo/bar/settings/']
+        with tempfile.TemporaryDirectory() as temp_dir:
+            parameter_store = ssm.ParameterStore(
+                endpoint_url=os.environ['SSM_ENDPOINT_URL'],
+                parameter_cache=cache.ParameterCache(
+                    pathlib.Path(temp_dir) / 'cache.json', ttl=60),
+                transport=self.TRANSPORT)
+            now = time.time()
+            with mock.patch.object(cache.time, 'time', return_value=now):
+                parameter_store.fetch(names, paths)
+            for name in ['/foo/bar/baz', '/foo/bar/settings/value1']:
+                self.client.put_parameter(
+                    Name=name, Value='changed', Type='String',
+                    Overwrite=True)
+            with mock.patch.object(cache.time, 'time',
+                                   return_value=now + 40):
+                result = parameter_store.fetch(names, paths)
+            self.assertEqual(result.parameters['/foo/bar/baz'], 'qux')
+            with mock.patch.object(cache.time, 'time',
+                                   return_value=now + 80):
+                result = parameter_store.fetch(names, paths)
+        self.assertEqual(result.parameters['/foo/bar/baz'], 'changed')
+        self.assertDictEqual(result.parameters_by_path['/foo/bar/settings/'],
+                             {'value1': 'changed'})
+
+    def test_fetch_incremental(self):
+        self.put_parameters({'/foo/bar/baz': 'qux',
+                             '/foo/bar/settings/value1': 'value1',
+                             '/foo/bar/settings/value2': 'value2',
+                             '/foo/bar/settings/value3': 'value3'})
+        names, paths = ['/foo/bar/baz', '/foo/bar/missing'], \
+            ['/foo/bar/settings/']
+        with tempfile.TemporaryDirectory() as temp_dir:
+            parameter_cache = cache.ParameterCache(
+                pathlib.Path(temp_dir) / 'cache.json', ttl=0,
+                keep_expired=True)
+            parameter_store = ssm.ParameterStore(
+                endpoint_url=os.environ['SSM_ENDPOINT_URL'],
+                parameter_cache=parameter_cache, incremental=True,
+                transport=self.TRANSPORT)
+            parameter_store.fetch(names, paths)
+
+            self.client.put_parameter(
+                Name='/foo/bar/settings/value2', Value='changed',
+                Type='String', Overwrite=True)
+            with mock.patch.object(
+                    parameter_store._engine, '_call',
+                    wraps=parameter_store._engine._call) as call:
+                result = parameter_store.fetch(names, paths)
+
+        self.assertListEqual(
+            [args[0] for args, _kwargs in call.call_args_list],
+            ['describe_parameters', 'describe_parameters',
+             'get_parameters'])
+        call.assert_called_with(
+            'get_parameters', Names=['/foo/bar/settings/value2'],
+            WithDecryption=True)
+        self.assertDictEqual(
+            dataclasses.asdict(result),
+            dataclasses.asdict(ssm.Values(
+                {'/foo/bar/baz': 'qux'},
+                {'/foo/bar/settings/': {'value1': 'value1',
+                                        'value2': 'changed',
+                                        'value3': 'value3'}})))
+
+    def test_fetch_async(self):
+        values = {f'/foo/bar/key{offset:02}': str(uuid.uuid4())
+                  for offset in range(25)}
+        values.update({f'/foo/bar/path{offset}/value': str(uuid.uuid4())
+                       for offset in range(3)})
+        self.put_parameters(values)
+        engine = ssm.AsyncParameterStore(
+            endpoint_url=os.environ['SSM_ENDPOINT_URL'], max_concurrency=4,
+            transport=self.TRANSPORT)
+        self.addCleanup(engine.close)
+
+        async def fetch():
+            return await asyncio.gather(
+                engine.fetch_variables(discovery.Variables(
+                    {f'key{offset:02}' for offset in range(25)}, set()),
+                    '/foo/bar', False),
+                engine.fetch([], [f'/foo/bar/path{offset}/'
+                                  for offset in range(3)]))
+
+        variables, paths = asyncio.run(fetch())
+        self.assertDictEqual(
+            variables.parameters,
+            {name[len('/foo/bar/'):]: value
+             for name, value in values.items() if 'key' in name})
+        self.assertDictEqual(
+            paths.parameters_by_path,
+            {f'/foo/bar/path{offset}/': {
+                'value': values[f'/foo/bar/path{offset}/value']}
+             for offset in range(3)})
+
+
+class HTTPTransportTestCase(ParameterStoreTestCase):
+    TRANSPORT = 'http'
+
+    def test_dropped_connections_raise_ssm_client_exception(self):
+        server = socket.create_server(('127.0.0.1', 0))
+        self.addCleanup(server.close)
+
+        def accept():
+            while True:
+                try:
+                    connection, _address = server.accept()
+                except OSError:
+                    return
+                connection.close()
+
+        threading.Thread(target=accept, daemon=True).start()
+        parameter_store = ssm.ParameterStore(
+            endpoint_url=f'http://127.0.0.1:{server.getsockname()[1]}',
+            max_retries=1, transport=self.TRANSPORT)
+        with mock.patch('asyncio.sleep'):
+            with self.assertRaises(ssm.SSMClientException):
+                parameter_store.fetch(['/foo/bar/baz'], [])
+        self.assertEqual(parameter_store.retries, 1)
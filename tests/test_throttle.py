@@ -0,0 +1,88 @@
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+from ssm_ps_template import throttle
+
+
+class ThrottleError(Exception):
+    pass
+
+
+class TransientError(Exception):
+    pass
+
+
+class TokenBucketTestCase(unittest.TestCase):
+
+    def test_unlimited_does_not_wait(self):
+        bucket = throttle.TokenBucket()
+
+        async def acquire():
+            for _offset in range(1000):
+                await bucket.acquire_async()
+
+        start = time.monotonic()
+        asyncio.run(acquire())
+        self.assertLess(time.monotonic() - start, 0.1)
+
+    def test_rate_is_limited(self):
+        bucket = throttle.TokenBucket(20)
+
+        async def acquire():
+            for _offset in range(25):
+                await bucket.acquire_async()
+
+        start = time.monotonic()
+        asyncio.run(acquire())
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+
+class RateControllerTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.controller = throttle.RateController(
+            100, 2, lambda err: isinstance(err, ThrottleError),
+            lambda err: isinstance(err, TransientError))
+        patcher = mock.patch('asyncio.sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def call(self, method: mock.AsyncMock, **kwargs):
+        return asyncio.run(self.controller.call_async(method, **kwargs))
+
+    def test_retries_throttled_calls(self):
+        method = mock.AsyncMock(side_effect=[ThrottleError(), 'result'])
+        self.assertEqual(self.call(method, foo='bar'), 'result')
+        self.sleep.assert_awaited_once()
+        method.assert_awaited_with(foo='bar')
+        self.assertEqual(self.controller.calls, 2)
+        self.assertEqual(self.controller.retries, 1)
+
+    def test_rate_is_decreased_and_recovers(self):
+        self.call(mock.AsyncMock(side_effect=[ThrottleError(), 'result']))
+        self.assertEqual(self.controller.bucket.rate, 50.5)
+        with mock.patch.object(self.controller.bucket, 'acquire_async'):
+            for _offset in range(200):
+                self.call(mock.AsyncMock())
+        self.assertEqual(self.controller.bucket.rate, 100)
+
+    def test_raises_when_retries_are_exhausted(self):
+        method = mock.AsyncMock(side_effect=ThrottleError())
+        with self.assertRaises(ThrottleError):
+            self.call(method)
+        self.assertEqual(method.await_count, 3)
+
+    def test_retries_transient_errors_without_reducing_rate(self):
+        method = mock.AsyncMock(side_effect=[TransientError(), 'result'])
+        self.assertEqual(self.call(method), 'result')
+        self.assertEqual(self.controller.retries, 1)
+        self.assertEqual(self.controller.bucket.rate, 100)
+
+    def test_does_not_retry_other_errors(self):
+        method = mock.AsyncMock(side_effect=ValueError())
+        with self.assertRaises(ValueError):
+            self.call(method)
+        self.assertEqual(self.controller.retries, 0)
@@ -0,0 +1,134 @@
+import asyncio
+import datetime
+import json
+import os
+from unittest import mock
+
+from botocore import auth, awsrequest, credentials, exceptions
+
+from ssm_ps_template import transport
+from tests import utils
+
+
+class ClientTestCase(utils.ParameterStoreTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.transport = transport.Client(
+            region='us-east-1', endpoint_url=os.environ['SSM_ENDPOINT_URL'])
+
+    def test_signature_matches_botocore(self):
+        now = datetime.datetime(
+            2021, 5, 1, 12, 30, tzinfo=datetime.timezone.utc)
+        body = json.dumps({'Names': ['/foo/bar']}).encode('utf-8')
+        headers = self.transport.sign(
+            transport.Credentials('AKID', 'secret', 'token'),
+            'GetParameters', body, now)
+
+        request = awsrequest.AWSRequest(
+            method='POST', url=os.environ['SSM_ENDPOINT_URL'] + '/',
+            data=body, headers={
+                'Content-Type': headers['Content-Type'],
+                'X-Amz-Target': headers['X-Amz-Target']})
+        signer = auth.SigV4Auth(
+            credentials.Credentials('AKID', 'secret', 'token'),
+            'ssm', 'us-east-1')
+        with mock.patch('botocore.auth.get_current_datetime',
+                        return_value=now.replace(tzinfo=None)):
+            signer.add_auth(request)
+        self.assertEqual(
+            headers['Authorization'], request.headers['Authorization'])
+
+    def test_credentials_from_environment(self):
+        with mock.patch.dict(os.environ, {'AWS_ACCESS_KEY_ID': 'AKID',
+                                          'AWS_SECRET_ACCESS_KEY': 'secret',
+                                          'AWS_SESSION_TOKEN': ''}):
+            self.assertEqual(
+                self.transport._get_credentials(),
+                transport.Credentials('AKID', 'secret', None))
+
+
+class AsyncClientTestCase(utils.ParameterStoreTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.transport = transport.AsyncClient(
+            region='us-east-1', endpoint_url=os.environ['SSM_ENDPOINT_URL'])
+        self.addCleanup(self.transport.close)
+
+    def test_get_parameters(self):
+        self.put_parameters({'/foo/bar': 'baz'})
+
+        async def get_parameters():
+            return await asyncio.gather(*[
+                self.transport.get_parameters(
+                    Names=['/foo/bar', '/foo/missing'], WithDecryption=True)
+                for _offset in range(3)])
+
+        for response in asyncio.run(get_parameters()):
+            self.assertListEqual(
+                [(param['Name'], param['Value'])
+                 for param in response['Parameters']], [('/foo/bar', 'baz')])
+            self.assertListEqual(
+                response['InvalidParameters'], ['/foo/missing'])
+
+    def serve(self, response: bytes) -> dict:
+        """Send the request to a server that writes the response and
+        closes the connection
+
+        """
+        async def handle(reader, writer):
+            await reader.readuntil(b'\r\n\r\n')
+            writer.write(response)
+            await writer.drain()
+            writer.close()
+
+        async def request():
+            server = await asyncio.start_server(handle, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            client = transport.AsyncClient(
+                region='us-east-1', endpoint_url=f'http://127.0.0.1:{port}')
+            try:
+                return await client.get_parameters(Names=['/foo/bar'])
+            finally:
+                client.close()
+                server.close()
+
+        return asyncio.run(request())
+
+    def test_closed_connection_raises_connection_closed_error(self):
+        with self.assertRaises(exceptions.ConnectionClosedError):
+            self.serve(b'')
+
+    def test_malformed_response_raises_connection_closed_error(self):
+        with self.assertRaises(exceptions.ConnectionClosedError):
+            self.serve(b'garbage\r\n\r\n')
+
+    def test_read_chunked_response(self):
+        async def read():
+            reader = asyncio.StreamReader()
+            reader.feed_data(
+                b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+                b'3\r\n{"a\r\n5\r\n": 1}\r\n0\r\n\r\n')
+            return await transport._read_response(reader)
+
+        self.assertEqual(asyncio.run(read()), (200, b'{"a": 1}', True))
+
+    def test_read_response_closing_connection(self):
+        async def read():
+            reader = asyncio.StreamReader()
+            reader.feed_data(b'HTTP/1.1 400 Bad Request\r\n'
+                             b'Connection: close\r\n'
+                             b'Content-Length: 2\r\n\r\n{}')
+            return await transport._read_response(reader)
+
+        self.assertEqual(asyncio.run(read()), (400, b'{}', False))
+
+    def test_error_raises_client_error(self):
+        with self.assertRaises(exceptions.ClientError) as context:
+            asyncio.run(self.transport.get_parameters(
+                Names=[f'/foo/{offset}' for offset in range(11)]))
+        self.assertEqual(context.exception.operation_name, 'GetParameters')
+        self.assertEqual(
+            context.exception.response['Error']['Code'],
+            'ValidationException')
@@ -0,0 +1,131 @@
+import hashlib
+import os
+import pathlib
+import tempfile
+import unittest
+from unittest import mock
+
+from ssm_ps_template import writer
+
+
+class WriterTestCase(unittest.TestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.path = pathlib.Path(self.temp_dir.name) / 'output.txt'
+
+    def test_digest(self):
+        self.assertIsNone(writer.digest(self.path))
+        value = b'x' * (writer.CHUNK_SIZE * 2 + 1)
+        self.path.write_bytes(value)
+        self.assertEqual(
+            writer.digest(self.path), hashlib.sha256(value).hexdigest())
+
+    def test_write(self):
+        self.assertEqual(
+            writer.write(self.path, 'foo'), writer.Status.WRITTEN)
+        self.assertEqual(self.path.read_text(), 'foo')
+        self.assertEqual(
+            writer.write(self.path, 'bar'), writer.Status.WRITTEN)
+        self.assertEqual(self.path.read_text(), 'bar')
+
+    def test_write_reads_destination_once(self):
+        self.path.write_text('foo')
+        with mock.patch('ssm_ps_template.writer.digest',
+                        wraps=writer.digest) as digest:
+            writer.write(self.path, 'bar')
+        digest.assert_called_once_with(self.path)
+        self.assertEqual(self.path.read_text(), 'bar')
+
+    def test_write_skips_unchanged(self):
+        self.path.write_text('foo')
+        with mock.patch('os.replace') as replace:
+            self.assertEqual(
+                writer.write(self.path, 'foo'), writer.Status.UNCHANGED)
+        replace.assert_not_called()
+
+    def test_write_keeps_mode(self):
+        self.path.write_text('foo')
+        self.path.chmod(0o640)
+        writer.write(self.path, 'bar')
+        self.assertEqual(self.path.stat().st_mode & 0o7777, 0o640)
+
+    def test_write_failure_keeps_original(self):
+        self.path.write_text('foo')
+        with mock.patch('os.replace', side_effect=OSError('Mock Error')):
+            with self.assertRaises(OSError):
+                writer.write(self.path, 'bar')
+        self.assertEqual(self.path.read_text(), 'foo')
+        self.assertListEqual(os.listdir(self.temp_dir.name), ['output.txt'])
+
+    def test_write_sets_mode_before_replace(self):
+        modes = []
+
+        def replace(source, destination):
+            modes.append(os.stat(source).st_mode & 0o7777)
+            return os.rename(source, destination)
+
+        with mock.patch('os.replace', side_effect=replace):
+            writer.write(self.path, 'foo', mode=0o600)
+        self.assertListEqual(modes, [0o600])
+        self.assertEqual(self.path.stat().st_mode & 0o7777, 0o600)
+
+    def test_atomic_file_mode_set_before_writing(self):
+        self.path.write_text('foo')
+        self.path.chmod(0o640)
+        with writer.AtomicFile(self.path, mode=0o600) as handle:
+            self.assertEqual(
+                os.stat(handle._temp_path).st_mode & 0o7777, 0o600)
+            handle.write('secret')
+        with writer.AtomicFile(self.path) as handle:
+            # The replaced file's mode is kept before anything is written
+            self.assertEqual(
+                os.stat(handle._temp_path).st_mode & 0o7777, 0o600)
+            handle.write('bar')
+
+    def test_write_durability(self):
+        with mock.patch('os.fsync') as fsync:
+            writer.write(self.path, 'foo')
+            fsync.assert_not_called()
+            writer.write(self.path, 'bar', durability=writer.Durability.FILE)
+            fsync.assert_called_once()
+        self.assertEqual(self.path.read_text(), 'bar')
+
+    def test_sync_directories(self):
+        directory = pathlib.Path(self.temp_dir.name)
+        with mock.patch('os.fsync') as fsync:
+            writer.sync_directories([directory, directory])
+        fsync.assert_called_once()
+
+    def test_atomic_file(self):
+        self.path.write_text('foo')
+        with writer.AtomicFile(self.path) as handle:
+            handle.write('discarded')
+            handle.reset()
+            for chunk in ['b', 'a', 'r']:
+                handle.write(chunk)
+            self.assertEqual(self.path.read_text(), 'foo')
+        self.assertEqual(handle.status, writer.Status.WRITTEN)
+        self.assertEqual(self.path.read_text(), 'bar')
+        self.assertListEqual(os.listdir(self.temp_dir.name), ['output.txt'])
+
+    def test_atomic_file_unchanged(self):
+        self.path.write_text('foo')
+        with mock.patch('os.replace') as replace:
+            with writer.AtomicFile(self.path) as handle:
+                handle.write('foo')
+        replace.assert_not_called()
+        self.assertEqual(handle.status, writer.Status.UNCHANGED)
+        self.assertListEqual(os.listdir(self.temp_dir.name), ['output.txt'])
+
+    def test_atomic_file_error(self):
+        self.path.write_text('foo')
+        with self.assertRaises(ValueError):
+            with writer.AtomicFile(self.path) as handle:
+                handle.write('bar')
+                raise ValueError('Mock Error')
+        self.assertIsNone(handle.status)
+        self.assertEqual(self.path.read_text(), 'foo')
+        self.assertListEqual(os.listdir(self.temp_dir.name), ['output.txt'])